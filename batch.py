@@ -0,0 +1,242 @@
+"""Answer a file of questions without the UI.
+
+    python batch.py questions.jsonl --out answers.jsonl --workers 4 --rate 2
+    python batch.py faq.csv --out faq_answers.jsonl --config oceansafe.toml
+
+Input is JSONL (one object per line) or CSV with a header row. Each
+record needs a "question" and may carry an "id" and a "namespace". Without
+an id, the 1-based row number is used, so keep the input unchanged
+between resumed runs.
+
+Questions run in a pool of worker processes, each with its own
+RagPipeline. The parent hands them out no faster than --rate per second
+across the whole pool. Results are appended to --out as they finish, one
+JSON line each, with the answer, latency, per-stage seconds, tokens,
+retrieval path and the ids of the retrieved and packed chunks. Running
+the same command again skips ids that already have an answer in --out.
+Failed questions are written with an "error" and retried on the next run,
+so readers should take the last line per id.
+
+Settings (OPENAI_API_KEY, PINECONE_API_KEY, INDEX_HOST, LOCAL_INDEX_PATH,
+CONTEXT_TOKEN_BUDGET, ...) come from the environment, or from the TOML
+file named by --config / $OCEANSAFE_CONFIG; .streamlit/secrets.toml works.
+Environment variables win over the file.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from config import CONFIG_ENV, load_config
+
+QUEUE_PER_WORKER = 2
+PROGRESS_EVERY = 25
+
+
+# ---------------------------
+# Input and resume
+# ---------------------------
+def read_questions(path):
+    """(id, question, namespace or None) for every record in a JSONL or CSV file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for n, row in enumerate(rows, 1):
+            question = (row.get("question") or "").strip()
+            if question:
+                yield str(row.get("id") or n), question, row.get("namespace") or None
+
+
+def answered_ids(path):
+    """Ids with a successful result in an existing output file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by an interrupted run
+            if "error" not in record:
+                done.add(record["id"])
+    return done
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class RateLimiter:
+    """At most `rate` acquisitions per second, evenly spaced; 0 means no limit."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+# ---------------------------
+# Worker processes
+# ---------------------------
+_pipeline = None
+_init_error = None
+
+
+class WorkerSetupError(RuntimeError):
+    pass
+
+
+def _init_worker(config_path, answer_cache):
+    global _pipeline, _init_error
+    # an initializer that raises only shows up as BrokenProcessPool in the
+    # parent, so keep the cause and raise it from answer_one instead
+    try:
+        load_config(config_path)
+        import rag
+
+        _pipeline = rag.RagPipeline(answer_cache=rag.answer_cache if answer_cache else None)
+    except Exception as exc:
+        _init_error = f"{type(exc).__name__}: {exc}"
+
+
+def _estimate_tokens(pipeline, question, context, answer):
+    from context import count_tokens
+
+    prompt = pipeline.prompt.format(context=context, question=question)
+    return {"prompt": count_tokens(prompt, pipeline.model), "completion": count_tokens(answer, pipeline.model),
+            "estimated": True}
+
+
+def answer_one(qid, question, namespace):
+    if _init_error is not None:
+        raise WorkerSetupError(_init_error)
+    trace = {}
+    start = time.perf_counter()
+    record = {"id": qid, "question": question, "namespace": namespace or _pipeline.namespace}
+    try:
+        answer, context = _pipeline.respond(question, trace=trace, namespace=namespace)
+    except Exception as exc:
+        record["error"] = f"{type(exc).__name__}: {exc}"
+        record["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return record
+    record.update({
+        "answer": answer,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+        "cached": trace.get("cached", False),
+        "retrieval_path": trace.get("retrieval_path"),
+        "retrieval_ids": trace.get("retrieval_ids", []),
+        "context_ids": trace.get("context_ids", []),
+        "context_tokens": trace.get("context_tokens"),
+        "tokens": trace.get("tokens") or _estimate_tokens(_pipeline, question, context, answer),
+        "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in trace.get("stages", {}).items()},
+    })
+    return record
+
+
+# ---------------------------
+# Driver
+# ---------------------------
+def run(questions, out_path, workers=4, rate=0.0, config_path=None, answer_cache=False, log=sys.stderr):
+    """Answer `questions` ((id, question, namespace) tuples) into out_path; returns a summary dict."""
+    done = answered_ids(out_path)
+    todo = [q for q in questions if q[0] not in done]
+    summary = {"skipped": len(done), "answered": 0, "errors": 0, "seconds": 0.0}
+    if not todo:
+        return summary
+    limiter = RateLimiter(rate)
+    latencies = []
+    start = time.perf_counter()
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                               initializer=_init_worker, initargs=(config_path, answer_cache))
+    pending = set()
+    try:
+        with open(out_path, "a", encoding="utf-8") as out:
+            if out.tell() and not _ends_with_newline(out_path):
+                out.write("\n")  # finish a line cut short by an interrupted run
+            remaining = iter(todo)
+            exhausted = False
+            while pending or not exhausted:
+                # keep a couple of questions queued per worker, paced by the rate limit
+                while not exhausted and len(pending) < workers * QUEUE_PER_WORKER:
+                    item = next(remaining, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    limiter.acquire()
+                    pending.add(pool.submit(answer_one, *item))
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record = future.result()
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    if "error" in record:
+                        summary["errors"] += 1
+                    else:
+                        summary["answered"] += 1
+                        latencies.append(record["latency_ms"])
+                    count = summary["answered"] + summary["errors"]
+                    if count % PROGRESS_EVERY == 0 or count == len(todo):
+                        elapsed = time.perf_counter() - start
+                        print(f"{count}/{len(todo)} done, {summary['errors']} errors, "
+                              f"{count / elapsed:.1f} q/s", file=log, flush=True)
+    except KeyboardInterrupt:
+        print("interrupted; re-run the same command to resume", file=log)
+        raise
+    except WorkerSetupError as exc:
+        settings = config_path or os.environ.get(CONFIG_ENV) or "the environment"
+        raise SystemExit(f"workers could not build the RAG pipeline ({exc}); check the settings in {settings}") from None
+    except BrokenProcessPool:
+        raise SystemExit("a worker process died (out of memory or killed?); "
+                         "re-run the same command to resume") from None
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        summary["seconds"] = round(time.perf_counter() - start, 2)
+    if latencies:
+        latencies.sort()
+        summary["p50_ms"] = latencies[len(latencies) // 2]
+        summary["p99_ms"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL/CSV file of questions with the RAG pipeline")
+    parser.add_argument("input", help="questions as .jsonl or .csv (a 'question' field, optional 'id' and 'namespace')")
+    parser.add_argument("--out", required=True, help="JSONL results, appended to and used to resume")
+    parser.add_argument("--workers", type=int, default=4, help="worker processes")
+    parser.add_argument("--rate", type=float, default=0.0, help="max questions started per second (0 = no limit)")
+    parser.add_argument("--config", help="TOML settings file (default $OCEANSAFE_CONFIG)")
+    parser.add_argument("--namespace", help="namespace for records that don't name one")
+    parser.add_argument("--answer-cache", action="store_true", help="reuse answers to near-identical questions")
+    args = parser.parse_args()
+
+    load_config(args.config)
+    questions = [(qid, q, ns or args.namespace) for qid, q, ns in read_questions(args.input)]
+    summary = run(questions, args.out, workers=args.workers, rate=args.rate, config_path=args.config,
+                  answer_cache=args.answer_cache)
+    print(json.dumps({"questions": len(questions), **summary}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""A burst of near-identical Tidebot questions, with and without admission control.
+
+--sessions threads each ask one of --questions questions at the same
+moment, the way sessions pile in when a closure or shark sighting makes
+the news. The fake embeddings and chat model sit behind an Upstream that
+answers 429 past --upstream-limit concurrent calls and on every
+--rate-limit-every-th call. Two configurations run on the same burst:
+
+- baseline: every session makes its own calls, no queue, no retries
+- scheduled: single-flight coalescing plus AdmissionScheduler
+
+Reported per configuration: upstream calls and 429s, peak upstream
+concurrency, failed turns and turn latency p50/p99.
+
+    python benchmarks/bench_burst.py --sessions 64 --questions 4
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import (  # noqa: E402
+    FakeOpenAIClient, FakeStreamingChatModel, Upstream, build_local_index, synthetic_questions,
+)
+
+
+def run_burst(pipeline, questions, sessions):
+    barrier = threading.Barrier(sessions)
+    latencies, failures = [None] * sessions, []
+
+    def session(i):
+        barrier.wait()
+        start = time.perf_counter()
+        try:
+            for _ in pipeline.stream_respond(questions[i % len(questions)]):
+                pass
+            latencies[i] = time.perf_counter() - start
+        except Exception as exc:
+            failures.append(type(exc).__name__)
+
+    threads = [threading.Thread(target=session, args=(i,), name=f"session-{i}") for i in range(sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    done = np.array([x for x in latencies if x is not None])
+    return {
+        "turns_ok": len(done),
+        "turns_failed": len(failures),
+        "p50_ms": round(float(np.percentile(done, 50)) * 1000, 1) if len(done) else None,
+        "p99_ms": round(float(np.percentile(done, 99)) * 1000, 1) if len(done) else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Burst load against the RAG pipeline with fake upstreams")
+    parser.add_argument("--sessions", type=int, default=64)
+    parser.add_argument("--questions", type=int, default=4, help="distinct questions in the burst")
+    parser.add_argument("--cap", type=int, default=8, help="scheduler chat concurrency cap")
+    parser.add_argument("--upstream-limit", type=int, default=12, help="fake upstream 429s past this many concurrent calls")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="also 429 every N-th upstream call")
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="oceansafe-burst-")
+    os.environ["OCEANSAFE_CACHE_DIR"] = os.path.join(workdir, "cache")
+    import rag
+    from retrieval import LocalVectorIndex
+    from scheduler import AdmissionScheduler, SingleFlight
+
+    backend = LocalVectorIndex(build_local_index(os.path.join(workdir, "index"), count=2000))
+    questions = synthetic_questions(args.questions)
+    report = {}
+    for name in ("baseline", "scheduled"):
+        chat = Upstream(args.rate_limit_every, args.upstream_limit)
+        embed = Upstream(args.rate_limit_every, args.upstream_limit)
+        scheduled = name == "scheduled"
+        pipeline = rag.RagPipeline(
+            client=FakeOpenAIClient(latency=args.embed_latency, upstream=embed),
+            backend=backend,
+            llm=FakeStreamingChatModel(ttft=args.ttft, token_latency=args.token_latency, upstream=chat),
+            embedding_cache=None,
+            answer_cache=None,
+            lexical=None,
+            flights=SingleFlight(name) if scheduled else None,
+            chat_scheduler=AdmissionScheduler(args.cap, max_queue=args.sessions, backoff=0.05, name="chat")
+            if scheduled else None,
+            embed_scheduler=AdmissionScheduler(args.cap, max_queue=args.sessions, backoff=0.05, name="embed")
+            if scheduled else None,
+        )
+        start = time.perf_counter()
+        result = run_burst(pipeline, questions, args.sessions)
+        result["wall_s"] = round(time.perf_counter() - start, 3)
+        result["chat_upstream"] = chat.stats()
+        result["embed_upstream"] = embed.stats()
+        if scheduled:
+            result["chat_scheduler"] = pipeline.chat_scheduler.stats()
+        report[name] = result
+    print(json.dumps({"params": vars(args), "results": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Per-interaction script time on the beach dashboard, full page vs fragment.
+
+Each interaction is replayed through Streamlit's AppTest against the local
+NOAA/OpenWeather fixture server. AppTest always reruns the whole script,
+so the two sides are compared by the time spent inside the page's
+sections, from their dashboard_* spans:
+
+- page_ms: every section's body, which is what each interaction reran
+  before the page was split into fragments
+- fragment_ms: the body of the one fragment the interaction reruns now
+
+Both leave out AppTest's own overhead and the few widgets outside the
+sections. run_ms, the wall time of the whole AppTest run, is reported for
+reference. Changing the beach still reruns the whole page, so its page_ms
+and fragment_ms match.
+The conditions snapshot is published first unless --no-snapshot is given,
+in which case weather and tides come from the (cleared) caches each run.
+
+    python benchmarks/bench_interactions.py --runs 10 --upstream-latency 0.2
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FixtureServer  # noqa: E402
+
+DASHBOARD = os.path.join(ROOT, "pages", "🌊_beach_dashboard.py")
+SECRETS = ("OPENAI_API_KEY", "PINECONE_API_KEY", "INDEX_HOST", "OPENWEATHER_API_KEY", "MAPBOX_TOKEN")
+
+
+def _submit_button(at):
+    return next(b for b in at.button if b.label == "Submit report")
+
+
+def toggle_directions(at, i):
+    checkbox = at.checkbox(key="directions_toggle")
+    (checkbox.uncheck() if checkbox.value else checkbox.check()).run()
+
+
+def submit_hazard(at, i):
+    at.text_input[0].input(f"Jellyfish {i}")
+    _submit_button(at).click().run()
+
+
+def weather_refresh(at, i):
+    # what the run_every timer triggers; AppTest can't fire it, so rerun as is
+    at.run()
+
+
+def select_beach(at, i):
+    selectbox = at.selectbox(key="selected_beach")
+    selectbox.select(selectbox.options[(i + 1) % len(selectbox.options)]).run()
+
+
+# interaction -> (replay, stage of the fragment it reruns; None = whole page)
+INTERACTIONS = {
+    "toggle_directions": (toggle_directions, "dashboard_map"),
+    "submit_hazard": (submit_hazard, "dashboard_map"),
+    "weather_refresh": (weather_refresh, "dashboard_weather"),
+    "select_beach": (select_beach, None),
+}
+
+
+def measure(at, interaction, runs, clear_caches):
+    import conditions
+    import metrics
+
+    replay, stage = INTERACTIONS[interaction]
+    run, page, fragment = [], [], []
+    for i in range(runs):
+        if clear_caches:
+            conditions.weather_cache.clear()
+            conditions.tide_cache.clear()
+        metrics.registry.clear()
+        start = time.perf_counter()
+        replay(at, i)
+        elapsed = time.perf_counter() - start
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+        sections = {
+            dict(labels)["stage"]: summary["sum"]
+            for labels, summary in metrics.registry.summaries("stage_seconds").items()
+            if dict(labels).get("stage", "").startswith("dashboard_")
+        }
+        run.append(elapsed)
+        page.append(sum(sections.values()))
+        fragment.append(page[-1] if stage is None else sections[stage])
+    result = {"interaction": interaction, "reruns": stage or "page"}
+    for name, samples in (("run", run), ("page", page), ("fragment", fragment)):
+        samples = np.array(samples) * 1000
+        result[f"{name}_p50_ms"] = round(float(np.percentile(samples, 50)), 2)
+        result[f"{name}_p99_ms"] = round(float(np.percentile(samples, 99)), 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-interaction script time on the beach dashboard")
+    parser.add_argument("--runs", type=int, default=10, help="replays per interaction")
+    parser.add_argument("--upstream-latency", type=float, default=0.0, help="fixture server delay per request")
+    parser.add_argument("--no-snapshot", action="store_true", help="fetch through the caches instead of a snapshot")
+    parser.add_argument("--only", help="comma-separated subset of: " + ",".join(INTERACTIONS))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="oceansafe-interactions-")
+    server = FixtureServer(latency=args.upstream_latency)
+    os.environ.update({
+        "OCEANSAFE_CACHE_DIR": os.path.join(workdir, "cache"),
+        "HAZARD_DB": os.path.join(workdir, "hazards.sqlite3"),
+        "OPENWEATHER_URL": f"{server.url}/weather",
+        "NOAA_URL": f"{server.url}/datagetter",
+        "TIDE_SOURCE": "noaa",
+        "OCEANSAFE_METRICS": "1",
+        "PREFETCH_IN_APP": "0",
+    })
+    for key in SECRETS:
+        os.environ.setdefault(key, "bench-placeholder")
+    os.chdir(ROOT)
+    from streamlit.testing.v1 import AppTest
+
+    interactions = args.only.split(",") if args.only else list(INTERACTIONS)
+    results = []
+    with server:
+        if not args.no_snapshot:
+            import prefetch
+            from catalog import load_catalog
+
+            prefetch.refresh(load_catalog().beaches)
+        at = AppTest.from_file(DASHBOARD, default_timeout=120)
+        for key in SECRETS:
+            at.secrets[key] = "bench-placeholder"
+        at.run()  # first run pays one-off imports and the catalog load
+        for interaction in interactions:
+            results.append(measure(at, interaction, args.runs, clear_caches=args.no_snapshot))
+        upstream_hits = server.hits
+    print(json.dumps({"params": vars(args), "upstream_hits": upstream_hits, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Per-call overhead of RagPipeline.respond, before and after sharing clients.
+
+Both variants run RagPipeline.respond through the real OpenAI and
+ChatOpenAI clients, pointed at a local stub of the embeddings and chat
+completions endpoints, and the same LocalVectorIndex of synthetic chunks:
+
+- before: every question gets a new pipeline with its own OpenAI client
+  and ChatOpenAI model, each with its own HTTP connection pool, the way
+  rag.py built its clients and chain per call before RagPipeline
+- after: one pipeline built the way the app builds it, with both clients
+  on the shared keep-alive transport (rag.get_http_client)
+
+The stub answers at once, so the numbers are client setup + connection
+cost without model latency. The connections opened on the stub during
+the measured calls are reported next to the latencies; the shared
+pipeline opens its own in a warm-up call first.
+
+    python benchmarks/bench_pipeline.py --calls 200
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import HashEmbeddings, build_local_index, synthetic_questions  # noqa: E402
+
+COMPLETION = json.dumps({
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o-mini",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "Swim near a lifeguard."}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 20, "completion_tokens": 5, "total_tokens": 25},
+}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """/v1/embeddings (hash embeddings) and /v1/chat/completions (a fixed answer)."""
+
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    embedder = HashEmbeddings()
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        StubHandler.connections += 1
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.endswith("/embeddings"):
+            texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+            body = json.dumps({
+                "object": "list",
+                "model": request.get("model"),
+                "data": [{"object": "embedding", "index": i, "embedding": self.embedder.embed(text)}
+                         for i, text in enumerate(texts)],
+                "usage": {"prompt_tokens": 8 * len(texts), "total_tokens": 8 * len(texts)},
+            }).encode()
+        else:
+            body = COMPLETION
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(fn, questions):
+    StubHandler.connections = 0
+    samples = []
+    for question in questions:
+        start = time.perf_counter()
+        fn(question)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.mean(samples), 3),
+        "p50_ms": round(samples[len(samples) // 2], 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+        "connections": StubHandler.connections,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=2000, help="synthetic chunks in the local index")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    workdir = tempfile.mkdtemp(prefix="oceansafe-pipeline-")
+    # set before rag is imported; OPENAI_BASE_URL is read by openai, OPENAI_API_BASE by ChatOpenAI
+    os.environ.update({
+        "OCEANSAFE_CACHE_DIR": os.path.join(workdir, "cache"),
+        "HYBRID_SEARCH": "0",
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_BASE": base_url,
+    })
+    import openai
+    from langchain_openai import ChatOpenAI
+
+    import rag
+    from retrieval import LocalVectorIndex
+
+    backend = LocalVectorIndex(build_local_index(os.path.join(workdir, "index"), count=args.chunks))
+    questions = synthetic_questions(args.calls)
+
+    def before(question):
+        pipeline = rag.RagPipeline(
+            client=openai.OpenAI(), llm=ChatOpenAI(model=rag.CHAT_MODEL), backend=backend,
+            embedding_cache=None, answer_cache=None,
+        )
+        return pipeline.respond(question)
+
+    shared = rag.RagPipeline(backend=backend, embedding_cache=None, answer_cache=None)
+    shared.respond(questions[0])  # first call pays one-off imports and loads the index
+    results = {"before": measure(before, questions), "after": measure(shared.respond, questions)}
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Cold-start timings: module import time and time-to-first-render per page.
+
+Each measurement runs in a fresh interpreter so nothing is already imported.
+Pages are rendered headless with Streamlit's AppTest using placeholder
+secrets; no page needs a live service to produce its first render, although
+the dashboard will still try to reach its upstream APIs.
+
+    python benchmarks/bench_startup.py --repeat 3
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+RENDER_SNIPPET = """
+import time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({path!r}, default_timeout=60)
+for key in ("OPENAI_API_KEY", "PINECONE_API_KEY", "INDEX_HOST", "OPENWEATHER_API_KEY", "MAPBOX_TOKEN"):
+    at.secrets[key] = "bench-placeholder"
+start = time.perf_counter()
+at.run()
+print(time.perf_counter() - start)
+"""
+
+
+def run_snippet(snippet):
+    out = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    return {"median_s": round(statistics.median(samples), 3), "min_s": round(min(samples), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = {"import": {}, "first_render": {}}
+    for module in ("rag",):
+        results["import"][module] = summarize([run_snippet(IMPORT_SNIPPET.format(module=module)) for _ in range(args.repeat)])
+    pages = ["home.py"] + sorted(glob.glob("pages/*.py", root_dir=ROOT))
+    for page in pages:
+        results["first_render"][page] = summarize([run_snippet(RENDER_SNIPPET.format(path=page)) for _ in range(args.repeat)])
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
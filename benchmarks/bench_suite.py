@@ -0,0 +1,275 @@
+"""End-to-end benchmark suite with local stand-ins for every external service.
+
+Runs against benchmarks/fakes.py: hash embeddings, a fake streaming chat
+model, a LocalVectorIndex of synthetic chunks and a local HTTP stub serving
+the NOAA/OpenWeather fixtures. No keys or network needed. Measures
+throughput and p50/p99 latency at each concurrency level for:
+
+- rag: rag.response_generator + rag.query_answering (uncached path)
+- rag_stream: rag.stream_answer_question, latency = time to first token
+  (both as rag_hybrid/rag_hybrid_stream with --hybrid: BM25 fused in, and
+  confident lexical matches answered without an embedding call)
+- summarize_tides: one day of 6-minute predictions
+- dashboard_cold / dashboard_warm: a full run of the beach dashboard page
+  via Streamlit's AppTest, with the weather/tide caches cleared or warm
+- dashboard_snapshot: the same page with cleared caches, rendered from a
+  snapshot published by prefetch.refresh (no upstream calls)
+
+Results are written as JSON. Pass --compare to check them against a saved
+baseline; the exit status is 1 if any p50 or throughput regressed by more
+than --tolerance.
+
+    python benchmarks/bench_suite.py --out bench.json
+    python benchmarks/bench_suite.py --compare bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import (  # noqa: E402
+    FakeOpenAIClient, FakeStreamingChatModel, FixtureServer, build_local_index, synthetic_questions,
+)
+
+DASHBOARD = os.path.join(ROOT, "pages", "🌊_beach_dashboard.py")
+SECRETS = ("OPENAI_API_KEY", "PINECONE_API_KEY", "INDEX_HOST", "OPENWEATHER_API_KEY", "MAPBOX_TOKEN")
+
+
+# ---------------------------
+# Measurement
+# ---------------------------
+def measure(name, fn, inputs, concurrency):
+    """Call fn(x) for every input on `concurrency` threads, after one
+    untimed warm-up call. `fn` returns the latency to record, or None to
+    record its wall time."""
+    inputs = list(inputs)
+    fn(inputs[0])
+
+    def timed(x):
+        start = time.perf_counter()
+        latency = fn(x)
+        return time.perf_counter() - start if latency is None else latency
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = np.array(list(pool.map(timed, inputs)))
+    wall = time.perf_counter() - start
+    return {
+        "name": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+        "mean_ms": round(float(latencies.mean()) * 1000, 3),
+    }
+
+
+# ---------------------------
+# Workloads
+# ---------------------------
+def bench_rag(args, levels):
+    import rag
+    from bm25 import BM25Index, LexicalIndex, namespace_path
+    from retrieval import LocalVectorIndex
+
+    index_root = build_local_index(os.path.join(os.environ["OCEANSAFE_CACHE_DIR"], "index"), count=args.chunks)
+    lexical = None
+    if args.hybrid:
+        lexical_root = os.path.join(os.environ["OCEANSAFE_CACHE_DIR"], "bm25")
+        local = LocalVectorIndex(index_root)._namespace("oceansafe")
+        index = BM25Index()
+        index.add(local.ids, [meta["text"] for meta in local.metadata], local.metadata)
+        index.save(namespace_path(lexical_root, "oceansafe"))
+        lexical = LexicalIndex(lexical_root)
+    llm = FakeStreamingChatModel(ttft=args.ttft, token_latency=args.token_latency, answer_tokens=args.answer_tokens)
+    rag._pipeline = rag.RagPipeline(
+        client=FakeOpenAIClient(latency=args.embed_latency),
+        backend=LocalVectorIndex(index_root),
+        llm=llm,
+        embedding_cache=None,
+        answer_cache=None,
+        lexical=lexical,
+    )
+    name = "rag_hybrid" if args.hybrid else "rag"
+
+    def answer(question):
+        context = rag.response_generator(question)
+        rag.query_answering(question, context)
+
+    def first_token(question):
+        start = time.perf_counter()
+        stream = rag.stream_answer_question(question)
+        next(stream)
+        ttft = time.perf_counter() - start
+        for _ in stream:
+            pass
+        return ttft
+
+    results = []
+    for n in levels:
+        results.append(measure(name, answer, synthetic_questions(args.requests, seed=n), n))
+        results.append(measure(f"{name}_stream", first_token, synthetic_questions(args.requests, seed=100 + n), n))
+    return results
+
+
+def bench_tides(args, levels, heights):
+    from tides import summarize_tides
+
+    day = pd.Timestamp("2024-06-01")
+    frame = pd.DataFrame({
+        "t": pd.date_range(day - pd.Timedelta(hours=1), periods=261, freq="6min"),
+        "Tide (ft)": [float(h) for h in (heights * 2)[:261]],
+    })
+
+    def summarize(_):
+        summarize_tides(frame, day=day.date())
+
+    return [measure("summarize_tides", summarize, range(args.requests * 4), n) for n in levels]
+
+
+def bench_dashboard(args, levels):
+    import conditions
+    from streamlit.testing.v1 import AppTest
+
+    def run_page(_):
+        at = AppTest.from_file(DASHBOARD, default_timeout=120)
+        for key in SECRETS:
+            at.secrets[key] = "bench-placeholder"
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+
+    def cold(_):
+        conditions.weather_cache.clear()
+        conditions.tide_cache.clear()
+        run_page(_)
+
+    run_page(None)  # first run pays one-off imports and the catalog load
+    results = [measure("dashboard_cold", cold, range(args.dashboard_runs), 1)]
+    for n in levels:
+        results.append(measure("dashboard_warm", run_page, range(args.dashboard_runs), n))
+
+    import prefetch
+    from catalog import load_catalog
+
+    prefetch.refresh(load_catalog().beaches)
+    results.append(measure("dashboard_snapshot", cold, range(args.dashboard_runs), 1))
+    return results
+
+
+# ---------------------------
+# Baseline comparison
+# ---------------------------
+def compare(results, baseline, tolerance):
+    base = {(r["name"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        b = base.get((r["name"], r["concurrency"]))
+        if b is None:
+            continue
+        if r["p50_ms"] > b["p50_ms"] * (1 + tolerance):
+            regressions.append(f"{r['name']}@{r['concurrency']}: p50 {b['p50_ms']} -> {r['p50_ms']} ms")
+        if r["throughput_rps"] < b["throughput_rps"] / (1 + tolerance):
+            regressions.append(f"{r['name']}@{r['concurrency']}: throughput {b['throughput_rps']} -> {r['throughput_rps']} rps")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAG, tides and the dashboard against local fakes")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated thread counts")
+    parser.add_argument("--requests", type=int, default=64, help="requests per RAG measurement")
+    parser.add_argument("--chunks", type=int, default=5000, help="synthetic chunks in the local index")
+    parser.add_argument("--ttft", type=float, default=0.05, help="fake chat model time to first token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="fake chat model seconds per token")
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="fake embeddings call latency (s)")
+    parser.add_argument("--upstream-latency", type=float, default=0.05, help="fixture server latency (s)")
+    parser.add_argument("--hybrid", action="store_true", help="fuse a BM25 index of the chunks into RAG retrieval")
+    parser.add_argument("--dashboard-runs", type=int, default=8)
+    parser.add_argument("--only", help="comma-separated subset of: rag,tides,dashboard")
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    levels = [int(n) for n in args.concurrency.split(",")]
+    only = set(args.only.split(",")) if args.only else {"rag", "tides", "dashboard"}
+    workdir = tempfile.mkdtemp(prefix="oceansafe-bench-")
+    server = FixtureServer(latency=args.upstream_latency)
+    # everything the app reads from the environment has to be set before
+    # conditions/rag are imported
+    os.environ.update({
+        "OCEANSAFE_CACHE_DIR": os.path.join(workdir, "cache"),
+        "HAZARD_DB": os.path.join(workdir, "hazards.sqlite3"),
+        "OPENWEATHER_URL": f"{server.url}/weather",
+        "NOAA_URL": f"{server.url}/datagetter",
+        "TIDE_SOURCE": "noaa",
+        # cold/warm runs measure the upstream path; the snapshot is published explicitly
+        "PREFETCH_IN_APP": "0",
+        "OCEANSAFE_METRICS": os.environ.get("OCEANSAFE_METRICS", "1"),
+    })
+    for key in SECRETS:
+        os.environ.setdefault(key, "bench-placeholder")
+    os.chdir(ROOT)
+
+    results = []
+    with server:
+        if "rag" in only:
+            results += bench_rag(args, levels)
+        if "tides" in only:
+            results += bench_tides(args, levels, server.httpd.heights)
+        if "dashboard" in only:
+            results += bench_dashboard(args, levels)
+        upstream_hits = server.hits
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "params": vars(args),
+            "upstream_hits": upstream_hits,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
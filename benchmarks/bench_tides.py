@@ -0,0 +1,82 @@
+"""Throughput of tide extrema detection for coastline-wide tide tables.
+
+Generates a year of synthetic 6-minute predictions for N stations and times
+tides.find_extrema over the whole matrix, against the old per-station,
+per-day summarize_tides that lived in the dashboard page.
+
+    python benchmarks/bench_tides.py --stations 48 --days 365
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tides import find_extrema  # noqa: E402
+
+CONSTITUENT_PERIODS_H = (12.4206, 12.0, 12.6583, 23.9345, 25.8193, 24.0659)
+
+
+def synthetic_tides(stations, days, step_minutes=6, seed=0):
+    rng = np.random.default_rng(seed)
+    hours = np.arange(0, days * 24, step_minutes / 60)
+    amps = rng.uniform(0.1, 1.8, size=(stations, len(CONSTITUENT_PERIODS_H)))
+    phases = rng.uniform(0, 2 * np.pi, size=(stations, len(CONSTITUENT_PERIODS_H)))
+    omega = 2 * np.pi / np.array(CONSTITUENT_PERIODS_H)
+    heights = 2.5 + np.einsum("sc,sct->st", amps, np.cos(omega[None, :, None] * hours + phases[:, :, None]))
+    times = np.datetime64("2026-01-01T00:00") + (hours * 3600e9).astype("timedelta64[ns]")
+    return times, np.round(heights, 3)
+
+
+def legacy_summarize_tides(tide_df):
+    df = tide_df.copy()
+    df['diff'] = df['Tide (ft)'].diff().fillna(0)
+    high_tides = df[(df['diff'] > 0) & (df['diff'].shift(-1) < 0)]
+    low_tides = df[(df['diff'] < 0) & (df['diff'].shift(-1) > 0)]
+    return pd.concat([
+        pd.DataFrame({"Time": high_tides['t'], "Tide (ft)": high_tides['Tide (ft)'], "Type": "High Tide"}),
+        pd.DataFrame({"Time": low_tides['t'], "Tide (ft)": low_tides['Tide (ft)'], "Type": "Low Tide"}),
+    ]).sort_values("Time")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", type=int, default=48)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--legacy-days", type=int, default=30,
+                        help="days per station to time the legacy path on (it is extrapolated)")
+    args = parser.parse_args()
+
+    times, heights = synthetic_tides(args.stations, args.days)
+
+    start = time.perf_counter()
+    extrema = find_extrema(heights, times)
+    vectorized = time.perf_counter() - start
+
+    per_day = 24 * 10
+    start = time.perf_counter()
+    for s in range(args.stations):
+        for d in range(args.legacy_days):
+            day = slice(d * per_day, (d + 1) * per_day)
+            legacy_summarize_tides(pd.DataFrame({"t": times[day], "Tide (ft)": heights[s, day]}))
+    legacy = (time.perf_counter() - start) * args.days / args.legacy_days
+
+    print(json.dumps({
+        "stations": args.stations,
+        "days": args.days,
+        "samples": int(heights.size),
+        "extrema_found": len(extrema),
+        "find_extrema_s": round(vectorized, 3),
+        "samples_per_s": int(heights.size / vectorized),
+        "legacy_summarize_tides_s_estimated": round(legacy, 2),
+        "speedup": round(legacy / vectorized, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""In-process stand-ins for OpenAI, Pinecone, NOAA and OpenWeather.
+
+Nothing here needs a key or the network, and everything is deterministic,
+so benchmark numbers only move when our code does.
+
+- HashEmbeddings / FakeOpenAIClient: feature-hashed bag-of-words vectors
+  behind the ``client.embeddings.create`` surface RagPipeline calls.
+- FakeStreamingChatModel: a LangChain chat model with configurable
+  time-to-first-token and per-token latency.
+- Upstream: shared by the fakes above to count calls, track peak
+  concurrency and inject 429s (FakeRateLimitError).
+- build_local_index: a LocalVectorIndex namespace of synthetic chunks.
+- FixtureServer: a local HTTP stub that answers the OpenWeather and NOAA
+  datagetter URLs from the JSON fixtures in benchmarks/fixtures. The
+  6-minute heights there are synthetic, in datagetter format; they are not
+  a NOAA recording, so tides.py won't validate a predictor against them.
+"""
+
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+import types
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+EMBED_DIM = 1536
+
+TOPICS = (
+    "rip current", "jellyfish sting", "sunburn", "high surf", "lifeguard tower", "stingray shuffle",
+    "tide pool", "sneaker wave", "heat exhaustion", "hypothermia", "marine layer", "water quality",
+)
+PHRASES = (
+    "swim parallel to the shore", "stay near a lifeguard", "check the posted flags", "rinse with vinegar",
+    "apply sunscreen every two hours", "never turn your back on the ocean", "shuffle your feet in the sand",
+    "watch the tide chart", "drink plenty of water", "avoid swimming after rain",
+)
+
+
+# ---------------------------
+# Rate limits
+# ---------------------------
+class FakeRateLimitError(Exception):
+    """Shaped like openai.RateLimitError: status_code 429 and a response
+    carrying a Retry-After header."""
+
+    def __init__(self, retry_after=None):
+        super().__init__("Rate limit reached (fake upstream)")
+        self.status_code = 429
+        headers = {} if retry_after is None else {"retry-after": str(retry_after)}
+        self.response = types.SimpleNamespace(status_code=429, headers=headers)
+
+
+class Upstream:
+    """Call accounting for a fake service. Raises FakeRateLimitError on
+    every `rate_limit_every`-th call and on any call that would push
+    concurrency past `max_in_flight`."""
+
+    def __init__(self, rate_limit_every=0, max_in_flight=None, retry_after=None):
+        self.rate_limit_every = rate_limit_every
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def request(self):
+        with self._lock:
+            self.calls += 1
+            if ((self.rate_limit_every and self.calls % self.rate_limit_every == 0)
+                    or (self.max_in_flight is not None and self.in_flight >= self.max_in_flight)):
+                self.rate_limited += 1
+                raise FakeRateLimitError(self.retry_after)
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stats(self):
+        return {"calls": self.calls, "rate_limited": self.rate_limited, "peak_in_flight": self.peak}
+
+
+def _request(upstream):
+    return upstream.request() if upstream is not None else nullcontext()
+
+
+# ---------------------------
+# Embeddings
+# ---------------------------
+class HashEmbeddings:
+    """Signed feature hashing of words and word pairs, L2-normalized."""
+
+    def __init__(self, dim=EMBED_DIM):
+        self.dim = dim
+
+    def embed(self, text):
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in words + [a + " " + b for a, b in zip(words, words[1:])]:
+            h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+            vector[h % self.dim] += 1.0 if h >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+
+class _Embeddings:
+    def __init__(self, model, latency, upstream=None):
+        self.model = model
+        self.latency = latency
+        self.upstream = upstream
+
+    def _response(self, input):
+        texts = [input] if isinstance(input, str) else list(input)
+        data = [types.SimpleNamespace(index=i, embedding=self.model.embed(t)) for i, t in enumerate(texts)]
+        tokens = sum(len(t.split()) for t in texts)
+        return types.SimpleNamespace(data=data, usage=types.SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens))
+
+    def create(self, input, model=None):
+        with _request(self.upstream):
+            if self.latency:
+                time.sleep(self.latency)
+            return self._response(input)
+
+
+class _AsyncEmbeddings(_Embeddings):
+    async def create(self, input, model=None):
+        with _request(self.upstream):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return self._response(input)
+
+
+class FakeOpenAIClient:
+    """Just enough of openai.OpenAI for RagPipeline: ``embeddings.create``."""
+
+    def __init__(self, dim=EMBED_DIM, latency=0.0, upstream=None):
+        self.embeddings = _Embeddings(HashEmbeddings(dim), latency, upstream)
+
+
+class FakeAsyncOpenAIClient:
+    def __init__(self, dim=EMBED_DIM, latency=0.0, upstream=None):
+        self.embeddings = _AsyncEmbeddings(HashEmbeddings(dim), latency, upstream)
+
+
+# ---------------------------
+# Chat model
+# ---------------------------
+class FakeStreamingChatModel(BaseChatModel):
+    """Answers with a fixed-length sentence built from the question, after
+    `ttft` seconds and then one token every `token_latency` seconds. Calls
+    go through `upstream`, if given, for accounting and injected 429s."""
+
+    ttft: float = 0.2
+    token_latency: float = 0.01
+    answer_tokens: int = 60
+    upstream: Optional[Any] = None
+
+    @property
+    def _llm_type(self):
+        return "fake-streaming-chat"
+
+    def _tokens(self, messages):
+        seed = int.from_bytes(hashlib.blake2b(messages[-1].content.encode(), digest_size=4).digest(), "little")
+        rng = random.Random(seed)
+        words = " ".join(rng.choice(PHRASES) for _ in range(self.answer_tokens)).split()[:self.answer_tokens]
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens(messages)
+        with _request(self.upstream):
+            time.sleep(self.ttft + self.token_latency * (len(tokens) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        with _request(self.upstream):
+            for i, token in enumerate(self._tokens(messages)):
+                time.sleep(self.ttft if i == 0 else self.token_latency)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens(messages)
+        with _request(self.upstream):
+            await asyncio.sleep(self.ttft + self.token_latency * (len(tokens) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        with _request(self.upstream):
+            for i, token in enumerate(self._tokens(messages)):
+                await asyncio.sleep(self.ttft if i == 0 else self.token_latency)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+# ---------------------------
+# Corpus and vector index
+# ---------------------------
+def synthetic_chunks(count, seed=0):
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(count):
+        topic = rng.choice(TOPICS)
+        body = ". ".join(rng.choice(PHRASES) for _ in range(rng.randint(4, 9)))
+        chunks.append(f"{topic.title()} safety note {i}: when you see a {topic}, {body}.")
+    return chunks
+
+
+def synthetic_questions(count, seed=1):
+    rng = random.Random(seed)
+    forms = ("What should I do about a {}?", "How dangerous is a {} today?", "Is a {} common at this beach?",
+             "How do I spot a {}?", "Tips for dealing with a {} near {}?")
+    return [rng.choice(forms).format(rng.choice(TOPICS), rng.choice(TOPICS)) + f" (#{i})" for i in range(count)]
+
+
+def build_local_index(root, count=5000, namespace="oceansafe", dim=EMBED_DIM, dtype="float32"):
+    """Write `count` synthetic chunks as a LocalVectorIndex namespace."""
+    from retrieval import write_namespace
+
+    embedder = HashEmbeddings(dim)
+    chunks = synthetic_chunks(count)
+    vectors = np.array([embedder.embed(c) for c in chunks], dtype=np.float32)
+    ids = [hashlib.sha256(c.encode()).hexdigest() for c in chunks]
+    write_namespace(root, namespace, ids, vectors, [{"text": c, "source": "synthetic"} for c in chunks], dtype=dtype)
+    return root
+
+
+# ---------------------------
+# NOAA / OpenWeather stub
+# ---------------------------
+def _load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FixtureServer"
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.server.hits[url.path] = self.server.hits.get(url.path, 0) + 1
+        if url.path == "/weather":
+            self._json(self.server.weather)
+        elif url.path == "/datagetter":
+            self._json(self._predictions(params))
+        else:
+            self.send_error(404)
+
+    def _predictions(self, params):
+        if params.get("product") != "predictions" or params.get("interval", "6") != "6":
+            return {"error": {"message": "The fixture server only has 6-minute predictions."}}
+        # replay the recorded heights on the requested 6-minute grid
+        begin = datetime.datetime.strptime(params["begin_date"], "%Y%m%d %H:%M")
+        end = datetime.datetime.strptime(params["end_date"], "%Y%m%d %H:%M")
+        heights = self.server.heights
+        steps = int((end - begin).total_seconds() // 360) + 1
+        return {"predictions": [
+            {"t": (begin + datetime.timedelta(minutes=6 * i)).strftime("%Y-%m-%d %H:%M"), "v": heights[i % len(heights)]}
+            for i in range(steps)
+        ]}
+
+    def _json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FixtureServer:
+    """Serves /weather (OpenWeather) and /datagetter (NOAA) on localhost.
+
+    Point the app at it with OPENWEATHER_URL=<url>/weather and
+    NOAA_URL=<url>/datagetter (before importing conditions).
+    """
+
+    def __init__(self, latency=0.0):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _FixtureHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.hits = {}
+        self.httpd.weather = _load_fixture("openweather.json")
+        self.httpd.heights = [p["v"] for p in _load_fixture("noaa_predictions_9410840.json")["predictions"]]
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @property
+    def hits(self):
+        return dict(self.httpd.hits)
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, name="fixture-server", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
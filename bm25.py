@@ -0,0 +1,377 @@
+"""Local BM25 index over the chunk corpus, for hybrid retrieval.
+
+Postings are array-backed: a frozen CSR block (``offsets`` into parallel
+``docs``/``tfs`` arrays, one slice per term) plus an append-only tail of
+``array`` postings for chunks added since the last compaction. ``save()``
+merges the two, drops removed chunks and writes one ``<namespace>.npz``
+per namespace. Chunk ids are the ingest content hashes, so adding a chunk
+that is already indexed is a no-op and the index can be built up
+incrementally:
+
+    python bm25.py build docs/lifeguard_manuals docs/county_advisories --namespace oceansafe
+    python bm25.py build --from-local local_index --namespace oceansafe
+    python bm25.py search "stingray shuffle"
+
+``LexicalIndex.search`` answers in the same shape as a Pinecone query
+response, so its matches can be fused with vector matches (``rrf_fuse``)
+or packed into a context on their own when ``is_confident`` says they
+cover the whole question.
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from cache import CACHE_DIR
+
+BM25_INDEX_PATH = os.environ.get("BM25_INDEX_PATH", os.path.join(CACHE_DIR, "bm25"))
+K1 = 1.2
+B = 0.75
+RRF_K = 60
+# a lexical result skips the embedding when its top hit contains every
+# query term and those terms are rare enough to be specific
+LEXICAL_MIN_COVERAGE = float(os.environ.get("LEXICAL_MIN_COVERAGE", "1.0"))
+LEXICAL_MIN_IDF = float(os.environ.get("LEXICAL_MIN_IDF", "3.0"))
+
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just me more most my no nor not now of off on once only or
+other our out over own same she should so some such than that the their them then there these they this
+those through to too under until up very was we were what when where which while who whom why will with
+would you your
+""".split())
+
+
+# ---------------------------
+# Tokenizer
+# ---------------------------
+def tokenize(text):
+    """Lower-case word tokens without stopwords, plurals folded to singular."""
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+# ---------------------------
+# Index
+# ---------------------------
+class BM25Index:
+    """Okapi BM25 over one namespace.
+
+    ``add``/``remove`` may be called from several threads; ``search``
+    should not race with them (the app only ever searches a loaded index).
+    Removed chunks keep their postings, masked out, until ``compact()``.
+    """
+
+    def __init__(self, k1=K1, b=B):
+        self.k1 = k1
+        self.b = b
+        self.terms = {}
+        self.ids = []
+        self.metadata = []
+        self.rows = {}
+        self.doc_len = array("I")
+        self.live = bytearray()
+        self.live_count = 0
+        self.total_len = 0
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.docs = np.empty(0, dtype=np.uint32)
+        self.tfs = np.empty(0, dtype=np.uint16)
+        self.tail = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.live_count
+
+    def add(self, ids, texts, metadata=None):
+        """Index chunks not seen before; returns how many were added."""
+        metadata = metadata or [{"text": text} for text in texts]
+        added = 0
+        with self._lock:
+            for vid, text, meta in zip(ids, texts, metadata):
+                if vid in self.rows:
+                    continue
+                counts = Counter(tokenize(text))
+                row = len(self.ids)
+                self.rows[vid] = row
+                self.ids.append(vid)
+                self.metadata.append(meta)
+                length = sum(counts.values())
+                self.doc_len.append(length)
+                self.live.append(1)
+                self.live_count += 1
+                self.total_len += length
+                for term, tf in counts.items():
+                    tid = self.terms.setdefault(term, len(self.terms))
+                    postings = self.tail.get(tid)
+                    if postings is None:
+                        postings = self.tail[tid] = (array("I"), array("H"))
+                    postings[0].append(row)
+                    postings[1].append(min(tf, 65535))
+                added += 1
+        return added
+
+    def remove(self, ids):
+        removed = 0
+        with self._lock:
+            for vid in ids:
+                row = self.rows.pop(vid, None)
+                if row is None:
+                    continue
+                self.live[row] = 0
+                self.live_count -= 1
+                self.total_len -= self.doc_len[row]
+                removed += 1
+        return removed
+
+    def postings(self, tid):
+        if tid + 1 < len(self.offsets):
+            docs = self.docs[self.offsets[tid]:self.offsets[tid + 1]]
+            tfs = self.tfs[self.offsets[tid]:self.offsets[tid + 1]]
+        else:
+            docs, tfs = self.docs[:0], self.tfs[:0]
+        tail = self.tail.get(tid)
+        if tail is not None:
+            docs = np.concatenate([docs, np.frombuffer(tail[0], dtype=np.uint32)])
+            tfs = np.concatenate([tfs, np.frombuffer(tail[1], dtype=np.uint16)])
+        return docs, tfs
+
+    def search(self, text, top_k=10):
+        """[(row, score, coverage)] best first, plus the summed idf of the
+        query terms. Coverage is the idf-weighted share of query terms the
+        chunk contains; terms missing from the corpus count against it."""
+        query = list(dict.fromkeys(tokenize(text)))
+        if not query or not self.live_count:
+            return [], 0.0
+        n = self.live_count
+        avgdl = self.total_len / n or 1.0  # every live chunk may be all stopwords
+        doc_len = np.frombuffer(self.doc_len, dtype=np.uint32)
+        norm = self.k1 * (1 - self.b + self.b * doc_len / avgdl)
+        live = np.frombuffer(self.live, dtype=np.uint8).astype(bool) if n < len(self.ids) else None
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        covered = np.zeros(len(self.ids), dtype=np.float32)
+        query_idf = 0.0
+        for term in query:
+            tid = self.terms.get(term)
+            docs, tfs = self.postings(tid) if tid is not None else (self.docs[:0], self.tfs[:0])
+            if live is not None:
+                # removed chunks keep their postings until compact(); they don't count towards df
+                keep = live[docs]
+                docs, tfs = docs[keep], tfs[keep]
+            df = len(docs)
+            idf = math.log(1 + (max(n - df, 0) + 0.5) / (df + 0.5))
+            query_idf += idf
+            if not df:
+                continue
+            tf = tfs.astype(np.float32)
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+            covered[docs] += idf
+        hits = int(np.count_nonzero(scores))
+        if not hits:
+            return [], query_idf
+        k = min(top_k, hits)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i]), float(covered[i] / query_idf)) for i in top], query_idf
+
+    def compact(self):
+        """Merge the tail into the CSR block and drop removed chunks."""
+        with self._lock:
+            counts = np.diff(self.offsets)
+            term_ids = [np.repeat(np.arange(len(counts)), counts)]
+            docs, tfs = [self.docs], [self.tfs]
+            for tid, (tail_docs, tail_tfs) in self.tail.items():
+                term_ids.append(np.full(len(tail_docs), tid, dtype=np.int64))
+                docs.append(np.frombuffer(tail_docs, dtype=np.uint32))
+                tfs.append(np.frombuffer(tail_tfs, dtype=np.uint16))
+            term_ids, docs, tfs = np.concatenate(term_ids), np.concatenate(docs), np.concatenate(tfs)
+            live = np.frombuffer(self.live, dtype=np.uint8).astype(bool)
+            keep = live[docs]
+            term_ids, docs, tfs = term_ids[keep], docs[keep], tfs[keep]
+            remap = np.cumsum(live) - 1
+            docs = remap[docs].astype(np.uint32)
+            order = np.lexsort((docs, term_ids))
+            self.docs, self.tfs = docs[order], tfs[order]
+            self.offsets = np.zeros(len(self.terms) + 1, dtype=np.int64)
+            self.offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(self.terms)))
+            self.tail = {}
+            rows = np.flatnonzero(live)
+            self.ids = [self.ids[i] for i in rows]
+            self.metadata = [self.metadata[i] for i in rows]
+            self.rows = {vid: row for row, vid in enumerate(self.ids)}
+            self.doc_len = array("I", np.frombuffer(self.doc_len, dtype=np.uint32)[rows].tobytes())
+            self.live = bytearray(b"\x01" * len(rows))
+
+    def save(self, path):
+        """Compact and write everything to one .npz, replaced atomically."""
+        self.compact()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        terms = sorted(self.terms, key=self.terms.get)
+        docs = json.dumps([{"id": vid, "metadata": meta} for vid, meta in zip(self.ids, self.metadata)])
+        tmp = f"{path}.tmp.npz"
+        np.savez(
+            tmp,
+            offsets=self.offsets,
+            docs=self.docs,
+            tfs=self.tfs,
+            doc_len=np.frombuffer(self.doc_len, dtype=np.uint32),
+            terms=np.array(terms, dtype=str),
+            chunks=np.frombuffer(docs.encode("utf-8"), dtype=np.uint8),
+            params=np.array([self.k1, self.b]),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(*data["params"].tolist())
+            index.offsets = data["offsets"]
+            index.docs = data["docs"]
+            index.tfs = data["tfs"]
+            index.doc_len = array("I", data["doc_len"].tobytes())
+            index.terms = {term: tid for tid, term in enumerate(data["terms"].tolist())}
+            chunks = json.loads(data["chunks"].tobytes().decode("utf-8"))
+        index.ids = [chunk["id"] for chunk in chunks]
+        index.metadata = [chunk["metadata"] for chunk in chunks]
+        index.rows = {vid: row for row, vid in enumerate(index.ids)}
+        index.live = bytearray(b"\x01" * len(index.ids))
+        index.live_count = len(index.ids)
+        index.total_len = int(np.frombuffer(index.doc_len, dtype=np.uint32).sum())
+        return index
+
+    @classmethod
+    def open(cls, path):
+        """The index at `path`, or an empty one if it doesn't exist yet."""
+        return cls.load(path) if os.path.exists(path) else cls()
+
+
+def namespace_path(root, namespace):
+    return os.path.join(root, f"{namespace}.npz")
+
+
+class LexicalIndex:
+    """Per-namespace BM25 indexes under `root`, loaded on first query and
+    then shared read-only."""
+
+    def __init__(self, root=BM25_INDEX_PATH):
+        self.root = root
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def _namespace(self, namespace):
+        if namespace not in self._namespaces:
+            with self._lock:
+                if namespace not in self._namespaces:
+                    path = namespace_path(self.root, namespace)
+                    self._namespaces[namespace] = BM25Index.load(path) if os.path.exists(path) else None
+        return self._namespaces[namespace]
+
+    def search(self, text, top_k, namespace):
+        index = self._namespace(namespace)
+        if index is None:
+            return {"matches": [], "namespace": namespace, "query_idf": 0.0}
+        hits, query_idf = index.search(text, top_k)
+        matches = [
+            {"id": index.ids[row], "score": score, "coverage": coverage, "metadata": index.metadata[row]}
+            for row, score, coverage in hits
+        ]
+        return {"matches": matches, "namespace": namespace, "query_idf": query_idf}
+
+
+# ---------------------------
+# Fusion
+# ---------------------------
+def is_confident(response, min_coverage=LEXICAL_MIN_COVERAGE, min_idf=LEXICAL_MIN_IDF):
+    """True when a lexical response can stand in for vector retrieval."""
+    matches = response["matches"]
+    return bool(matches) and matches[0]["coverage"] >= min_coverage - 1e-6 and response["query_idf"] >= min_idf
+
+
+def rrf_fuse(responses, top_k, k=RRF_K):
+    """Reciprocal rank fusion of several query responses into one. Works on
+    Pinecone matches and plain dicts alike; vectors and metadata are kept
+    when any response returned them."""
+    fused = {}
+    for response in responses:
+        for rank, match in enumerate(response["matches"]):
+            entry = fused.get(match["id"])
+            if entry is None:
+                entry = fused[match["id"]] = {"id": match["id"], "score": 0.0, "metadata": {}}
+            if not entry["metadata"]:
+                entry["metadata"] = match.get("metadata") or {}
+            values = match.get("values")
+            if values and "values" not in entry:
+                entry["values"] = values
+            entry["score"] += 1.0 / (k + rank + 1)
+    matches = sorted(fused.values(), key=lambda m: -m["score"])[:top_k]
+    return {"matches": matches, "namespace": responses[0].get("namespace") if responses else None}
+
+
+# ---------------------------
+# Building
+# ---------------------------
+def _local_chunks(root, namespace):
+    with open(os.path.join(root, namespace, "metadata.jsonl")) as f:
+        for line in f:
+            row = json.loads(line)
+            yield row["id"], row["metadata"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the local BM25 index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="add chunks from documents or a local vector index export")
+    build.add_argument("paths", nargs="*", help="files or directories of .txt/.md documents")
+    build.add_argument("--from-local", help="a directory written by `python retrieval.py export`")
+    build.add_argument("--namespace", default="oceansafe")
+    build.add_argument("--root", default=BM25_INDEX_PATH)
+    build.add_argument("--chunk-size", type=int, default=1000)
+    build.add_argument("--chunk-overlap", type=int, default=150)
+    search = sub.add_parser("search", help="print the top lexical matches for a query")
+    search.add_argument("query")
+    search.add_argument("--namespace", default="oceansafe")
+    search.add_argument("--root", default=BM25_INDEX_PATH)
+    search.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    path = namespace_path(args.root, args.namespace)
+    if args.command == "search":
+        response = LexicalIndex(args.root).search(args.query, args.k, args.namespace)
+        print(f"query idf {response['query_idf']:.2f}, confident: {is_confident(response)}")
+        for match in response["matches"]:
+            print(f"{match['score']:7.3f}  {match['coverage']:.2f}  {match['metadata'].get('text', '')[:100]!r}")
+        return
+
+    if not args.paths and not args.from_local:
+        parser.error("build needs document paths or --from-local")
+    index = BM25Index.open(path)
+    before = len(index)
+    if args.from_local:
+        chunks = list(_local_chunks(args.from_local, args.namespace))
+        index.add([vid for vid, _ in chunks], [meta.get("text", "") for _, meta in chunks], [m for _, m in chunks])
+    if args.paths:
+        from ingest import iter_chunks, iter_documents
+
+        chunks = list(iter_chunks(iter_documents(args.paths), args.chunk_size, args.chunk_overlap))
+        index.add([h for _, h, _ in chunks], [text for _, _, text in chunks],
+                  [{"text": text, "source": source} for source, _, text in chunks])
+    index.save(path)
+    print(f"{len(index) - before} chunks added, {len(index)} in '{args.namespace}' ({path})")
+
+
+if __name__ == "__main__":
+    main()
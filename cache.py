@@ -0,0 +1,396 @@
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+# ---------------------------
+# Cache location
+# ---------------------------
+CACHE_DIR = os.environ.get("OCEANSAFE_CACHE_DIR", ".cache")
+
+
+def normalize_query(text):
+    """Lower-case, collapse whitespace and drop trailing punctuation so that
+    trivially different phrasings of a question share one cache key."""
+    text = " ".join(str(text).lower().split())
+    return text.strip(" ?!.,;:")
+
+
+# ---------------------------
+# In-process LRU tier
+# ---------------------------
+class LRUCache:
+    """Thread-safe LRU with an optional per-entry TTL (seconds)."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or time.time() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# ---------------------------
+# Two-tier embedding cache
+# ---------------------------
+class EmbeddingCache:
+    """Query embeddings keyed on (model, normalized text).
+
+    Lookups go to the in-process LRU first and then to a SQLite file that
+    survives restarts. Vectors are stored on disk as float32 blobs. If the
+    database cannot be opened the cache keeps working memory-only.
+    """
+
+    def __init__(self, path=None, maxsize=2048, ttl=24 * 3600, disk_ttl=30 * 24 * 3600):
+        self.path = path or os.path.join(CACHE_DIR, "embeddings.sqlite3")
+        self.disk_ttl = disk_ttl
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = self._open()
+
+    def _open(self):
+        try:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, query TEXT NOT NULL, vector BLOB NOT NULL,"
+                " created REAL NOT NULL, PRIMARY KEY (model, query))"
+            )
+            conn.execute("DELETE FROM embeddings WHERE created < ?", (time.time() - self.disk_ttl,))
+            conn.commit()
+            return conn
+        except (sqlite3.Error, OSError):
+            return None
+
+    def get(self, text, model):
+        key = (model, normalize_query(text))
+        vector = self.memory.get(key)
+        if vector is not None:
+            return vector
+        vector = self._disk_get(key)
+        if vector is not None:
+            self.disk_hits += 1
+            self.memory.put(key, vector)
+            return vector
+        self.misses += 1
+        return None
+
+    def put(self, text, model, vector):
+        key = (model, normalize_query(text))
+        vector = list(vector)
+        self.memory.put(key, vector)
+        self._disk_put(key, vector)
+
+    def get_or_compute(self, text, model, compute):
+        vector = self.get(text, model)
+        if vector is None:
+            vector = compute(text)
+            self.put(text, model, vector)
+        return vector
+
+    def _disk_get(self, key):
+        if self._conn is None:
+            return None
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT vector, created FROM embeddings WHERE model = ? AND query = ?", key
+                ).fetchone()
+            except sqlite3.Error:
+                return None
+        if row is None or time.time() - row[1] >= self.disk_ttl:
+            return None
+        return array("f", row[0]).tolist()
+
+    def _disk_put(self, key, vector):
+        if self._conn is None:
+            return
+        blob = array("f", vector).tobytes()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, query, vector, created) VALUES (?, ?, ?, ?)",
+                    (key[0], key[1], blob, time.time()),
+                )
+                self._conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def clear(self):
+        self.memory.clear()
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM embeddings")
+                self._conn.commit()
+
+    def stats(self):
+        memory = self.memory.stats()
+        hits = memory["hits"] + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": memory["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_size": memory["size"],
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+# ---------------------------
+# Semantic answer cache
+# ---------------------------
+def _reindex_stamp(namespace):
+    return os.path.join(CACHE_DIR, f"reindexed-{namespace}")
+
+
+def mark_reindexed(namespace):
+    """Record that `namespace` was re-indexed. Answers cached before this
+    moment are ignored from then on, in this process and in any other one
+    sharing the same cache directory."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(_reindex_stamp(namespace), "w") as f:
+        f.write(str(time.time()))
+
+
+def _reindexed_at(namespace):
+    try:
+        return os.stat(_reindex_stamp(namespace)).st_mtime
+    except OSError:
+        return 0.0
+
+
+class SemanticAnswerCache:
+    """Answers keyed on the question embedding.
+
+    A lookup returns the stored answer for the most similar earlier question
+    in the same namespace, provided the cosine similarity reaches
+    `threshold`. Entries are evicted LRU-first beyond `maxsize` and expire
+    after `ttl` seconds.
+    """
+
+    def __init__(self, threshold=0.95, maxsize=512, ttl=6 * 3600):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector, namespace):
+        query = self._unit(vector)
+        oldest_valid = max(time.time() - self.ttl, _reindexed_at(namespace))
+        with self._lock:
+            stale = [k for k, e in self._entries.items() if e["stored_at"] < oldest_valid and e["namespace"] == namespace]
+            for key in stale:
+                del self._entries[key]
+                self.evictions += 1
+            keys = [k for k, e in self._entries.items() if e["namespace"] == namespace]
+            if keys:
+                matrix = np.stack([self._entries[k]["vector"] for k in keys])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    key = keys[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    entry = self._entries[key]
+                    return {
+                        "question": entry["question"],
+                        "answer": entry["answer"],
+                        "context": entry["context"],
+                        "similarity": float(scores[best]),
+                    }
+            self.misses += 1
+            return None
+
+    def store(self, question, vector, answer, context, namespace):
+        with self._lock:
+            self._entries[self._next_id] = {
+                "question": question,
+                "vector": self._unit(vector),
+                "answer": answer,
+                "context": context,
+                "namespace": namespace,
+                "stored_at": time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, namespace=None):
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+                return
+            for key in [k for k, e in self._entries.items() if e["namespace"] == namespace]:
+                del self._entries[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# ---------------------------
+# Stale-while-revalidate TTL cache
+# ---------------------------
+class TTLCache:
+    """Process-wide cache for upstream fetches.
+
+    A value is fresh for `ttl` seconds. For a further `stale_ttl` seconds it
+    is still served, while one background thread per key fetches a
+    replacement. Past that, the caller fetches synchronously. Errors from a
+    fetch are never cached; a failed background refresh keeps the stale
+    value.
+    """
+
+    def __init__(self, ttl, stale_ttl=0, maxsize=1024, name="cache"):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.name = name
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+        self._data = OrderedDict()
+        self._refreshing = set()
+        self._fetch_locks = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, key):
+        entry = self._data.get(key)
+        if entry is not None and time.time() - entry[1] < self.ttl:
+            return entry
+        return None
+
+    def _store(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted, _ = self._data.popitem(last=False)
+                self._fetch_locks.pop(evicted, None)
+
+    def _refresh(self, key, fetch):
+        try:
+            self._store(key, fetch())
+            self.refreshes += 1
+        except Exception:
+            self.errors += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_fetch(self, key, fetch):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                age = time.time() - stored_at
+                if age < self.ttl:
+                    self.hits += 1
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self.stale_hits += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(target=self._refresh, args=(key, fetch), daemon=True).start()
+                    return value
+            self.misses += 1
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+        # concurrent misses on one key share a single upstream call
+        with fetch_lock:
+            with self._lock:
+                entry = self._fresh(key)
+            if entry is not None:
+                return entry[0]
+            try:
+                value = fetch()
+            except Exception:
+                self.errors += 1
+                raise
+            self._store(key, value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,253 @@
+"""Beach and tide-station catalog with spatial lookups.
+
+Beaches come from data/beaches.json and NOAA tide-prediction stations from
+data/stations.json. Points are stored as 3D unit vectors, where straight-line
+(chord) distance is monotonic in great-circle distance. So a plain KD-tree
+over them answers haversine nearest-neighbour and radius queries exactly.
+Beaches without an explicit "station" get the nearest one.
+
+Refresh the station list from NOAA's metadata API with:
+
+    python catalog.py import-stations
+"""
+
+import argparse
+import heapq
+import json
+import os
+import threading
+
+import numpy as np
+
+BEACH_CATALOG = os.environ.get("BEACH_CATALOG", os.path.join("data", "beaches.json"))
+STATION_CATALOG = os.environ.get("STATION_CATALOG", os.path.join("data", "stations.json"))
+NOAA_STATIONS_URL = "https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations.json"
+EARTH_RADIUS_KM = 6371.0088
+LEAF_SIZE = 16
+ASSIGN_BLOCK = 4096
+
+
+# ---------------------------
+# Geometry
+# ---------------------------
+def to_unit(lat, lon):
+    """(n, 3) unit vectors for arrays of degrees."""
+    lat, lon = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.minimum(km / (2 * EARTH_RADIUS_KM), np.pi / 2))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    return chord_to_km(np.linalg.norm(to_unit(lat1, lon1) - to_unit(lat2, lon2), axis=-1))
+
+
+# ---------------------------
+# KD-tree
+# ---------------------------
+class KDTree:
+    """Array-backed KD-tree over 3D points. Each node covers a contiguous
+    slice of `order`; leaves hold at most `leaf_size` points."""
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.order = np.arange(len(self.points))
+        self.lo, self.hi, self.dim, self.split, self.left, self.right = [], [], [], [], [], []
+        if len(self.points):
+            self._build(0, len(self.points), leaf_size)
+        self.sorted_points = self.points[self.order]
+
+    def _build(self, lo, hi, leaf_size):
+        node = len(self.lo)
+        for column in (self.lo, self.hi, self.dim, self.split, self.left, self.right):
+            column.append(-1)
+        self.lo[node], self.hi[node] = lo, hi
+        if hi - lo <= leaf_size:
+            return node
+        idx = self.order[lo:hi]
+        pts = self.points[idx]
+        dim = int(np.argmax(pts.max(axis=0) - pts.min(axis=0)))
+        mid = (hi - lo) // 2
+        part = np.argpartition(pts[:, dim], mid)
+        self.order[lo:hi] = idx[part]
+        self.dim[node], self.split[node] = dim, float(self.points[self.order[lo + mid], dim])
+        self.left[node] = self._build(lo, lo + mid, leaf_size)
+        self.right[node] = self._build(lo + mid, hi, leaf_size)
+        return node
+
+    def query(self, point, k=1):
+        """(chord distances, indices) of the k nearest points, nearest first."""
+        point = np.asarray(point, dtype=np.float64)
+        best = []  # max-heap of (-dist, index)
+        if self.lo:
+            self._knn(0, point, k, best)
+        best.sort(reverse=True)
+        return np.array([-d for d, _ in best]), np.array([i for _, i in best], dtype=np.int64)
+
+    def _knn(self, node, point, k, best):
+        if self.left[node] == -1:
+            lo, hi = self.lo[node], self.hi[node]
+            dists = np.linalg.norm(self.sorted_points[lo:hi] - point, axis=1)
+            for d, i in zip(dists, self.order[lo:hi]):
+                if len(best) < k:
+                    heapq.heappush(best, (-d, i))
+                elif d < -best[0][0]:
+                    heapq.heapreplace(best, (-d, i))
+            return
+        diff = point[self.dim[node]] - self.split[node]
+        near, far = (self.left[node], self.right[node]) if diff < 0 else (self.right[node], self.left[node])
+        self._knn(near, point, k, best)
+        if len(best) < k or abs(diff) < -best[0][0]:
+            self._knn(far, point, k, best)
+
+    def query_radius(self, point, radius):
+        """(chord distances, indices) of every point within `radius`, nearest first."""
+        point = np.asarray(point, dtype=np.float64)
+        found_d, found_i = [], []
+        stack = [0] if self.lo else []
+        while stack:
+            node = stack.pop()
+            if self.left[node] == -1:
+                lo, hi = self.lo[node], self.hi[node]
+                dists = np.linalg.norm(self.sorted_points[lo:hi] - point, axis=1)
+                hit = dists <= radius
+                found_d.append(dists[hit])
+                found_i.append(self.order[lo:hi][hit])
+                continue
+            diff = point[self.dim[node]] - self.split[node]
+            if diff - radius <= 0:
+                stack.append(self.left[node])
+            if diff + radius >= 0:
+                stack.append(self.right[node])
+        if not found_d:
+            return np.array([]), np.array([], dtype=np.int64)
+        dists, idx = np.concatenate(found_d), np.concatenate(found_i)
+        order = np.argsort(dists)
+        return dists[order], idx[order]
+
+
+def nearest(points, targets, block=ASSIGN_BLOCK):
+    """For each row of `points`, (index, chord distance) of the nearest row
+    of `targets` (both unit vectors). Blocked matrix products, so assigning
+    thousands of beaches to thousands of stations is a handful of BLAS calls."""
+    points, targets = np.atleast_2d(points), np.atleast_2d(targets)
+    idx = np.empty(len(points), dtype=np.int64)
+    cos = np.empty(len(points))
+    for start in range(0, len(points), block):
+        sims = points[start:start + block] @ targets.T
+        idx[start:start + block] = sims.argmax(axis=1)
+        cos[start:start + block] = sims[np.arange(len(sims)), idx[start:start + block]]
+    return idx, np.sqrt(np.maximum(2 - 2 * cos, 0))
+
+
+# ---------------------------
+# Catalog
+# ---------------------------
+class BeachCatalog:
+    def __init__(self, beaches, stations):
+        self.stations = stations
+        self.station_ids = [s["id"] for s in stations]
+        self.station_tree = KDTree(to_unit([s["lat"] for s in stations], [s["lon"] for s in stations]))
+
+        units = to_unit([b["lat"] for b in beaches], [b["lon"] for b in beaches])
+        missing = [i for i, b in enumerate(beaches) if not b.get("station")]
+        if missing and stations:
+            idx, dist = nearest(units[missing], self.station_tree.points)
+            for i, j, d in zip(missing, idx, chord_to_km(dist)):
+                beaches[i]["station"] = self.station_ids[j]
+                beaches[i]["station_km"] = round(float(d), 1)
+        # name -> beach, in file order, shaped like the dashboard's old dict
+        self.beaches = {b["name"]: b for b in beaches}
+        self.names = [b["name"] for b in beaches]
+        self.beach_tree = KDTree(units)
+
+    @classmethod
+    def from_files(cls, beach_path=BEACH_CATALOG, station_path=STATION_CATALOG):
+        with open(beach_path, encoding="utf-8") as f:
+            beaches = json.load(f)
+        stations = []
+        if os.path.exists(station_path):
+            with open(station_path, encoding="utf-8") as f:
+                stations = json.load(f)
+        return cls(beaches, stations)
+
+    def near(self, lat, lon, k=5, radius_km=None):
+        """The k beaches nearest (lat, lon), optionally within `radius_km`,
+        as [(name, km)] nearest first."""
+        point = to_unit(lat, lon)
+        if radius_km is None:
+            dists, idx = self.beach_tree.query(point, k=k)
+        else:
+            dists, idx = self.beach_tree.query_radius(point, float(km_to_chord(radius_km)))
+            dists, idx = dists[:k], idx[:k]
+        return [(self.names[i], float(d)) for i, d in zip(idx, chord_to_km(dists))]
+
+    def nearest_station(self, lat, lon):
+        """(station id, km) of the closest tide station."""
+        dists, idx = self.station_tree.query(to_unit(lat, lon), k=1)
+        return self.station_ids[idx[0]], float(chord_to_km(dists[0]))
+
+    def assign_stations(self, lats, lons):
+        """Vectorized nearest-station ids and distances (km) for many points."""
+        idx, dist = nearest(to_unit(lats, lons), self.station_tree.points)
+        return [self.station_ids[i] for i in idx], chord_to_km(dist)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def load_catalog():
+    """The process-wide catalog, loaded on first use and shared by every session."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = BeachCatalog.from_files()
+        return _catalog
+
+
+# ---------------------------
+# Station import
+# ---------------------------
+def import_stations(path=STATION_CATALOG):
+    import requests
+
+    res = requests.get(NOAA_STATIONS_URL, params={"type": "tidepredictions"}, timeout=30)
+    res.raise_for_status()
+    stations = [
+        {"id": s["id"], "name": s["name"], "lat": float(s["lat"]), "lon": float(s["lng"])}
+        for s in res.json()["stations"]
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(stations, f, indent=2)
+        f.write("\n")
+    return len(stations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the beach and station catalog")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("import-stations", help="download NOAA tide prediction stations")
+    near = sub.add_parser("near", help="list beaches near a point")
+    near.add_argument("lat", type=float)
+    near.add_argument("lon", type=float)
+    near.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "import-stations":
+        print(f"wrote {import_stations()} stations to {STATION_CATALOG}")
+    else:
+        catalog = load_catalog()
+        for name, km in catalog.near(args.lat, args.lon, k=args.k):
+            print(f"{km:8.1f} km  {name}  (station {catalog.beaches[name]['station']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Weather and tide fetches for the beach dashboard.
+
+Results are cached process-wide, so every session and every rerun shares
+them. Weather is keyed on coordinates rounded to ~1 km and tides on
+(station, date), so beaches that share a NOAA station share one fetch.
+"""
+
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+import metrics
+from cache import TTLCache
+from config import get_secret
+from tides import load_predictor
+from upstream import UpstreamClient
+
+# overridable so the dashboard can be pointed at a local stub server
+OPENWEATHER_URL = os.environ.get("OPENWEATHER_URL", "https://api.openweathermap.org/data/2.5/weather")
+NOAA_URL = os.environ.get("NOAA_URL", "https://api.tidesandcurrents.noaa.gov/api/prod/datagetter")
+
+WEATHER_TTL = 5 * 60
+WEATHER_STALE_TTL = 30 * 60
+TIDE_TTL = 6 * 60 * 60
+TIDE_STALE_TTL = 6 * 60 * 60
+TIDE_PADDING_HOURS = 1
+TIDE_TIMEZONE = os.environ.get("TIDE_TIMEZONE", "America/Los_Angeles")
+# "noaa" (the default) always asks NOAA. "auto" uses local harmonic
+# prediction for stations whose constituents passed `tides.py validate
+# --hilo` and NOAA otherwise; "harmonic" requires a validated station.
+TIDE_SOURCE = os.environ.get("TIDE_SOURCE", "noaa")
+
+weather_cache = TTLCache(ttl=WEATHER_TTL, stale_ttl=WEATHER_STALE_TTL, name="weather")
+tide_cache = TTLCache(ttl=TIDE_TTL, stale_ttl=TIDE_STALE_TTL, name="tides")
+upstream = UpstreamClient()
+
+
+# ---------------------------
+# Weather Data
+# ---------------------------
+def fetch_weather_data(lat, lon):
+    params = {"lat": lat, "lon": lon, "appid": get_secret("OPENWEATHER_API_KEY"), "units": "imperial"}
+    with metrics.span("weather_fetch"):
+        data = upstream.get_json(OPENWEATHER_URL, params=params)
+    return {
+        "Temperature (°F)": round(data["main"]["temp"], 2),
+        "Weather": data["weather"][0]["description"].title(),
+        "UV Index": "Check local UV forecast"
+    }
+
+
+def get_weather_data(lat, lon):
+    lat, lon = round(lat, 2), round(lon, 2)
+    with metrics.span("weather"):
+        return dict(weather_cache.get_or_fetch((lat, lon), lambda: fetch_weather_data(lat, lon)))
+
+
+# ---------------------------
+# Tide Data
+# ---------------------------
+def tide_day():
+    """Today's date in the stations' local time (NOAA lst_ldt)."""
+    return datetime.datetime.now(ZoneInfo(TIDE_TIMEZONE)).date()
+
+
+def _noaa_predictions(station_id, begin, end, interval):
+    params = {
+        "station": station_id,
+        "product": "predictions",
+        "datum": "MLLW",
+        "time_zone": "lst_ldt",
+        "units": "english",
+        "interval": interval,
+        "format": "json",
+        "begin_date": begin.strftime("%Y%m%d %H:%M"),
+        "end_date": end.strftime("%Y%m%d %H:%M"),
+    }
+    with metrics.span("tide_fetch"):
+        data = upstream.get_json(NOAA_URL, params=params)
+    if "predictions" not in data:
+        raise LookupError(f"NOAA API returned no predictions for station {station_id}.")
+    df = pd.DataFrame(data['predictions'])
+    df['t'] = pd.to_datetime(df['t'])
+    df['v'] = pd.to_numeric(df['v'], errors='coerce')
+    return df
+
+
+def fetch_tide_series(station_id, begin, end, interval="6"):
+    """Predictions from `begin` to `end` (dates or datetimes, station local
+    time) at NOAA `interval` ("6" minutes, "h", ...)."""
+    df = _noaa_predictions(station_id, begin, end, interval)
+    return df[['t', 'v']].rename(columns={'v': 'Tide (ft)'})
+
+
+def fetch_tide_hilo(station_id, begin, end):
+    """NOAA's own high/low predictions, shaped like tides.find_extrema output."""
+    df = _noaa_predictions(station_id, begin, end, "hilo")
+    return pd.DataFrame({
+        "time": df['t'],
+        "height": df['v'],
+        "type": df['type'].map({"H": "High Tide", "L": "Low Tide"}),
+    })
+
+
+def fetch_tide_data(station_id="9410840", day=None):
+    # 6-minute predictions for the whole day plus an hour either side, so
+    # highs and lows right around midnight are still bracketed
+    day = day or tide_day()
+    start = datetime.datetime.combine(day, datetime.time()) - datetime.timedelta(hours=TIDE_PADDING_HOURS)
+    end = start + datetime.timedelta(hours=24 + 2 * TIDE_PADDING_HOURS)
+    if TIDE_SOURCE != "noaa":
+        predictor = load_predictor(station_id)
+        if predictor is not None and predictor.validated:
+            with metrics.span("tide_predict"):
+                return predictor.predict_frame(start, end, interval_minutes=6, tz=TIDE_TIMEZONE)
+        if TIDE_SOURCE == "harmonic":
+            raise LookupError(f"No validated harmonic constituents for station {station_id}.")
+    return fetch_tide_series(station_id, start, end, interval="6")
+
+
+def get_tide_data(station_id="9410840"):
+    """Raises LookupError when NOAA has no predictions for the station and
+    requests.RequestException when the call fails with no fallback."""
+    day = tide_day()
+    # callers get their own copy; the cached frame is shared across sessions
+    with metrics.span("tides"):
+        return tide_cache.get_or_fetch((station_id, day.isoformat()), lambda: fetch_tide_data(station_id, day)).copy()
+
+
+def cache_stats():
+    return {"weather": weather_cache.stats(), "tides": tide_cache.stats()}
+
+
+def upstream_stats():
+    return upstream.stats()
+
+
+def _cache_gauges():
+    for cache, stats in cache_stats().items():
+        for key, value in stats.items():
+            yield f"cache_{key}", {"cache": cache}, value
+
+
+def _upstream_gauges():
+    for host, stats in upstream_stats().items():
+        for key, value in stats.items():
+            if key == "circuit":
+                yield "upstream_circuit_open", {"host": host}, value != "closed"
+            else:
+                yield f"upstream_{key}", {"host": host}, value
+
+
+metrics.register_gauges("conditions_cache", _cache_gauges)
+metrics.register_gauges("conditions_upstream", _upstream_gauges)
+
+
+# ---------------------------
+# All beaches at once
+# ---------------------------
+def fetch_all(beaches, max_workers=8):
+    """Fetch weather and tides for every beach concurrently.
+
+    Beaches sharing a station or (rounded) coordinates share one fetch, so
+    the wall time is roughly the slowest single upstream call. Returns
+    {beach: {"weather": dict | None, "tides": DataFrame | None, "error": str | None}}.
+    """
+    weather_keys = {name: (round(b["lat"], 2), round(b["lon"], 2)) for name, b in beaches.items()}
+    stations = {name: b["station"] for name, b in beaches.items()}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        weather_futures = {key: pool.submit(get_weather_data, *key) for key in set(weather_keys.values())}
+        tide_futures = {station: pool.submit(get_tide_data, station) for station in set(stations.values())}
+
+    results = {}
+    for name in beaches:
+        errors = []
+        weather = tides = None
+        try:
+            weather = weather_futures[weather_keys[name]].result()
+        except Exception as e:
+            errors.append(f"weather: {e}")
+        try:
+            tides = tide_futures[stations[name]].result().copy()
+        except Exception as e:
+            errors.append(f"tides: {e}")
+        results[name] = {"weather": weather, "tides": tides, "error": "; ".join(errors) or None}
+    return results
@@ -0,0 +1,48 @@
+import os
+
+CONFIG_ENV = "OCEANSAFE_CONFIG"
+
+
+def load_config(path=None):
+    """Copy the top-level keys of a TOML file into os.environ, leaving
+    variables that are already set alone. `path` defaults to
+    $OCEANSAFE_CONFIG; .streamlit/secrets.toml has the right shape.
+
+    Modules read their settings from the environment at import time, so
+    command-line tools call this before importing them. Returns the names
+    that were set.
+    """
+    path = path or os.environ.get(CONFIG_ENV)
+    if not path:
+        return []
+    import tomllib
+
+    with open(path, "rb") as f:
+        settings = tomllib.load(f)
+    applied = []
+    for name, value in settings.items():
+        if isinstance(value, (dict, list)) or name in os.environ:
+            continue
+        os.environ[name] = ("1" if value else "0") if isinstance(value, bool) else str(value)
+        applied.append(name)
+    return applied
+
+
+def get_secret(name, default=None):
+    """Read a setting from the environment, falling back to st.secrets.
+
+    Streamlit is only imported on the fallback path so command-line tools
+    can run with plain environment variables (or a config file loaded with
+    load_config).
+    """
+    value = os.environ.get(name)
+    if value:
+        return value
+    try:
+        import streamlit as st
+
+        return st.secrets[name]
+    except Exception:
+        if default is not None:
+            return default
+        raise KeyError(f"{name} is not set in the environment or in .streamlit/secrets.toml") from None
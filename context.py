@@ -0,0 +1,160 @@
+"""Context packing for the RAG prompt.
+
+The pipeline over-fetches candidate chunks. ContextBuilder then orders them
+by maximal marginal relevance (MMR), so each pick is relevant to the query
+and unlike the chunks already picked. Near-duplicates are dropped outright.
+The survivors are packed, best first, into a token budget measured with
+the chat model's tokenizer.
+
+MMR uses the chunk vectors when the index returns them (include_values).
+Otherwise it falls back to word-shingle Jaccard similarity on the text.
+"""
+
+import os
+import re
+
+import numpy as np
+
+CHAT_MODEL = "gpt-4o-mini"
+CONTEXT_FETCH_K = int(os.environ.get("CONTEXT_FETCH_K", "12"))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "600"))
+MMR_LAMBDA = 0.7
+DUPLICATE_THRESHOLD = 0.92
+MIN_CHUNK_TOKENS = 24
+SEPARATOR = "\n\n"
+CHARS_PER_TOKEN = 4  # estimate used when tiktoken's encoding can't be loaded
+
+
+# ---------------------------
+# Tokenizer
+# ---------------------------
+_encodings = {}
+
+
+def encoding_for(model=CHAT_MODEL):
+    """tiktoken encoding for `model`, or None if tiktoken or its encoding
+    file (downloaded on first use) is unavailable. Cached per process."""
+    encoding = _encodings.get(model)
+    if encoding is None:
+        try:
+            import tiktoken
+
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            encoding = False  # don't retry the import/download on every call
+        _encodings[model] = encoding
+    return encoding or None
+
+
+def count_tokens(text, model=CHAT_MODEL):
+    encoding = encoding_for(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens, model=CHAT_MODEL):
+    encoding = encoding_for(model)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+# ---------------------------
+# Similarity
+# ---------------------------
+def _shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _jaccard_matrix(texts):
+    sets = [_shingles(t) for t in texts]
+    sims = np.eye(len(sets))
+    for i in range(len(sets)):
+        for j in range(i + 1, len(sets)):
+            union = len(sets[i] | sets[j])
+            sims[i, j] = sims[j, i] = len(sets[i] & sets[j]) / union if union else 0.0
+    return sims
+
+
+def _unit(rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return rows / norms
+
+
+def mmr_order(relevance, similarity, lam=MMR_LAMBDA, duplicate_threshold=DUPLICATE_THRESHOLD):
+    """Candidate indices in MMR order, skipping any candidate whose
+    similarity to an already chosen one is at or above the threshold."""
+    remaining = list(range(len(relevance)))
+    chosen = []
+    while remaining:
+        if chosen:
+            redundancy = similarity[np.ix_(remaining, chosen)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        best = int(np.argmax(lam * relevance[remaining] - (1 - lam) * redundancy))
+        if redundancy[best] < duplicate_threshold:
+            chosen.append(remaining[best])
+        remaining.pop(best)
+    return chosen
+
+
+# ---------------------------
+# Builder
+# ---------------------------
+class ContextBuilder:
+    """Turns an over-fetched query response into one prompt context."""
+
+    def __init__(self, fetch_k=CONTEXT_FETCH_K, budget_tokens=CONTEXT_TOKEN_BUDGET, lam=MMR_LAMBDA,
+                 duplicate_threshold=DUPLICATE_THRESHOLD, model=CHAT_MODEL):
+        self.fetch_k = fetch_k
+        self.budget_tokens = budget_tokens
+        self.lam = lam
+        self.duplicate_threshold = duplicate_threshold
+        self.model = model
+
+    def select(self, matches, query_vector=None):
+        """Matches in the order they should be packed, duplicates removed."""
+        matches = [m for m in matches if (m.get("metadata") or {}).get("text")]
+        if len(matches) < 2:
+            return matches
+        texts = [m["metadata"]["text"] for m in matches]
+        values = [m.get("values") for m in matches]
+        if query_vector is not None and all(values):
+            vectors = _unit(values)
+            similarity = vectors @ vectors.T
+            relevance = vectors @ _unit(query_vector)
+        else:
+            similarity = _jaccard_matrix(texts)
+            relevance = np.array([m["score"] for m in matches], dtype=np.float32)
+        return [matches[i] for i in mmr_order(relevance, similarity, self.lam, self.duplicate_threshold)]
+
+    def pack(self, matches):
+        """Greedily fit chunks into the budget, skipping any that don't fit.
+        Only the first chunk is ever truncated, so the context is never empty."""
+        parts, used = [], 0
+        sep_tokens = count_tokens(SEPARATOR, self.model)
+        for match in matches:
+            remaining = self.budget_tokens - used - (sep_tokens if parts else 0)
+            if remaining < MIN_CHUNK_TOKENS:
+                break
+            text = match["metadata"]["text"]
+            tokens = count_tokens(text, self.model)
+            if tokens > remaining:
+                if parts:
+                    continue
+                text, tokens = truncate_tokens(text, remaining, self.model), remaining
+            parts.append((match, text))
+            used += tokens + (sep_tokens if len(parts) > 1 else 0)
+        return parts, used
+
+    def build(self, query_response, query_vector=None):
+        """(context text, chosen matches, token count)."""
+        parts, used = self.pack(self.select(query_response["matches"], query_vector))
+        return SEPARATOR.join(text for _, text in parts), [m for m, _ in parts], used
@@ -0,0 +1,231 @@
+// Hazard map component. Speaks the Streamlit component protocol directly
+// (postMessage), so there is no build step. See hazard_map.py for the
+// render/event message shapes.
+
+let map = null;
+let userMarker = null;
+let userLocation = null;
+let directions = null;
+let lastCenter = null;
+let version = 0;
+let resyncRequested = null;
+let viewTimer = null;
+const hazards = new Map();
+
+// ---------------------------
+// Streamlit protocol
+// ---------------------------
+function sendMessage(type, data) {
+    window.parent.postMessage(Object.assign({ isStreamlitMessage: true, type: type }, data), "*");
+}
+
+function sendEvent(event) {
+    event.nonce = Date.now() + "-" + Math.random().toString(36).slice(2);
+    event.bbox = currentBbox();
+    event.location = userLocation;
+    event.version = version;
+    sendMessage("streamlit:setComponentValue", { value: event, dataType: "json" });
+}
+
+window.addEventListener("message", function(e) {
+    if (e.data && e.data.type === "streamlit:render") render(e.data.args);
+});
+
+sendMessage("streamlit:componentReady", { apiVersion: 1 });
+
+// ---------------------------
+// Render
+// ---------------------------
+function render(args) {
+    sendMessage("streamlit:setFrameHeight", { height: args.height });
+    document.getElementById("map").style.height = args.height + "px";
+    if (!map) createMap(args);
+    applyHazards(args.hazards);
+    if (!lastCenter || lastCenter[0] !== args.center[0] || lastCenter[1] !== args.center[1]) {
+        if (lastCenter) map.flyTo({ center: args.center, zoom: 14 });
+        lastCenter = args.center;
+        if (directions) directions.setDestination(args.center);
+    }
+    setDirections(args.directions);
+}
+
+function applyHazards(diff) {
+    if (diff.version === version) return;
+    if (!diff.full && diff.base !== version) {
+        // we missed a diff (or this is a fresh iframe): ask for a snapshot once
+        if (resyncRequested !== diff.version) {
+            resyncRequested = diff.version;
+            sendEvent({ event: "resync" });
+        }
+        return;
+    }
+    if (diff.full) hazards.clear();
+    diff.remove.forEach(function(id) { hazards.delete(id); });
+    diff.upsert.forEach(function(f) { hazards.set(f.id, f); });
+    version = diff.version;
+    resyncRequested = null;
+    const source = map.getSource("hazards");
+    if (source) source.setData(hazardCollection());
+}
+
+function hazardCollection() {
+    return { type: "FeatureCollection", features: Array.from(hazards.values()) };
+}
+
+function currentBbox() {
+    if (!map) return null;
+    const b = map.getBounds();
+    return [b.getSouth(), b.getWest(), b.getNorth(), b.getEast()];
+}
+
+// ---------------------------
+// Map
+// ---------------------------
+function createMap(args) {
+    mapboxgl.accessToken = args.token;
+    map = new mapboxgl.Map({
+        container: "map",
+        style: "mapbox://styles/mapbox/streets-v11",
+        center: args.center,
+        zoom: 14
+    });
+    map.addControl(new mapboxgl.NavigationControl());
+
+    map.on("load", function() {
+        map.addSource("hazards", {
+            type: "geojson",
+            data: hazardCollection(),
+            cluster: true,
+            clusterRadius: 50,
+            clusterMaxZoom: 16
+        });
+        map.addLayer({
+            id: "hazard-clusters",
+            type: "circle",
+            source: "hazards",
+            filter: ["has", "point_count"],
+            paint: {
+                "circle-color": ["step", ["get", "point_count"], "#f6a04d", 50, "#f17c3a", 500, "#d9482b"],
+                "circle-radius": ["step", ["get", "point_count"], 16, 50, 22, 500, 30]
+            }
+        });
+        map.addLayer({
+            id: "hazard-cluster-count",
+            type: "symbol",
+            source: "hazards",
+            filter: ["has", "point_count"],
+            layout: { "text-field": "{point_count_abbreviated}", "text-size": 12 }
+        });
+        map.addLayer({
+            id: "hazard-points",
+            type: "circle",
+            source: "hazards",
+            filter: ["!", ["has", "point_count"]],
+            paint: {
+                "circle-color": "orange",
+                "circle-radius": 8,
+                "circle-stroke-width": 1,
+                "circle-stroke-color": "#fff"
+            }
+        });
+        sendEvent({ event: "view" });
+    });
+
+    map.on("click", "hazard-clusters", function(e) {
+        const feature = e.features[0];
+        map.getSource("hazards").getClusterExpansionZoom(feature.properties.cluster_id, function(err, zoom) {
+            if (!err) map.easeTo({ center: feature.geometry.coordinates, zoom: zoom });
+        });
+    });
+
+    map.on("click", "hazard-points", function(e) {
+        const p = e.features[0].properties;
+        new mapboxgl.Popup()
+            .setLngLat(e.features[0].geometry.coordinates)
+            .setText(p.reports > 1 ? p.hazard + " (" + p.reports + " reports)" : p.hazard)
+            .addTo(map);
+        sendEvent({ event: "select", id: p.id });
+    });
+
+    // clicking empty map reports a hazard there
+    map.on("click", function(e) {
+        if (map.queryRenderedFeatures(e.point, { layers: ["hazard-clusters", "hazard-points"] }).length) return;
+        const hazard = prompt("Enter hazard type (e.g., Jellyfish, Trash, High surf):");
+        if (hazard) sendEvent({ event: "report", lat: e.lngLat.lat, lon: e.lngLat.lng, hazard: hazard });
+    });
+
+    map.on("mouseenter", "hazard-points", function() { map.getCanvas().style.cursor = "pointer"; });
+    map.on("mouseleave", "hazard-points", function() { map.getCanvas().style.cursor = ""; });
+
+    // tell Python what is in view once panning settles, so it can send
+    // the hazards for the new area
+    map.on("moveend", function() {
+        clearTimeout(viewTimer);
+        viewTimer = setTimeout(function() { sendEvent({ event: "view" }); }, 400);
+    });
+
+    // user marker (blue), live
+    navigator.geolocation.getCurrentPosition(function(pos) {
+        const here = [pos.coords.longitude, pos.coords.latitude];
+        userLocation = [pos.coords.latitude, pos.coords.longitude];
+        sendEvent({ event: "locate" });
+        userMarker = new mapboxgl.Marker({ color: "blue" }).setLngLat(here).addTo(map);
+        if (directions) directions.setOrigin(here);
+        navigator.geolocation.watchPosition(function(p) {
+            const lngLat = [p.coords.longitude, p.coords.latitude];
+            userMarker.setLngLat(lngLat);
+            if (directions) {
+                try { directions.setOrigin(lngLat); } catch (err) { console.warn("directions setOrigin error", err); }
+            }
+        }, function(err) { console.error("watchPosition error", err); }, { enableHighAccuracy: true });
+    }, function() {}, { enableHighAccuracy: true, timeout: 10000 });
+}
+
+// ---------------------------
+// Directions
+// ---------------------------
+function coordsToBounds(coords) {
+    if (!coords || coords.length === 0) return null;
+    let minLng = coords[0][0], minLat = coords[0][1], maxLng = coords[0][0], maxLat = coords[0][1];
+    for (let i = 1; i < coords.length; i++) {
+        const c = coords[i];
+        if (c[0] < minLng) minLng = c[0];
+        if (c[0] > maxLng) maxLng = c[0];
+        if (c[1] < minLat) minLat = c[1];
+        if (c[1] > maxLat) maxLat = c[1];
+    }
+    return [[minLng, minLat], [maxLng, maxLat]];
+}
+
+function setDirections(enabled) {
+    if (enabled && !directions) {
+        directions = new MapboxDirections({
+            accessToken: mapboxgl.accessToken,
+            unit: "imperial",
+            profile: "mapbox/walking",
+            interactive: true,
+            controls: { inputs: true, instructions: true, profileSwitcher: true },
+            fitBounds: false
+        });
+        map.addControl(directions, "top-left");
+        directions.setOrigin(userMarker ? userMarker.getLngLat().toArray() : map.getCenter().toArray());
+        directions.setDestination(lastCenter);
+        // fit the whole route rather than just the beach
+        directions.on("route", function(e) {
+            if (!e || !e.route || e.route.length === 0) return;
+            const geometry = e.route[0].geometry;
+            let coords = geometry && geometry.coordinates ? geometry.coordinates : geometry;
+            if (!Array.isArray(coords)) {
+                // encoded polyline: fall back to the origin/destination box
+                const o = directions.getOrigin(), d = directions.getDestination();
+                if (!o || !d || !o.geometry || !d.geometry) return;
+                coords = [o.geometry.coordinates, d.geometry.coordinates];
+            }
+            const bounds = coordsToBounds(coords);
+            if (bounds) map.fitBounds(bounds, { padding: 60, linear: true });
+        });
+    } else if (!enabled && directions) {
+        map.removeControl(directions);
+        directions = null;
+    }
+}
@@ -0,0 +1,110 @@
+"""Mapbox hazard map as a bidirectional Streamlit component.
+
+The frontend (frontend/hazard_map) creates the map once and keeps it alive
+across reruns. Each rerun sends only the hazards that changed since the
+last render, as a versioned diff:
+
+    {"version": n, "base": m, "full": bool, "upsert": [feature, ...], "remove": [id, ...]}
+
+The frontend applies a diff only when its own version equals `base`. When
+it has lost track (new iframe, missed render), it sends a "resync" event
+and the next render carries a full snapshot.
+
+Map interactions come back as the component value, one event at a time:
+``{"event": "report" | "select" | "view" | "locate" | "resync", "nonce": ...,
+"version": v, "bbox": [s, w, n, e], "location": [lat, lon] | None, ...}``.
+Every event carries the frontend's hazard version, view and location, so
+nothing is lost when one event replaces another before Python reads it; a
+version that does not match what was sent forces a full snapshot.
+"""
+
+import os
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+_FRONTEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend", "hazard_map")
+_component = components.declare_component("hazard_map", path=_FRONTEND)
+
+
+class HazardFeed:
+    """What one session's map has been sent, so the next render is a diff."""
+
+    def __init__(self):
+        self.version = 0
+        self.sent = {}
+
+    def reset(self):
+        self.version = 0
+        self.sent = {}
+
+    def diff(self, hazards):
+        current = {h["id"]: h for h in hazards}
+        upsert = [
+            _feature(h) for hid, h in current.items()
+            if self.sent.get(hid) != (h["reports"], h["reported_at"])
+        ]
+        remove = [hid for hid in self.sent if hid not in current]
+        base, full = self.version, self.version == 0
+        if upsert or remove or full:
+            self.version += 1
+        self.sent = {hid: (h["reports"], h["reported_at"]) for hid, h in current.items()}
+        return {"version": self.version, "base": base, "full": full, "upsert": upsert, "remove": remove}
+
+
+def _feature(h):
+    return {
+        "type": "Feature",
+        "id": h["id"],
+        "geometry": {"type": "Point", "coordinates": [h["lon"], h["lat"]]},
+        "properties": {"id": h["id"], "hazard": h["hazard"], "reports": h["reports"]},
+    }
+
+
+def _state(key):
+    return st.session_state.setdefault(f"_{key}_state", {"feed": HazardFeed(), "nonce": None, "bbox": None, "location": None})
+
+
+def map_event(key="hazard_map"):
+    """The map event that triggered this rerun, or None. Call before
+    `hazard_map` so its effects (a new report, a new view) show up in the
+    same run. View, location and resync updates are handled here and
+    not returned."""
+    state = _state(key)
+    value = st.session_state.get(key)
+    if not value or value.get("nonce") == state["nonce"]:
+        return None
+    state["nonce"] = value["nonce"]
+    if value.get("bbox"):
+        state["bbox"] = tuple(value["bbox"])
+    if value.get("location"):
+        state["location"] = tuple(value["location"])
+    if value.get("version") != state["feed"].version:
+        state["feed"].reset()
+    if value.get("event") in ("resync", "locate", "view"):
+        return None
+    return value
+
+
+def map_view(key="hazard_map", default=None):
+    """The (south, west, north, east) the map last reported, or `default`."""
+    return _state(key)["bbox"] or default
+
+
+def map_location(key="hazard_map"):
+    """The browser's (lat, lon) once the user has allowed geolocation, else None."""
+    return _state(key)["location"]
+
+
+def hazard_map(hazards, center, token, directions=False, height=650, key="hazard_map"):
+    """Render (or update) the map. `hazards` are HazardStore rows."""
+    feed = _state(key)["feed"]
+    _component(
+        token=token,
+        center=[center[1], center[0]],
+        directions=directions,
+        height=height,
+        hazards=feed.diff(hazards),
+        key=key,
+        default=None,
+    )
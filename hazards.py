@@ -0,0 +1,221 @@
+"""Shared hazard report store.
+
+Reports live in one SQLite database (WAL mode) shared by every session and
+process. Each row carries a geohash, so bounding-box queries become a few
+index range scans rather than a table scan. Reports expire after a
+per-report TTL and are deleted by ``add`` every PURGE_INTERVAL seconds.
+A new report of the same hazard close to a live one bumps that report
+instead of adding a duplicate. The check and the write share one
+``BEGIN IMMEDIATE`` transaction, so concurrent reports (from any process)
+can't both insert.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+
+HAZARD_DB = os.environ.get("HAZARD_DB", os.path.join("data", "hazards.sqlite3"))
+DEFAULT_TTL = 6 * 60 * 60
+DEDUPE_RADIUS_M = 50
+GEOHASH_PRECISION = 8
+MAX_COVER_CELLS = 16
+PURGE_INTERVAL = 10 * 60
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_METERS_PER_DEG_LAT = 111_320
+
+
+# ---------------------------
+# Geohash
+# ---------------------------
+def geohash(lat, lon, precision=GEOHASH_PRECISION):
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            ch = (ch << 1) | (lon >= mid)
+            lon_lo, lon_hi = (mid, lon_hi) if lon >= mid else (lon_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            ch = (ch << 1) | (lat >= mid)
+            lat_lo, lat_hi = (mid, lat_hi) if lat >= mid else (lat_lo, mid)
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+
+def _cell_size(precision):
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def geohash_cover(south, west, north, east, max_cells=MAX_COVER_CELLS):
+    """The finest set of geohash prefixes (at most `max_cells`) whose cells
+    together cover the bounding box."""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        dlat, dlon = _cell_size(precision)
+        rows = int((north - south) / dlat) + 2
+        cols = int((east - west) / dlon) + 2
+        if rows * cols > max_cells and precision > 1:
+            continue
+        cells = set()
+        lat = south
+        while True:
+            lon = west
+            while True:
+                cells.add(geohash(min(lat, north), min(lon, east), precision))
+                if lon >= east:
+                    break
+                lon += dlon
+            if lat >= north:
+                break
+            lat += dlat
+        return sorted(cells)
+    return [""]
+
+
+def normalize_hazard(text):
+    return " ".join(str(text).lower().split())
+
+
+# ---------------------------
+# Store
+# ---------------------------
+class HazardStore:
+    def __init__(self, path=HAZARD_DB, default_ttl=DEFAULT_TTL, dedupe_radius_m=DEDUPE_RADIUS_M):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.dedupe_radius_m = dedupe_radius_m
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+        # transactions are opened explicitly (BEGIN IMMEDIATE in add)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS hazards (
+                id INTEGER PRIMARY KEY,
+                beach TEXT,
+                hazard TEXT NOT NULL,
+                hazard_key TEXT NOT NULL,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                geohash TEXT NOT NULL,
+                reported_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                reports INTEGER NOT NULL DEFAULT 1
+            );
+            CREATE INDEX IF NOT EXISTS hazards_geohash ON hazards (geohash, expires_at);
+            CREATE INDEX IF NOT EXISTS hazards_beach ON hazards (beach, reported_at);
+            CREATE INDEX IF NOT EXISTS hazards_expiry ON hazards (expires_at);
+            """
+        )
+
+    def add(self, lat, lon, hazard, beach=None, ttl=None, now=None):
+        """Store a report and return its id. A live report of the same
+        hazard within `dedupe_radius_m` is refreshed instead."""
+        now = now or time.time()
+        expires_at = now + (ttl or self.default_ttl)
+        key = normalize_hazard(hazard)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if now >= self._next_purge:
+                    self._conn.execute("DELETE FROM hazards WHERE expires_at <= ?", (now,))
+                    self._next_purge = now + PURGE_INTERVAL
+                nearby = self._nearby(lat, lon, key, now)
+                if nearby is not None:
+                    self._conn.execute(
+                        "UPDATE hazards SET reports = reports + 1, reported_at = ?, expires_at = MAX(expires_at, ?)"
+                        " WHERE id = ?",
+                        (now, expires_at, nearby),
+                    )
+                    hazard_id = nearby
+                else:
+                    hazard_id = self._conn.execute(
+                        "INSERT INTO hazards (beach, hazard, hazard_key, lat, lon, geohash, reported_at, expires_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (beach, hazard.strip(), key, lat, lon, geohash(lat, lon), now, expires_at),
+                    ).lastrowid
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return hazard_id
+
+    def _nearby(self, lat, lon, key, now):
+        # runs inside add's transaction, with the lock held
+        dlat = self.dedupe_radius_m / _METERS_PER_DEG_LAT
+        dlon = dlat / max(0.01, math.cos(math.radians(lat)))
+        sql, params = self._query_sql(bbox=(lat - dlat, lon - dlon, lat + dlat, lon + dlon), now=now)
+        for row in self._conn.execute(sql, params).fetchall():
+            if row["hazard_key"] == key:
+                return row["id"]
+        return None
+
+    def _query_sql(self, beach=None, bbox=None, since=None, until=None, now=None, limit=1000):
+        now = now or time.time()
+        clauses, params = ["expires_at > ?"], [now]
+        if bbox is not None:
+            south, west, north, east = bbox
+            cells = geohash_cover(south, west, north, east)
+            clauses.append("(" + " OR ".join("(geohash >= ? AND geohash < ?)" for _ in cells) + ")")
+            for cell in cells:
+                params += [cell, cell + "~"]
+            clauses.append("lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?")
+            params += [south, north, west, east]
+        if beach is not None:
+            clauses.append("beach = ?")
+            params.append(beach)
+        if since is not None:
+            clauses.append("reported_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("reported_at <= ?")
+            params.append(until)
+        sql = f"SELECT * FROM hazards WHERE {' AND '.join(clauses)} ORDER BY reported_at DESC LIMIT ?"
+        return sql, params + [limit]
+
+    def query(self, beach=None, bbox=None, since=None, until=None, now=None, limit=1000):
+        """Live reports, newest first. `bbox` is (south, west, north, east)."""
+        sql, params = self._query_sql(beach, bbox, since, until, now, limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, hazard_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM hazards WHERE id = ?", (hazard_id,)).fetchone()
+        return dict(row) if row else None
+
+    def purge_expired(self, now=None):
+        with self._lock:
+            return self._conn.execute("DELETE FROM hazards WHERE expires_at <= ?", (now or time.time(),)).rowcount
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM hazards").fetchone()[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide store, shared by every session."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HazardStore()
+        return _store
@@ -1,5 +1,4 @@
 import streamlit as st
-import time
 
 # ---------------------------
 # Page Config
@@ -14,10 +13,13 @@ st.set_page_config(
 # ---------------------------
 # Fullscreen Splash Animation with Text
 # ---------------------------
+# The splash fades out client-side via CSS; the page renders underneath it
+# straight away instead of the script sleeping for the splash duration.
 video_url = "https://github.com/SSR2308/OceanSafeLM/blob/9761d751ca32b424d92cc29eba0c179d212e7127/bc8c-f169-4534-a82d-acc2fad66609.mp4?raw=true"
 
-splash_container = st.empty()
-splash_container.markdown(f"""
+if not st.session_state.get("splash_shown"):
+    st.session_state["splash_shown"] = True
+    st.markdown(f"""
 <div id="splash" style="
     position: fixed;
     top: 0;
@@ -30,6 +32,7 @@ splash_container.markdown(f"""
     justify-content: flex-end;  /* push video lower */
     align-items: center;
     z-index: 9999;
+    pointer-events: none;
     animation: fadeout 1s ease 4s forwards;
     padding-bottom: 100px;       /* adjust space for text */
 ">
@@ -63,9 +66,6 @@ splash_container.markdown(f"""
 </style>
 """, unsafe_allow_html=True)
 
-time.sleep(5)  # wait for splash duration
-splash_container.empty()
-
 # ---------------------------
 # Sidebar Content
 # ---------------------------
@@ -0,0 +1,275 @@
+"""Chunk, embed and upsert documents into a Pinecone namespace.
+
+    python ingest.py docs/lifeguard_manuals docs/county_advisories --namespace oceansafe
+
+Chunks are identified by the SHA-256 of their text, so a chunk that is
+already recorded in the manifest is never embedded again. Re-running on a
+changed library only embeds new text and deletes chunks that disappeared
+from the documents that were re-read. It also deletes every chunk of a
+deleted document: one under the given paths that is no longer there, or
+any recorded document whose file no longer exists. The local BM25 index
+(bm25.py) is kept in step with every chunk read, unless --no-lexical is
+passed.
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from bm25 import BM25_INDEX_PATH, BM25Index, namespace_path
+from cache import CACHE_DIR, mark_reindexed
+from config import get_secret
+
+TEXT_MODEL = "text-embedding-ada-002"
+DOC_EXTENSIONS = (".txt", ".md")
+
+
+# ---------------------------
+# Documents and chunks
+# ---------------------------
+def iter_documents(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for name in sorted(filenames):
+                    if name.endswith(DOC_EXTENSIONS):
+                        yield from iter_documents([os.path.join(dirpath, name)])
+        else:
+            with open(path, encoding="utf-8") as f:
+                yield path, f.read()
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def iter_chunks(documents, chunk_size=1000, chunk_overlap=150):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for source, text in documents:
+        for chunk in splitter.split_text(text):
+            yield source, chunk_hash(chunk), chunk
+
+
+# ---------------------------
+# Manifest of indexed chunks
+# ---------------------------
+class Manifest:
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " namespace TEXT NOT NULL, hash TEXT NOT NULL, source TEXT NOT NULL,"
+            " indexed_at REAL NOT NULL, PRIMARY KEY (namespace, hash, source))"
+        )
+        self.conn.commit()
+
+    def indexed_hashes(self, namespace):
+        rows = self.conn.execute("SELECT DISTINCT hash FROM chunks WHERE namespace = ?", (namespace,))
+        return {row[0] for row in rows}
+
+    def sources(self, namespace):
+        rows = self.conn.execute("SELECT DISTINCT source FROM chunks WHERE namespace = ?", (namespace,))
+        return {row[0] for row in rows}
+
+    def hashes_for(self, namespace, source):
+        rows = self.conn.execute("SELECT hash FROM chunks WHERE namespace = ? AND source = ?", (namespace, source))
+        return {row[0] for row in rows}
+
+    def record(self, namespace, pairs):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO chunks (namespace, hash, source, indexed_at) VALUES (?, ?, ?, ?)",
+            [(namespace, h, source, now) for source, h in pairs],
+        )
+        self.conn.commit()
+
+    def orphans(self, namespace, source, hashes):
+        """The hashes no document other than `source` references; only these
+        can leave the index when `source` drops them."""
+        return {h for h in hashes if not self.conn.execute(
+            "SELECT 1 FROM chunks WHERE namespace = ? AND hash = ? AND source != ? LIMIT 1",
+            (namespace, h, source)).fetchone()}
+
+    def forget(self, namespace, source, hashes):
+        self.conn.executemany(
+            "DELETE FROM chunks WHERE namespace = ? AND source = ? AND hash = ?",
+            [(namespace, source, h) for h in hashes],
+        )
+        self.conn.commit()
+
+
+# ---------------------------
+# Embedding and upserting
+# ---------------------------
+def with_retry(fn, attempts=5, base_delay=1.0):
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(base_delay * 2 ** attempt)
+
+
+def embed_batch(client, texts, model=TEXT_MODEL):
+    response = with_retry(lambda: client.embeddings.create(input=texts, model=model))
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+def upsert_batch(index, namespace, vectors, batch_size=100):
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        with_retry(lambda: index.upsert(vectors=batch, namespace=namespace))
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _under(source, paths):
+    source = os.path.normpath(source)
+    for path in paths:
+        path = os.path.normpath(path)
+        if source == path or source.startswith(path.rstrip(os.sep) + os.sep):
+            return True
+    return False
+
+
+def ingest(paths, client, index, manifest, namespace="oceansafe", embed_batch_size=512,
+           upsert_batch_size=100, workers=4, chunk_size=1000, chunk_overlap=150, prune=True, lexical=None):
+    """Returns a stats dict; chunks_per_sec counts every chunk read, including skipped ones.
+    Every chunk read is also added to the BM25Index `lexical`, if given."""
+    start = time.perf_counter()
+    known = manifest.indexed_hashes(namespace)
+    seen_by_source = {}
+    unchanged = []
+    stats = {"chunks": 0, "embedded": 0, "skipped": 0, "deleted": 0}
+
+    def new_chunks():
+        queued = set()
+        for source, h, text in iter_chunks(iter_documents(paths), chunk_size, chunk_overlap):
+            stats["chunks"] += 1
+            seen_by_source.setdefault(source, set()).add(h)
+            if lexical is not None:
+                # a no-op for chunks it already has; backfills ones embedded before it existed
+                lexical.add([h], [text], [{"text": text, "source": source}])
+            if h in known:
+                unchanged.append((source, h))
+                stats["skipped"] += 1
+            elif h in queued:
+                # same text in another document; recorded once its first copy is upserted
+                unchanged.append((source, h))
+                stats["skipped"] += 1
+            else:
+                queued.add(h)
+                yield source, h, text
+
+    def process(batch):
+        embeddings = embed_batch(client, [text for _, _, text in batch])
+        vectors = [
+            {"id": h, "values": values, "metadata": {"text": text, "source": source}}
+            for (source, h, text), values in zip(batch, embeddings)
+        ]
+        upsert_batch(index, namespace, vectors, upsert_batch_size)
+        return batch
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = []
+        for batch in _batches(new_chunks(), embed_batch_size):
+            in_flight.append(pool.submit(process, batch))
+            # keep at most two batches per worker buffered in memory
+            if len(in_flight) >= workers * 2:
+                done = in_flight.pop(0).result()
+                manifest.record(namespace, [(s, h) for s, h, _ in done])
+                stats["embedded"] += len(done)
+        for future in in_flight:
+            done = future.result()
+            manifest.record(namespace, [(s, h) for s, h, _ in done])
+            stats["embedded"] += len(done)
+    manifest.record(namespace, unchanged)
+
+    if prune:
+        # documents that were re-read, plus deleted ones: recorded sources under
+        # `paths` that weren't read, or whose file is gone altogether
+        deleted = {
+            source for source in manifest.sources(namespace) - set(seen_by_source)
+            if _under(source, paths) or not os.path.exists(source)
+        }
+        for source in set(seen_by_source) | deleted:
+            gone = manifest.hashes_for(namespace, source) - seen_by_source.get(source, set())
+            if gone:
+                orphaned = manifest.orphans(namespace, source, gone)
+                if orphaned:
+                    # delete from the index first: if it fails the rows stay, and the next run retries
+                    with_retry(lambda: index.delete(ids=list(orphaned), namespace=namespace))
+                    stats["deleted"] += len(orphaned)
+                    if lexical is not None:
+                        lexical.remove(orphaned)
+                manifest.forget(namespace, source, gone)
+
+    if stats["embedded"] or stats["deleted"]:
+        mark_reindexed(namespace)
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 2)
+    stats["chunks_per_sec"] = round(stats["chunks"] / elapsed, 1) if elapsed else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest documents into the oceansafe index")
+    parser.add_argument("paths", nargs="+", help="files or directories of .txt/.md documents")
+    parser.add_argument("--namespace", default="oceansafe")
+    parser.add_argument("--manifest", default=os.path.join(CACHE_DIR, "ingest-manifest.sqlite3"))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--embed-batch", type=int, default=512)
+    parser.add_argument("--upsert-batch", type=int, default=100)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=150)
+    parser.add_argument("--no-prune", action="store_true", help="keep chunks that vanished from re-read or deleted documents")
+    parser.add_argument("--lexical-root", default=BM25_INDEX_PATH, help="where the BM25 index is kept")
+    parser.add_argument("--no-lexical", action="store_true", help="don't update the BM25 index")
+    args = parser.parse_args()
+
+    import openai
+    from pinecone import Pinecone
+
+    client = openai.OpenAI(api_key=get_secret("OPENAI_API_KEY"))
+    index = Pinecone(api_key=get_secret("PINECONE_API_KEY")).Index(host=get_secret("INDEX_HOST"))
+    lexical_path = namespace_path(args.lexical_root, args.namespace)
+    lexical = None if args.no_lexical else BM25Index.open(lexical_path)
+    stats = ingest(
+        args.paths, client, index, Manifest(args.manifest),
+        namespace=args.namespace,
+        embed_batch_size=args.embed_batch,
+        upsert_batch_size=args.upsert_batch,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        prune=not args.no_prune,
+        lexical=lexical,
+    )
+    if lexical is not None:
+        lexical.save(lexical_path)
+    print(
+        f"{stats['chunks']} chunks ({stats['embedded']} embedded, {stats['skipped']} unchanged, "
+        f"{stats['deleted']} deleted) in {stats['seconds']}s - {stats['chunks_per_sec']} chunks/sec"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Bounded per-session conversation memory for Tidebot.
+
+A session keeps only its last WINDOW_TURNS turns in memory. Older turns
+are folded into a rolling summary, one short line per turn with the oldest
+dropped past SUMMARY_TOKEN_BUDGET, and archived to SQLite so the page can
+show them a page at a time. Memory and render cost per rerun stay flat
+however long the conversation gets.
+
+Follow-ups ("is it crowded?", "and tomorrow?", "are there jellyfish
+there?") that name no beach or place of their own are rewritten into
+standalone retrieval queries from the current topic, the last standalone
+question. The rewrite is only used for retrieval: the model is always
+asked what the user typed, and only follow-ups get a bounded note of the
+earlier conversation added to their prompt.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+
+from bm25 import tokenize
+from cache import CACHE_DIR
+from context import count_tokens, truncate_tokens
+
+CHAT_HISTORY_DB = os.environ.get("CHAT_HISTORY_DB", os.path.join(CACHE_DIR, "chat_history.sqlite3"))
+WINDOW_TURNS = 6
+SUMMARY_TOKEN_BUDGET = 160
+MEMORY_TOKEN_BUDGET = 240
+ANSWER_SNIPPET_TOKENS = 40
+HISTORY_TTL = 7 * 24 * 3600
+HISTORY_PAGE_SIZE = 10
+
+FOLLOW_UP_CUES = ("and ", "what about", "how about", "also ", "what if", "same ", "then ")
+# cues that usually bring in a new subject ("what about jellyfish?") rather than qualify the last one
+TOPIC_CUES = ("what about", "how about", "what if")
+PRONOUNS = frozenset({"it", "its", "that", "this", "they", "them", "those", "these"})
+# a question becomes the topic when it names a place or has this many content words
+TOPIC_MIN_TERMS = 2
+SMALL_TALK = frozenset({
+    "thank", "thanks", "thx", "ok", "okay", "great", "cool", "nice", "awesome", "perfect", "good", "sure",
+    "yes", "yeah", "yep", "hi", "hello", "hey", "bye", "got", "sound", "lol", "wow",
+})
+_BEACH_SUFFIXES = (" state beach", " beach", " pier")
+_TRAILING_PLACE = re.compile(r"\b(?:there|here)\s*([?.!]*)\s*$", re.IGNORECASE)
+# a capitalized word after the first one ("is it safe in Hawaii?")
+_PLACE = re.compile(r"(?<=\s)[A-Z][a-z]+")
+
+
+# ---------------------------
+# Archive of older turns
+# ---------------------------
+class HistoryStore:
+    """Messages that have left a session's window, in one SQLite file.
+    Rows older than `ttl` are purged on open. If the database cannot be
+    opened, nothing is archived and pages come back empty."""
+
+    def __init__(self, path=CHAT_HISTORY_DB, ttl=HISTORY_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = self._open()
+
+    def _open(self):
+        try:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " session TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL,"
+                " created REAL NOT NULL, PRIMARY KEY (session, seq))"
+            )
+            conn.execute("DELETE FROM messages WHERE created < ?", (time.time() - self.ttl,))
+            conn.commit()
+            return conn
+        except (sqlite3.Error, OSError):
+            return None
+
+    def append(self, session, rows):
+        """rows: (seq, role, content) tuples."""
+        if self._conn is None:
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO messages (session, seq, role, content, created) VALUES (?, ?, ?, ?, ?)",
+                    [(session, seq, role, content, now) for seq, role, content in rows],
+                )
+                self._conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def page(self, session, page, page_size=HISTORY_PAGE_SIZE):
+        """[(role, content)] in chronological order; page 0 is the newest."""
+        if self._conn is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE session = ? ORDER BY seq DESC LIMIT ? OFFSET ?",
+                (session, page_size, page * page_size),
+            ).fetchall()
+        return rows[::-1]
+
+    def delete(self, session):
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session = ?", (session,))
+            self._conn.commit()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
+
+
+# ---------------------------
+# Beaches mentioned in text
+# ---------------------------
+def beach_aliases(names):
+    """{lower-case alias: name}, with and without a trailing "Beach"/"Pier"."""
+    aliases = {}
+    for name in names:
+        lowered = name.lower()
+        aliases[lowered] = name
+        for suffix in _BEACH_SUFFIXES:
+            if lowered.endswith(suffix) and len(lowered) > len(suffix):
+                aliases.setdefault(lowered[:-len(suffix)], name)
+                break
+    return aliases
+
+
+def _alias_pattern(aliases):
+    if not aliases:
+        return None
+    alternatives = sorted(aliases, key=len, reverse=True)
+    return re.compile(r"\b(" + "|".join(re.escape(a) for a in alternatives) + r")\b", re.IGNORECASE)
+
+
+# ---------------------------
+# Memory
+# ---------------------------
+Rewrite = namedtuple("Rewrite", "query follow_up topic")
+
+
+def _tidy(text):
+    return re.sub(r"\s+([?.!,])", r"\1", " ".join(text.split()))
+
+
+class ConversationMemory:
+    """One session's conversation: the recent window, a rolling summary of
+    what came before it and the state used to rewrite follow-ups."""
+
+    def __init__(self, beaches=(), session_id=None, window_turns=WINDOW_TURNS, store=None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.turns = deque()
+        self.window_turns = window_turns
+        self.summary = deque()
+        self.summary_tokens = 0
+        self.archived = 0
+        self.total_turns = 0
+        self.topic = None
+        self.store = store
+        self._aliases = beach_aliases(beaches)
+        self._pattern = _alias_pattern(self._aliases)
+
+    def beaches_in(self, text):
+        if self._pattern is None:
+            return []
+        return list(dict.fromkeys(self._aliases[m.lower()] for m in self._pattern.findall(text)))
+
+    def names_place(self, text):
+        """Whether `text` names a catalog beach or any other capitalized place."""
+        return bool(self.beaches_in(text)) or bool(_PLACE.search(text))
+
+    def has_content(self, text):
+        """Whether `text` can stand as a topic: it names a place or has
+        TOPIC_MIN_TERMS words beyond stopwords and small talk."""
+        terms = [term for term in tokenize(text) if term not in SMALL_TALK]
+        return self.names_place(text) or len(terms) >= TOPIC_MIN_TERMS
+
+    def rewrite(self, question):
+        """A Rewrite of `question`: the standalone retrieval query, whether
+        it was a follow-up, and the topic later follow-ups build on.
+
+        Only questions that refer back (a pronoun, "there", or an elliptical
+        "and ..."/"what about ...") and name no beach or place of their own
+        are follow-ups; everything else is searched for as typed. Small
+        talk ("thanks", "ok great") keeps the current topic."""
+        question = question.strip()
+        standalone = Rewrite(question, False, question if self.has_content(question) else self.topic)
+        if self.topic is None:
+            return standalone
+        lowered = " ".join(question.lower().split())
+        cue = next((c for c in FOLLOW_UP_CUES if lowered.startswith(c)), None)
+        there = _TRAILING_PLACE.search(question)
+        refers_back = bool(set(re.findall(r"[a-z]+", lowered)) & PRONOUNS) or bool(there)
+        if not (cue or refers_back) or self.names_place(question):
+            return standalone
+        beaches = self.beaches_in(self.topic)
+        if there and beaches:
+            # "are jellyfish common there?" points at the beach being discussed
+            query = _TRAILING_PLACE.sub(rf"at {beaches[0]}\1", question)
+            return Rewrite(query, True, query)
+        rest = _tidy(question[len(cue):] if cue else question)
+        if not tokenize(rest):
+            return Rewrite(self.topic, True, self.topic)
+        if cue in TOPIC_CUES:
+            query = f"{rest.rstrip('?.! ')} at {beaches[0]}?" if beaches else rest
+            return Rewrite(query, True, query)
+        return Rewrite(f"{self.topic.rstrip('?.! ')}: {rest}", True, self.topic)
+
+    def prompt_question(self, question, follow_up):
+        """The question sent to the model: what the user typed, plus, for
+        follow-ups, a note of the conversation so far within
+        MEMORY_TOKEN_BUDGET tokens."""
+        if not follow_up:
+            return question
+        lines, used = [], 0
+        recent = [self._turn_line(turn) for turn in self.turns]
+        for line in reversed(list(self.summary) + recent):
+            tokens = count_tokens(line)
+            if used + tokens > MEMORY_TOKEN_BUDGET:
+                break
+            lines.append(line)
+            used += tokens
+        if not lines:
+            return question
+        return f"{question}\n\nEarlier in this conversation:\n" + "\n".join(reversed(lines))
+
+    @staticmethod
+    def _turn_line(turn):
+        answer = turn["answer"].split("\n")[0]
+        return f"Q: {turn['query']} A: {truncate_tokens(answer, ANSWER_SNIPPET_TOKENS)}"
+
+    def record(self, question, rewrite, answer, timings=None):
+        """Add a finished turn, folding the oldest one out of the window."""
+        self.turns.append({"question": question, "query": rewrite.query, "answer": answer,
+                           "timings": timings, "seq": self.total_turns})
+        self.total_turns += 1
+        self.topic = rewrite.topic
+        while len(self.turns) > self.window_turns:
+            self._fold(self.turns.popleft())
+
+    def _fold(self, turn):
+        line = self._turn_line(turn)
+        self.summary.append(line)
+        self.summary_tokens += count_tokens(line)
+        while self.summary_tokens > SUMMARY_TOKEN_BUDGET and len(self.summary) > 1:
+            self.summary_tokens -= count_tokens(self.summary.popleft())
+        if self.store is not None:
+            self.store.append(self.session_id, [
+                (turn["seq"] * 2, "user", turn["question"]),
+                (turn["seq"] * 2 + 1, "assistant", turn["answer"]),
+            ])
+        self.archived += 2
+
+    def history_page(self, page, page_size=HISTORY_PAGE_SIZE):
+        """Archived (role, content) messages; page 0 is the most recent."""
+        if self.store is None:
+            return []
+        return self.store.page(self.session_id, page, page_size)
+
+    def clear(self):
+        if self.store is not None:
+            self.store.delete(self.session_id)
+        self.turns.clear()
+        self.summary.clear()
+        self.summary_tokens = 0
+        self.archived = 0
+        self.total_turns = 0
+        self.topic = None
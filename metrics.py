@@ -0,0 +1,283 @@
+"""In-process latency, token and retrieval metrics.
+
+Stages are timed with ``span`` and other values recorded with ``observe``
+or ``inc``. Each metric keeps a rolling window of recent samples for
+p50/p95/p99 plus all-time count and sum. Point-in-time values owned by
+other modules (cache sizes, hit rates) are read at export time from
+collectors added with ``register_gauges``. ``prometheus_text()`` renders
+everything in the Prometheus text format. ``start_exporter()`` serves that
+on METRICS_PORT and/or rewrites METRICS_FILE periodically. The endpoint
+listens on localhost only unless METRICS_HOST says otherwise (e.g.
+0.0.0.0 for a scraper on another machine).
+
+Set OCEANSAFE_METRICS=0 to turn recording off. ``span`` then hands back a
+shared no-op object and nothing is timed, locked or stored.
+
+A ``trace`` dict can be passed to ``span`` and ``observe`` to also collect
+one request's breakdown (Tidebot shows it for the last turn).
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.environ.get("OCEANSAFE_METRICS", "1") != "0"
+METRICS_PORT = os.environ.get("METRICS_PORT")
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_FILE = os.environ.get("METRICS_FILE")
+METRICS_FILE_INTERVAL = 15
+WINDOW = 2048
+PREFIX = "oceansafe_"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+# ---------------------------
+# Registry
+# ---------------------------
+class Summary:
+    def __init__(self, window=WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def snapshot(self):
+        samples = sorted(self.samples)
+        out = {"count": self.count, "sum": self.total}
+        for q in QUANTILES:
+            out[f"p{round(q * 100)}"] = samples[min(len(samples) - 1, int(len(samples) * q))] if samples else None
+        return out
+
+
+class Registry:
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._summaries = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, labels=()):
+        with self._lock:
+            summary = self._summaries.get((name, labels))
+            if summary is None:
+                summary = self._summaries[(name, labels)] = Summary(self.window)
+            summary.add(value)
+
+    def inc(self, name, value=1, labels=()):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + value
+
+    def snapshot(self):
+        """{name: {label string: stats}} for summaries and counters alike."""
+        with self._lock:
+            summaries = [(k, s.snapshot()) for k, s in self._summaries.items()]
+            counters = list(self._counters.items())
+        out = {}
+        for (name, labels), stats in summaries:
+            out.setdefault(name, {})[_label_str(labels)] = stats
+        for (name, labels), value in counters:
+            out.setdefault(name, {})[_label_str(labels)] = value
+        return out
+
+    def summaries(self, name):
+        """{labels: stats} for one summary metric."""
+        with self._lock:
+            return {labels: s.snapshot() for (n, labels), s in self._summaries.items() if n == name}
+
+    def prometheus_text(self, gauges=()):
+        with self._lock:
+            summaries = sorted((k, s.snapshot()) for k, s in self._summaries.items())
+            counters = sorted(self._counters.items())
+        lines, typed = [], set()
+        for (name, labels), stats in summaries:
+            metric = PREFIX + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} summary")
+                typed.add(metric)
+            for q in QUANTILES:
+                value = stats[f"p{round(q * 100)}"]
+                if value is not None:
+                    lines.append(f"{metric}{_label_str(labels + (('quantile', str(q)),))} {value:.6g}")
+            lines.append(f"{metric}_sum{_label_str(labels)} {stats['sum']:.6g}")
+            lines.append(f"{metric}_count{_label_str(labels)} {stats['count']}")
+        for (name, labels), value in counters:
+            metric = PREFIX + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_label_str(labels)} {value}")
+        for name, labels, value in sorted(gauges):
+            metric = PREFIX + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} gauge")
+                typed.add(metric)
+            lines.append(f"{metric}{_label_str(labels)} {value:.6g}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._summaries.clear()
+            self._counters.clear()
+
+
+def _label_str(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+registry = Registry()
+_collectors = {}
+
+
+def register_gauges(name, collect):
+    """Export what `collect()` returns, [(metric, {label: value}, number)],
+    as gauges on every scrape. Registering a name again replaces it."""
+    _collectors[name] = collect
+
+
+def gauges():
+    """[(metric, labels, value)] from every collector; None values are skipped."""
+    out = []
+    for collect in list(_collectors.values()):
+        for name, labels, value in collect():
+            if value is not None:
+                out.append((name, tuple(sorted(labels.items())), float(value)))
+    return out
+
+
+# ---------------------------
+# Recording
+# ---------------------------
+class _Span:
+    __slots__ = ("stage", "trace", "start", "elapsed")
+
+    def __init__(self, stage, trace):
+        self.stage = stage
+        self.trace = trace
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        registry.observe("stage_seconds", self.elapsed, (("stage", self.stage),))
+        if self.trace is not None:
+            stages = self.trace.setdefault("stages", {})
+            stages[self.stage] = stages.get(self.stage, 0.0) + self.elapsed
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+    elapsed = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(stage, trace=None):
+    """Time a block as `stage_seconds{stage=...}` (and into `trace["stages"]`)."""
+    return _Span(stage, trace) if ENABLED else _NULL_SPAN
+
+
+def observe(name, value, trace=None, **labels):
+    if not ENABLED:
+        return
+    registry.observe(name, value, tuple(sorted(labels.items())))
+    if trace is not None:
+        trace[name] = value
+
+
+def inc(name, value=1, **labels):
+    if ENABLED:
+        registry.inc(name, value, tuple(sorted(labels.items())))
+
+
+def count_tokens(text, model):
+    """Tokens in `text` for `model`, or None when tiktoken (or its encoding
+    file, which it downloads on first use) is unavailable."""
+    if not ENABLED:
+        return None
+    from context import encoding_for
+
+    encoding = encoding_for(model)
+    if encoding is None:
+        return None
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def snapshot():
+    return registry.snapshot()
+
+
+def stage_stats():
+    """{stage: {"count", "sum", "p50", "p95", "p99"}} for every timed stage."""
+    return {dict(labels)["stage"]: stats for labels, stats in registry.summaries("stage_seconds").items()}
+
+
+def prometheus_text():
+    return registry.prometheus_text(gauges())
+
+
+# ---------------------------
+# Export
+# ---------------------------
+def write_metrics(path):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_exporter(port=METRICS_PORT, path=METRICS_FILE, host=METRICS_HOST):
+    """Serve /metrics on `host`:`port` and/or rewrite `path` every few seconds.
+    Safe to call on every rerun; only the first call starts anything."""
+    global _exporter_started
+    with _exporter_lock:
+        if _exporter_started or not ENABLED or not (port or path):
+            return
+        _exporter_started = True
+    if port:
+        server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    if path:
+        def loop():
+            while True:
+                write_metrics(path)
+                time.sleep(METRICS_FILE_INTERVAL)
+        threading.Thread(target=loop, name="metrics-file", daemon=True).start()
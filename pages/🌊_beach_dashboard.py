@@ -1,433 +1,300 @@
 import streamlit as st
 import pandas as pd
-import requests
-import json
 import plotly.express as px
-import streamlit.components.v1 as components
+import metrics
+from catalog import load_catalog
+from conditions import TIDE_TIMEZONE, fetch_all, get_tide_data, get_weather_data, tide_day
+from hazard_map import hazard_map, map_event, map_location, map_view
+from hazards import get_store
+from prefetch import PREFETCH_INTERVAL, load_snapshot, start_prefetcher, tide_view
 
 # ---------------------------
 # API Keys from Secrets
 # ---------------------------
-OPENWEATHER_API_KEY = st.secrets["OPENWEATHER_API_KEY"]
 MAPBOX_TOKEN = st.secrets["MAPBOX_TOKEN"]
 
-# ---------------------------
-# Weather Data
-# ---------------------------
-def get_weather_data(lat, lon):
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=imperial"
-    res = requests.get(url)
-    data = res.json()
-    return {
-        "Temperature (°F)": round(data["main"]["temp"], 2),
-        "Weather": data["weather"][0]["description"].title(),
-        "UV Index": "Check local UV forecast"
-    }
+metrics.start_exporter()
 
 # ---------------------------
-# Tide Data
+# Beach Data
 # ---------------------------
-def get_tide_data(station_id="9410840"):
-    url = "https://api.tidesandcurrents.noaa.gov/api/prod/datagetter"
-    params = {
-        "station": station_id,
-        "product": "predictions",
-        "datum": "MLLW",
-        "time_zone": "lst_ldt",
-        "units": "english",
-        "interval": "h",
-        "format": "json",
-        "date": "today"
-    }
-    try:
-        res = requests.get(url, params=params, timeout=10)
-        data = res.json()
-        if "predictions" in data:
-            df = pd.DataFrame(data['predictions'])
-            df['t'] = pd.to_datetime(df['t'])
-            df.rename(columns={'v': 'Tide (ft)'}, inplace=True)
-            df['Tide (ft)'] = pd.to_numeric(df['Tide (ft)'], errors='coerce').round(2)
-            return df
-        else:
-            st.warning(f"⚠ NOAA API returned no predictions for station {station_id}.")
-            return pd.DataFrame(columns=['t', 'Tide (ft)'])
-    except Exception as e:
-        st.error(f"Failed to fetch tide data: {e}")
-        return pd.DataFrame(columns=['t', 'Tide (ft)'])
+# loaded once per process from data/beaches.json; stations are the nearest
+# NOAA tide station unless a beach names one
+catalog = load_catalog()
+beaches = catalog.beaches
+
+# weather and tides are refreshed in the background and rendered from the
+# latest snapshot; upstream is only called when it is stale or missing a beach
+start_prefetcher(beaches)
 
 # ---------------------------
-# Tide Summary
+# Streamlit Page Setup
 # ---------------------------
-def summarize_tides(tide_df):
-    if tide_df.empty:
-        return pd.DataFrame()
-
-    df = tide_df.copy()
-    df['diff'] = df['Tide (ft)'].diff().fillna(0)
-
-    high_tides = df[(df['diff'] > 0) & (df['diff'].shift(-1) < 0)]
-    low_tides = df[(df['diff'] < 0) & (df['diff'].shift(-1) > 0)]
-
-    summary = pd.concat([
-        pd.DataFrame({
-            "Time": high_tides['t'],
-            "Tide (ft)": high_tides['Tide (ft)'],
-            "Type": "High Tide"
-        }),
-        pd.DataFrame({
-            "Time": low_tides['t'],
-            "Tide (ft)": low_tides['Tide (ft)'],
-            "Type": "Low Tide"
-        })
-    ]).sort_values("Time")
-
-    summary['Time'] = summary['Time'].dt.strftime("%I:%M %p")
-    summary['Tide (ft)'] = summary['Tide (ft)'].round(2)
-    return summary
+st.title("🌊 California Beach Safety Dashboard")
 
 # ---------------------------
-# Beach Data
+# All Beaches Overview
 # ---------------------------
-beaches = {
-    "Santa Monica Pier": {
-        "lat": 34.0100, "lon": -118.4950, "station": "9410840",
-        "image": "https://images.squarespace-cdn.com/content/v1/5e0e65adcd39ed279a0402fd/1627422658456-7QKPXTNQ34W2OMBTESCJ/1.jpg?format=2500w",
-        "description": "An iconic landmark offering stunning ocean views, amusement rides, and family-friendly attractions.",
-        "fun_facts": [
-            "Opened in 1909.",
-            "Home to Pacific Park, the only amusement park on a California pier.",
-            "Featured in many films and TV shows."
-        ],
-        "visitor_info": {
-            "Dogs Allowed": "No",
-            "Parking": "Paid; free 8 PM–6 AM",
-            "Beach Hours": "6 AM – 10 PM",
-            "Nearby Amenities": "Restrooms, Food, Lifeguard Station"
-        }
-    },
-    "Venice Beach": {
-        "lat": 33.9850, "lon": -118.4695, "station": "9410840",
-        "image": "https://drupal-prod.visitcalifornia.com/sites/default/files/styles/fluid_1920/public/VC_California101_VeniceBeach_Stock_RF_638340372_1280x640.jpg.webp?itok=emtWYsp9",
-        "description": "Known for its bohemian spirit, street performers, and bustling boardwalk.",
-        "fun_facts": [
-            "Home to Muscle Beach outdoor gym.",
-            "Venice Canals inspired by Venice, Italy.",
-            "Popular filming location for music videos."
-        ],
-        "visitor_info": {
-            "Dogs Allowed": "Yes, on leash",
-            "Parking": "Paid; free before 8 AM",
-            "Beach Hours": "6 AM – 10 PM",
-            "Nearby Amenities": "Skate Park, Food, Restrooms"
-        }
-    },
-    "Malibu Surfrider Beach": {
-        "lat": 34.0360, "lon": -118.6880, "station": "9410840",
-        "image": "https://www.worldbeachguide.com/photos/large/malibu-beach-pier-lagoon.jpg",
-        "description": "Famous for perfect waves and surf culture.",
-        "fun_facts": [
-            "Known as 'The First Point' by surfers.",
-            "Part of Malibu Lagoon State Beach.",
-            "Hosts surf competitions."
-        ],
-        "visitor_info": {
-            "Dogs Allowed": "No",
-            "Parking": "Free parking lot, first-come-first-serve",
-            "Beach Hours": "Sunrise to Sunset",
-            "Nearby Amenities": "Lifeguard Station, Restrooms"
-        }
-    },
-    "Huntington Beach": {
-        "lat": 33.6595, "lon": -117.9988, "station": "9411270",
-        "image": "https://www.redfin.com/blog/wp-content/uploads/2023/12/GettyImages-1812336731.jpg",
-        "description": "Also known as Surf City USA, world-famous for surfing.",
-        "fun_facts": [
-            "Hosts the US Open of Surfing.",
-            "Pier extends 1,850 feet into the ocean.",
-            "Great for volleyball and beach events."
-        ],
-        "visitor_info": {
-            "Dogs Allowed": "No",
-            "Parking": "Paid, free 8 PM–6 AM",
-            "Beach Hours": "6 AM – 10 PM",
-            "Nearby Amenities": "Lifeguard Station, Food, Restrooms"
+view = st.radio("View:", ["Single beach", "All beaches overview"], horizontal=True)
+
+today = tide_day()
+
+
+def current_snapshot():
+    snapshot = load_snapshot()
+    return snapshot if snapshot is not None and snapshot.is_fresh(tide_day()) else None
+
+
+if view == "All beaches overview":
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        overview = {
+            name: {"weather": snapshot.weather.get(name), "error": snapshot.errors.get(name),
+                   "tides": snapshot.tide_view(beach["station"])}
+            for name, beach in beaches.items()
         }
-    },
-    "Newport Beach": {
-        "lat": 33.6189, "lon": -117.9290, "station": "9411340",
-        "image": "https://static.independent.co.uk/2023/07/27/12/iStock-1210240213%20%281%29.jpg",
-        "description": "Offers wide sandy beaches and a bustling harbor.",
-        "fun_facts": [
-            "Famous for Newport Harbor boating.",
-            "Home to Balboa Fun Zone amusement area.",
-            "Popular for whale watching."
-        ],
-        "visitor_info": {
-            "Dogs Allowed": "Yes, on leash",
-            "Parking": "Paid parking",
-            "Beach Hours": "6 AM – 10 PM",
-            "Nearby Amenities": "Lifeguard Station, Food, Restrooms"
+    else:
+        overview = {
+            name: {**result, "tides": tide_view(result["tides"], today) if result["tides"] is not None else None}
+            for name, result in fetch_all(beaches).items()
         }
-    },
-    "Laguna Beach": {
-        "lat": 33.5427, "lon": -117.7854, "station": "9411340",
-        "image": "https://cdn.britannica.com/37/189937-050-478BECD3/Night-view-Laguna-Beach-California.jpg",
-        "description": "Known for art galleries, tide pools, and dramatic cliffs.",
-        "fun_facts": [
-            "Home to the annual Pageant of the Masters.",
-            "Famous for tide pools and snorkeling.",
-            "Coastal cliffs provide scenic viewpoints."
-        ],
-        "visitor_info": {
-            "Dogs Allowed": "Yes, on leash",
-            "Parking": "Paid parking",
-            "Beach Hours": "6 AM – 10 PM",
-            "Nearby Amenities": "Restrooms, Food, Lifeguard Station"
+    rows = []
+    tide_frames = []
+    for name, result in overview.items():
+        weather = result["weather"] or {}
+        row = {
+            "Beach": name,
+            "Temperature (°F)": weather.get("Temperature (°F)", "–"),
+            "Weather": weather.get("Weather", "Unavailable"),
+            "Next High Tide": "–",
+            "Next Low Tide": "–",
+            "NOAA Station": beaches[name]["station"],
         }
-    }
-}
-
-# ---------------------------
-# Streamlit Page Setup
-# ---------------------------
-st.title("🌊 California Beach Safety Dashboard")
-
-if "hazard_reports" not in st.session_state:
-    st.session_state["hazard_reports"] = []
+        if result["tides"] is not None and not result["tides"][1].empty:
+            summary, chart = result["tides"]
+            for tide_type, column in (("High Tide", "Next High Tide"), ("Low Tide", "Next Low Tide")):
+                points = summary[summary["Type"] == tide_type]
+                if not points.empty:
+                    row[column] = f"{points.iloc[0]['Time']} ({points.iloc[0]['Tide (ft)']} ft)"
+            tide_frames.append(chart.assign(Beach=name))
+        rows.append(row)
+        if result["error"]:
+            st.warning(f"⚠ {name}: {result['error']}")
+
+    st.subheader("🏖️ Conditions at a Glance")
+    st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+
+    if tide_frames:
+        st.subheader("🌊 Tides Today")
+        fig = px.line(
+            pd.concat(tide_frames),
+            x='t',
+            y='Tide (ft)',
+            facet_col='Beach',
+            facet_col_wrap=3,
+            height=500
+        )
+        fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
+        fig.update_layout(template="plotly_white", showlegend=False)
+        fig.update_xaxes(title_text="", tickformat="%I %p")
+        fig.update_yaxes(title_text="ft")
+        st.plotly_chart(fig, use_container_width=True)
+    st.stop()
 
 # ---------------------------
 # Beach Selection
 # ---------------------------
-selected_beach = st.selectbox("Select Beach:", list(beaches.keys()))
+# Each section below is a fragment: an interaction inside one reruns just
+# that section. Changing the beach (or the view) reruns the whole page.
+selected_beach = st.selectbox("Select Beach:", catalog.names, key="selected_beach")
 beach_coords = beaches[selected_beach]
 
+
 # ---------------------------
 # Beach Image and Description
 # ---------------------------
-st.image(beach_coords["image"], use_column_width=True, caption=selected_beach)
-st.subheader(f"About {selected_beach}")
-st.write(beach_coords["description"])
+@st.fragment
+def beach_info(name, beach):
+    with metrics.span("dashboard_info"):
+        if beach.get("image"):
+            st.image(beach["image"], use_column_width=True, caption=name)
+        st.subheader(f"About {name}")
+        if beach.get("description"):
+            st.write(beach["description"])
+
+        if beach.get("fun_facts"):
+            with st.expander("🌟 Fun Facts"):
+                for fact in beach["fun_facts"]:
+                    st.markdown(f"- {fact}")
+
+        if beach.get("visitor_info"):
+            with st.expander("📍 Visitor Information"):
+                for key, value in beach["visitor_info"].items():
+                    st.markdown(f"**{key}:** {value}")
 
-with st.expander("🌟 Fun Facts"):
-    for fact in beach_coords["fun_facts"]:
-        st.markdown(f"- {fact}")
 
-with st.expander("📍 Visitor Information"):
-    for key, value in beach_coords["visitor_info"].items():
-        st.markdown(f"**{key}:** {value}")
+beach_info(selected_beach, beach_coords)
+
 
 # ---------------------------
 # Weather Metrics
 # ---------------------------
-st.subheader(f"🏖️ {selected_beach} Overview")
-weather = get_weather_data(beach_coords["lat"], beach_coords["lon"])
-cols = st.columns(3)
-cols[0].metric("🌡 Temperature", f"{weather['Temperature (°F)']} °F")
-cols[1].metric("☀ Weather", weather["Weather"])
-cols[2].metric("🕶 UV Index", weather["UV Index"])
+# re-read on its own as new snapshots are published
+@st.fragment(run_every=PREFETCH_INTERVAL)
+def weather_metrics(name, beach):
+    with metrics.span("dashboard_weather"):
+        st.subheader(f"🏖️ {name} Overview")
+        snapshot = current_snapshot()
+        weather = snapshot.weather.get(name) if snapshot is not None else None
+        if weather is None:
+            try:
+                weather = get_weather_data(beach["lat"], beach["lon"])
+            except Exception as e:
+                st.warning(f"⚠ Weather data is unavailable right now: {e}")
+                weather = {"Temperature (°F)": "–", "Weather": "Unavailable", "UV Index": "Check local UV forecast"}
+        cols = st.columns(3)
+        cols[0].metric("🌡 Temperature", f"{weather['Temperature (°F)']} °F")
+        cols[1].metric("☀ Weather", weather["Weather"])
+        cols[2].metric("🕶 UV Index", weather["UV Index"])
+
+
+weather_metrics(selected_beach, beach_coords)
+
 
 # ---------------------------
 # Tide Summary and Chart
 # ---------------------------
-st.subheader("🌊 Tide Forecast (Next 24 Hours)")
-tide_df = get_tide_data(beach_coords["station"])
-
-if not tide_df.empty:
-    tide_summary = summarize_tides(tide_df)
-    
-    if not tide_summary.empty:
-        st.markdown("**🕒 Upcoming High and Low Tides**")
-        st.table(tide_summary)
-    else:
-        st.info("No high/low tide points found for today.")
-    
-    tide_df['Tide (ft)'] = tide_df['Tide (ft)'].round(2)
-    
-    with st.expander("📈 Show Tide Graph"):
-        fig = px.line(
-            tide_df.head(24),
-            x='t',
-            y='Tide (ft)',
-            title="Tide Levels - Next 24 Hours",
-            markers=True
-        )
-        fig.update_layout(
-            xaxis_title="Time",
-            yaxis_title="Tide Height (ft)",
-            xaxis_tickformat="%I:%M %p",
-            template="plotly_white",
-            showlegend=False
-        )
-        st.plotly_chart(fig, use_container_width=True)
-else:
-    st.info("No tide data available for this beach.")
+@st.fragment
+def tide_panel(beach):
+    with metrics.span("dashboard_tides"):
+        st.subheader("🌊 Tide Forecast (Next 24 Hours)")
+        snapshot = current_snapshot()
+        tides = snapshot.tide_view(beach["station"]) if snapshot is not None else None
+        if tides is None:
+            try:
+                tides = tide_view(get_tide_data(beach["station"]), tide_day())
+            except LookupError as e:
+                st.warning(f"⚠ {e}")
+                tides = pd.DataFrame(), pd.DataFrame(columns=['t', 'Tide (ft)'])
+            except Exception as e:
+                st.error(f"Failed to fetch tide data: {e}")
+                tides = pd.DataFrame(), pd.DataFrame(columns=['t', 'Tide (ft)'])
+        tide_summary, tide_df = tides
+
+        if tide_df.empty:
+            st.info("No tide data available for this beach.")
+            return
+        if not tide_summary.empty:
+            st.markdown("**🕒 Upcoming High and Low Tides**")
+            st.table(tide_summary)
+        else:
+            st.info("No high/low tide points found for today.")
+
+        with st.expander("📈 Show Tide Graph"):
+            fig = px.line(
+                tide_df,
+                x='t',
+                y='Tide (ft)',
+                title="Tide Levels - Next 24 Hours"
+            )
+            fig.update_layout(
+                xaxis_title="Time",
+                yaxis_title="Tide Height (ft)",
+                xaxis_tickformat="%I:%M %p",
+                template="plotly_white",
+                showlegend=False
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+
+tide_panel(beach_coords)
 
-# ---------------------------
-# Hazard Reporting Section
-# ---------------------------
-st.subheader("📢 Report a Hazard")
-st.markdown(
-    "Click anywhere on the map to report a hazard directly. "
-    "You can enter types like Jellyfish, Broken glass, High surf, or Trash."
-)
 
 # ---------------------------
-# Map Section
-# ---------------------------
-# ---------------------------
-# Map Section
+# Hazards, Map and Nearby Beaches
 # ---------------------------
-hazard_data_json = json.dumps(st.session_state["hazard_reports"])
-show_directions = st.checkbox("Direction to Beach from Current Location", key="directions_toggle")
-
-components.html(f"""
-<head>
-<link href='https://api.mapbox.com/mapbox-gl-js/v1.12.0/mapbox-gl.css' rel='stylesheet' />
-<script src='https://api.mapbox.com/mapbox-gl-js/v1.12.0/mapbox-gl.js'></script>
-<script src='https://api.mapbox.com/mapbox-gl-js/plugins/mapbox-gl-directions/v4.1.0/mapbox-gl-directions.js'></script>
-<link rel='stylesheet' href='https://api.mapbox.com/mapbox-gl-js/plugins/mapbox-gl-directions/v4.1.0/mapbox-gl-directions.css' />
-</head>
-<body>
-<div id='map' style='width:100%; height:650px;'></div>
-<script>
-mapboxgl.accessToken = '{MAPBOX_TOKEN}';
-
-// helper to compute bounds from an array of [lng,lat] coords
-function coordsToBounds(coords){{
-    if(!coords || coords.length === 0) return null;
-    var minLng = coords[0][0], minLat = coords[0][1], maxLng = coords[0][0], maxLat = coords[0][1];
-    for(var i=1;i<coords.length;i++){{
-        var c = coords[i];
-        if(c[0] < minLng) minLng = c[0];
-        if(c[0] > maxLng) maxLng = c[0];
-        if(c[1] < minLat) minLat = c[1];
-        if(c[1] > maxLat) maxLat = c[1];
-    }}
-    return [[minLng, minLat], [maxLng, maxLat]];
-}}
-
-// request location and initialize map with it (falls back to beach coords)
-navigator.geolocation.getCurrentPosition(successLocation, errorLocation, {{ enableHighAccuracy: true, timeout: 10000 }});
-
-function successLocation(position) {{
-    const userCenter = [position.coords.longitude, position.coords.latitude];
-    setupMap(userCenter, true);
-}}
-
-function errorLocation() {{
-    setupMap([{beach_coords['lon']}, {beach_coords['lat']}], false);
-}}
-
-function setupMap(initialCenter, hasGeolocation) {{
-    const map = new mapboxgl.Map({{
-        container: 'map',
-        style: 'mapbox://styles/mapbox/streets-v11',
-        center: initialCenter,
-        zoom: 14
-    }});
-
-    const nav = new mapboxgl.NavigationControl();
-    map.addControl(nav);
-
-    // user marker (blue)
-    const userMarker = new mapboxgl.Marker({{ color: 'blue' }})
-        .setLngLat(initialCenter)
-        .addTo(map);
-
-    // Add hazard markers from Python session_state
-    const hazards = {hazard_data_json};
-    hazards.forEach(h => {{
-        if (h.beach == "{selected_beach}") {{
-            new mapboxgl.Marker({{ color: 'orange' }})
-            .setLngLat([h.lon, h.lat])
-            .setPopup(new mapboxgl.Popup().setText(h.hazard))
-            .addTo(map);
-        }}
-    }});
-
-    // update user marker live, update directions origin if directions are active
-    navigator.geolocation.watchPosition(function(pos) {{
-        const lon = pos.coords.longitude;
-        const lat = pos.coords.latitude;
-        userMarker.setLngLat([lon, lat]);
-        if (window.directionsInstance && typeof window.directionsInstance.setOrigin === 'function') {{
-            try {{ window.directionsInstance.setOrigin([lon, lat]); }} catch(e){{ console.warn("directions setOrigin error", e); }}
-        }}
-    }}, function(err){{ console.error("watchPosition error", err); }}, {{ enableHighAccuracy:true }});
-
-    // clicking map to report hazards (creates marker and posts back)
-    map.on('click', function(e) {{
-        const lat = e.lngLat.lat;
-        const lon = e.lngLat.lng;
-        const hazard = prompt("Enter hazard type (e.g., Jellyfish, Trash, High surf):");
-        if(hazard) {{
-            fetch("", {{
-                method: "POST",
-                headers: {{ "Content-Type": "application/json" }},
-                body: JSON.stringify({{lat:lat, lon:lon, hazard: hazard, beach: "{selected_beach}"}})
-            }});
-            new mapboxgl.Marker({{color:'orange'}})
-            .setLngLat([lon, lat])
-            .setPopup(new mapboxgl.Popup().setText(hazard))
-            .addTo(map);
-        }}
-    }});
-
-    // If "Show Directions" checked, add directions control
-    if ({str(show_directions).lower()}) {{
-        window.directionsInstance = new MapboxDirections({{
-            accessToken: mapboxgl.accessToken,
-            unit: 'imperial',
-            profile: 'mapbox/walking',
-            interactive: true,
-            controls: {{ inputs: true, instructions: true, profileSwitcher: true }},
-            fitBounds: false
-        }});
-        map.addControl(window.directionsInstance, 'top-left');
-        try {{
-            window.directionsInstance.setOrigin(initialCenter);
-            window.directionsInstance.setDestination([{beach_coords['lon']}, {beach_coords['lat']}]);
-        }} catch(e) {{ console.warn("initial setOrigin/setDestination error", e); }}
-
-        let hasFittedRoute = false;
-        if (window.directionsInstance && typeof window.directionsInstance.on === 'function') {{
-            window.directionsInstance.on('route', function(e) {{
-                if (!e || !e.route || e.route.length === 0) return;
-                const route = e.route[0];
-                let coords = [];
-                if (route.geometry && route.geometry.coordinates) coords = route.geometry.coordinates;
-                else if (route.geometry && route.geometry.type === 'LineString' && route.geometry.coordinates) coords = route.geometry.coordinates;
-                else if (route.legs) {{
-                    route.legs.forEach(leg => {{
-                        if (leg.steps) {{
-                            leg.steps.forEach(step => {{
-                                if (step.geometry && step.geometry.coordinates) coords = coords.concat(step.geometry.coordinates);
-                            }});
-                        }}
-                    }});
-                }}
-                if (!coords || coords.length === 0) {{
-                    if (Array.isArray(route.geometry)) coords = route.geometry;
-                }}
-                if (coords && coords.length > 0) {{
-                    const bounds = coordsToBounds(coords);
-                    if (bounds) {{ map.fitBounds(bounds, {{ padding: 60, linear: true }}); hasFittedRoute = true; }}
-                }} else {{
-                    try {{
-                        const origin = window.directionsInstance.getOrigin();
-                        const destination = window.directionsInstance.getDestination();
-                        if(origin && destination){{
-                            const o = origin.geometry && origin.geometry.coordinates ? origin.geometry.coordinates : origin;
-                            const d = destination.geometry && destination.geometry.coordinates ? destination.geometry.coordinates : destination;
-                            map.fitBounds([[Math.min(o[0], d[0]), Math.min(o[1], d[1])], [Math.max(o[0], d[0]), Math.max(o[1], d[1])]], {{ padding:60 }});
-                        }}
-                    }} catch(err){{ console.warn("fallback fitBounds error", err); }}
-                }}
-            }});
-        }}
-    }}
-}}
-</script>
-</body>
-""", height=650)
-st.write("🟢 Your location updates live (blue marker). Click the map to report hazards. If 'Show Directions' is toggled on, a route from your current location → selected beach will appear and the map will fit the entire route (instead of centering only on the beach).")
+# Reports are shared by every visitor; repeats of the same hazard at the
+# same spot are merged into one report with a count.
+#
+# Only hazards in (a margin around) the map's current view are sent, and
+# only those that changed since the last run, so the page stays the same
+# size no matter how many reports are stored.
+MAP_HALF_HEIGHT_DEG = 0.03
+MAP_HALF_WIDTH_DEG = 0.05
+MAP_VIEW_MARGIN = 0.25
+MAX_MAP_HAZARDS = 5000
+NEARBY_BEACHES = 5
+NEARBY_RADIUS_KM = 100
+
+
+def pick_beach(name):
+    # the selectbox sits outside this fragment, so ask for a full rerun
+    st.session_state["selected_beach"] = name
+    st.session_state["_rerun_page"] = True
+
+
+@st.fragment
+def hazard_section(name, beach):
+    with metrics.span("dashboard_map"):
+        hazard_store = get_store()
+
+        # map interactions arrive as the component's value; handle them before the
+        # map renders so a new report is on the map in the same run
+        map_action = map_event()
+        if map_action and map_action["event"] == "report" and map_action["hazard"].strip():
+            hazard_store.add(map_action["lat"], map_action["lon"], map_action["hazard"], beach=name)
+            st.toast(f"Reported {map_action['hazard'].strip()} near {name}.")
+        elif map_action and map_action["event"] == "select":
+            st.session_state["selected_hazard"] = map_action["id"]
+
+        st.subheader("📢 Report a Hazard")
+        st.markdown(
+            "Click anywhere on the map to report a hazard there, or use the form below. "
+            "You can enter types like Jellyfish, Broken glass, High surf, or Trash."
+        )
+        with st.form("hazard_report", clear_on_submit=True):
+            hazard_type = st.text_input("Hazard type")
+            col1, col2 = st.columns(2)
+            hazard_lat = col1.number_input("Latitude", value=beach["lat"], format="%.5f")
+            hazard_lon = col2.number_input("Longitude", value=beach["lon"], format="%.5f")
+            if st.form_submit_button("Submit report") and hazard_type.strip():
+                hazard_store.add(hazard_lat, hazard_lon, hazard_type, beach=name)
+                st.toast(f"Reported {hazard_type.strip()} near {name}.")
+
+        south, west, north, east = map_view(default=(
+            beach["lat"] - MAP_HALF_HEIGHT_DEG, beach["lon"] - MAP_HALF_WIDTH_DEG,
+            beach["lat"] + MAP_HALF_HEIGHT_DEG, beach["lon"] + MAP_HALF_WIDTH_DEG,
+        ))
+        pad_lat, pad_lon = (north - south) * MAP_VIEW_MARGIN, (east - west) * MAP_VIEW_MARGIN
+        hazards_in_view = hazard_store.query(
+            bbox=(south - pad_lat, west - pad_lon, north + pad_lat, east + pad_lon), limit=MAX_MAP_HAZARDS
+        )
+
+        show_directions = st.checkbox("Direction to Beach from Current Location", key="directions_toggle")
+        hazard_map(
+            hazards_in_view,
+            center=(beach["lat"], beach["lon"]),
+            token=MAPBOX_TOKEN,
+            directions=show_directions,
+        )
+
+        selected = st.session_state.get("selected_hazard") and hazard_store.get(st.session_state["selected_hazard"])
+        if selected:
+            reported = pd.Timestamp(selected["reported_at"], unit="s", tz=TIDE_TIMEZONE).strftime("%I:%M %p")
+            st.info(f"⚠️ {selected['hazard']}: {selected['reports']} report(s), last at {reported}.")
+
+        user_location = map_location()
+        if user_location:
+            nearby = catalog.near(*user_location, k=NEARBY_BEACHES, radius_km=NEARBY_RADIUS_KM)
+            st.subheader("📍 Beaches Near You")
+            if not nearby:
+                st.write(f"No beaches within {NEARBY_RADIUS_KM} km of your location.")
+            for beach_name, km in nearby:
+                st.button(f"{beach_name} · {km * 0.621371:.1f} mi", key=f"nearby_{beach_name}",
+                          on_click=pick_beach, args=(beach_name,))
+        st.write("🟢 Your location updates live (blue marker). Click the map to report hazards. If 'Show Directions' is toggled on, a route from your current location → selected beach will appear and the map will fit the entire route (instead of centering only on the beach).")
+    if st.session_state.pop("_rerun_page", False):
+        st.rerun()
+
+
+hazard_section(selected_beach, beach_coords)
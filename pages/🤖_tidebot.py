@@ -1,23 +1,92 @@
+import math
 import streamlit as st 
-from rag import response_generator, query_answering
+import metrics
+from catalog import load_catalog
+from memory import HISTORY_PAGE_SIZE, ConversationMemory, get_history_store
+from rag import stream_answer_question, warm_up
+from scheduler import Overloaded
+
+warm_up()
+metrics.start_exporter()
 
 st.title("Ocean Safety Chatbot") 
 
-if "messages" not in st.session_state:
-  st.session_state.messages = []
+# only the last few turns are kept (and rendered); older ones are summarized and archived
+if "memory" not in st.session_state:
+  st.session_state.memory = ConversationMemory(load_catalog().names, store=get_history_store())
+memory = st.session_state.memory
+
+if memory.archived and st.toggle("Show earlier messages", key="show_history",
+                                 help=f"{memory.archived} older messages"):
+  pages = math.ceil(memory.archived / HISTORY_PAGE_SIZE)
+  page = st.number_input("Page (1 = most recent)", min_value=1, max_value=pages, value=1) if pages > 1 else 1
+  for role, content in memory.history_page(page - 1):
+    with st.chat_message(role):
+      st.markdown(content)
+  st.divider()
 
-for message in st.session_state.messages: 
-  with st.chat_message(message["role"]):
-    st.markdown(message["content"])
+for turn in memory.turns: 
+  with st.chat_message("user"):
+    st.markdown(turn["question"])
+  with st.chat_message("assistant"):
+    st.markdown(turn["answer"])
 
 if prompt := st.chat_input("What's up?"):
-  st.session_state.messages.append({"role": "user", "content": prompt})
   with st.chat_message("user"): 
     st.markdown(prompt)
+  # follow-ups ("and at Venice?") are searched for as standalone questions
+  rewrite = memory.rewrite(prompt)
   with st.chat_message("assistant"):
-    similair = response_generator(prompt)
-    response = query_answering(prompt, similair)
-    st.markdown(response)
-  st.session_state.messages.append({"role": "assistant", "content": response})
+    timings = {"rewritten_query": rewrite.query} if rewrite.follow_up else {}
+    # the model answers what was typed; the rewrite only drives retrieval
+    question = memory.prompt_question(prompt, rewrite.follow_up)
+    try:
+      response = st.write_stream(stream_answer_question(question, timings, retrieval_query=rewrite.query))
+    except Overloaded:
+      response = None
+      st.warning("Tidebot is answering a lot of questions right now. Please ask again in a moment.")
+  if response is not None:
+    memory.record(prompt, rewrite, response, timings)
   
   
+
+# Debug panel: where the last turn's time went
+
+def show_debug(timings):
+  st.metric("Time to first token", f"{timings.get('ttft', 0) * 1000:.0f} ms")
+  st.metric("Total", f"{timings.get('total', 0) * 1000:.0f} ms")
+  if timings.get("cached"):
+    st.caption("Answered from the semantic answer cache.")
+  if "rewritten_query" in timings:
+    st.write(f"Searched for: {timings['rewritten_query']}")
+  stages = timings.get("stages", {})
+  if stages:
+    st.dataframe({"stage": list(stages), "ms": [round(v * 1000, 2) for v in stages.values()]}, hide_index=True)
+  if "tokens" in timings:
+    st.write(f"Tokens: {timings['tokens']['prompt']} prompt / {timings['tokens']['completion']} completion")
+  if "retrieval_scores" in timings:
+    used = f"{timings['context_chunks']} of " if "context_chunks" in timings else ""
+    st.write(f"Chunks: {used}{len(timings['retrieval_scores'])}, scores: "
+             + ", ".join(f"{score:.3f}" for score in timings["retrieval_scores"]))
+  if "retrieval_path" in timings:
+    st.write(f"Retrieval: {timings['retrieval_path']}")
+  if "context_tokens" in timings:
+    st.write(f"Context: {timings['context_tokens']} tokens")
+
+with st.sidebar:
+  st.button("New conversation", on_click=memory.clear)
+  if st.toggle("Debug panel"):
+    turns = [t for t in memory.turns if t.get("timings")]
+    if turns:
+      st.subheader("Last turn")
+      show_debug(turns[-1]["timings"])
+    stage_stats = metrics.stage_stats()
+    if stage_stats:
+      st.subheader("This process")
+      st.dataframe({
+        "stage": list(stage_stats),
+        "count": [s["count"] for s in stage_stats.values()],
+        "p50 ms": [round(s["p50"] * 1000, 2) for s in stage_stats.values()],
+        "p95 ms": [round(s["p95"] * 1000, 2) for s in stage_stats.values()],
+        "p99 ms": [round(s["p99"] * 1000, 2) for s in stage_stats.values()],
+      }, hide_index=True)
@@ -0,0 +1,222 @@
+"""Precomputed conditions snapshots for the beach dashboard.
+
+A prefetcher fetches weather and tides for every beach in the catalog on a
+schedule (PREFETCH_INTERVAL seconds). It works out each station's
+high/low table and today's chart series, then publishes everything as one
+.npz snapshot, replaced atomically. The dashboard renders from the newest
+snapshot, and only calls upstream itself for a beach the snapshot is
+missing, or when the snapshot is stale: another day, or older than
+SNAPSHOT_MAX_AGE.
+
+The prefetcher runs as a daemon thread in the Streamlit process
+(start_prefetcher, on by default), or as its own worker:
+
+    python prefetch.py                   # refresh every PREFETCH_INTERVAL seconds
+    python prefetch.py --once            # one refresh, e.g. from cron
+    python prefetch.py --config oceansafe.toml
+
+Set PREFETCH_IN_APP=0 on the app when a separate worker writes the
+snapshot.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from cache import CACHE_DIR
+from config import load_config
+
+SNAPSHOT_PATH = os.environ.get("CONDITIONS_SNAPSHOT", os.path.join(CACHE_DIR, "conditions.npz"))
+PREFETCH_INTERVAL = float(os.environ.get("PREFETCH_INTERVAL", "300"))
+SNAPSHOT_MAX_AGE = float(os.environ.get("SNAPSHOT_MAX_AGE", "1800"))
+PREFETCH_IN_APP = os.environ.get("PREFETCH_IN_APP", "1") == "1"
+
+
+def tide_view(tide_df, day):
+    """(high/low table, today's chart series) for one station's padded day."""
+    from tides import summarize_tides
+
+    if tide_df.empty:
+        return pd.DataFrame(), tide_df
+    chart = tide_df[tide_df['t'].dt.date == day].copy()
+    chart['Tide (ft)'] = chart['Tide (ft)'].round(2)
+    return summarize_tides(tide_df, day=day), chart.reset_index(drop=True)
+
+
+# ---------------------------
+# Snapshot file
+# ---------------------------
+class Snapshot:
+    """One published set of conditions. Tide series sit in flat arrays
+    (one slice per station); everything else is JSON."""
+
+    def __init__(self, day, created, weather, errors, stations, summaries, offsets, times, heights):
+        self.day = day
+        self.created = created
+        self.weather = weather
+        self.errors = errors
+        self.stations = {station: i for i, station in enumerate(stations)}
+        self.summaries = summaries
+        self.offsets = offsets
+        self.times = times
+        self.heights = heights
+
+    def age(self):
+        return time.time() - self.created
+
+    def is_fresh(self, day, max_age=SNAPSHOT_MAX_AGE):
+        return self.day == day and self.age() <= max_age
+
+    def tide_view(self, station):
+        """(high/low table, chart series) for a station, or None if it wasn't fetched."""
+        i = self.stations.get(station)
+        if i is None:
+            return None
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        chart = pd.DataFrame({"t": self.times[lo:hi], "Tide (ft)": self.heights[lo:hi]})
+        return pd.DataFrame(self.summaries[station]), chart
+
+    def save(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        meta = json.dumps({
+            "day": self.day.isoformat(), "created": self.created, "weather": self.weather,
+            "errors": self.errors, "summaries": self.summaries,
+        })
+        tmp = f"{path}.tmp.npz"
+        np.savez(
+            tmp,
+            stations=np.array(sorted(self.stations, key=self.stations.get), dtype=str),
+            offsets=self.offsets,
+            times=self.times,
+            heights=self.heights,
+            meta=np.frombuffer(meta.encode("utf-8"), dtype=np.uint8),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            return cls(
+                pd.Timestamp(meta["day"]).date(), meta["created"], meta["weather"], meta["errors"],
+                data["stations"].tolist(), meta["summaries"], data["offsets"], data["times"], data["heights"],
+            )
+
+    @classmethod
+    def build(cls, beaches, results, day):
+        """A snapshot from conditions.fetch_all() results."""
+        weather, errors, summaries, charts = {}, {}, {}, {}
+        for name, result in results.items():
+            weather[name] = result["weather"]
+            if result["error"]:
+                errors[name] = result["error"]
+            station = beaches[name]["station"]
+            if result["tides"] is not None and station not in summaries:
+                summary, chart = tide_view(result["tides"], day)
+                summaries[station] = summary.to_dict("list")
+                charts[station] = chart
+        stations = list(charts)
+        offsets = np.cumsum([0] + [len(charts[s]) for s in stations]).astype(np.int64)
+        times = np.concatenate([charts[s]["t"].to_numpy("datetime64[ns]") for s in stations]) \
+            if stations else np.array([], dtype="datetime64[ns]")
+        heights = np.concatenate([charts[s]["Tide (ft)"].to_numpy(float) for s in stations]) \
+            if stations else np.array([], dtype=float)
+        return cls(day, time.time(), weather, errors, stations, summaries, offsets, times, heights)
+
+
+_snapshot = None
+_snapshot_key = None
+_snapshot_lock = threading.Lock()
+
+
+def load_snapshot(path=None):
+    """The latest published snapshot, or None if there isn't one yet.
+    Reloaded only when the file changes, and shared by every session."""
+    global _snapshot, _snapshot_key
+    path = path or SNAPSHOT_PATH
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _snapshot_lock:
+        if key != _snapshot_key:
+            try:
+                _snapshot = Snapshot.load(path)
+            except (OSError, ValueError, KeyError):
+                return None
+            _snapshot_key = key
+        return _snapshot
+
+
+# ---------------------------
+# Prefetching
+# ---------------------------
+def refresh(beaches, path=None):
+    """Fetch conditions for every beach and publish a new snapshot."""
+    from conditions import fetch_all, tide_day
+
+    day = tide_day()
+    with metrics.span("prefetch"):
+        results = fetch_all(beaches)
+        snapshot = Snapshot.build(beaches, results, day)
+        snapshot.save(path or SNAPSHOT_PATH)
+    metrics.inc("prefetch_runs_total", result="partial" if snapshot.errors else "ok")
+    return snapshot
+
+
+def run_forever(beaches, interval=PREFETCH_INTERVAL, path=None):
+    while True:
+        start = time.monotonic()
+        try:
+            refresh(beaches, path)
+        except Exception:
+            # keep the last good snapshot; the dashboard falls back once it goes stale
+            metrics.inc("prefetch_runs_total", result="error")
+        time.sleep(max(0.0, interval - (time.monotonic() - start)))
+
+
+_prefetcher_started = False
+_prefetcher_lock = threading.Lock()
+
+
+def start_prefetcher(beaches, interval=PREFETCH_INTERVAL, path=None):
+    """Refresh the snapshot on a daemon thread. Safe to call on every
+    rerun; only the first call starts anything."""
+    global _prefetcher_started
+    with _prefetcher_lock:
+        if _prefetcher_started or not PREFETCH_IN_APP:
+            return
+        _prefetcher_started = True
+    threading.Thread(target=run_forever, args=(beaches, interval, path), name="prefetch", daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefetch conditions for every beach into a dashboard snapshot")
+    parser.add_argument("--once", action="store_true", help="refresh once and exit")
+    parser.add_argument("--interval", type=float, default=PREFETCH_INTERVAL, help="seconds between refreshes")
+    parser.add_argument("--out", default=SNAPSHOT_PATH, help="snapshot file")
+    parser.add_argument("--config", help="TOML settings file (default $OCEANSAFE_CONFIG)")
+    args = parser.parse_args()
+
+    load_config(args.config)
+    from catalog import load_catalog
+
+    beaches = load_catalog().beaches
+    if args.once:
+        snapshot = refresh(beaches, args.out)
+        print(json.dumps({"stations": len(snapshot.stations), "beaches": len(snapshot.weather),
+                          "errors": snapshot.errors}, indent=2))
+    else:
+        run_forever(beaches, args.interval, args.out)
+
+
+if __name__ == "__main__":
+    main()
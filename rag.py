@@ -7,22 +7,33 @@ Original file is located at
     https://colab.research.google.com/drive/1DCka7ILjFOOhFhIscBWHZuWzFid6CZiH
 """
 
-import openai
+import asyncio
+import hashlib
 import os
-import uuid
-from pinecone import Pinecone
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
-import streamlit as st
+import threading
+from contextlib import asynccontextmanager
+import time
+import httpx
+import metrics
+from bm25 import BM25_INDEX_PATH, LexicalIndex, is_confident, rrf_fuse
+from cache import EmbeddingCache, SemanticAnswerCache, normalize_query
+from config import get_secret
+from context import ContextBuilder
+from retrieval import LocalVectorIndex, PineconeBackend
+from scheduler import CHAT_MAX_CONCURRENCY, EMBED_MAX_CONCURRENCY, AdmissionScheduler, SingleFlight, current_session
 
-os.environ["OPENAI_API_KEY"] = st.secrets["OPENAI_API_KEY"]
-os.environ["PINECONE_API_KEY"] = st.secrets["PINECONE_API_KEY"]
-os.environ["INDEX_HOST"] = st.secrets["INDEX_HOST"]
+# openai, langchain and pinecone take a few seconds to import, so they are
+# imported where the clients are first built rather than at module load.
 
 # textmodels/ constants
 TEXT_MODEL = "text-embedding-ada-002"
+CHAT_MODEL = "gpt-4o-mini"
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95"))
 namespace= "oceansafe"
+# set to a directory written by `python retrieval.py export` to query it instead of Pinecone
+LOCAL_INDEX_PATH = os.environ.get("LOCAL_INDEX_PATH")
+# fuse BM25 matches from `python bm25.py build` into retrieval when that index exists
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "1") != "0"
 COMMON_TEMPLATE = """
 "Use the following pieces of context to answer the question at the end with human readable answer as a paragraph"
 "Please do not use data outside the context to answer any questions. "
@@ -36,45 +47,430 @@ Question: {question}
 "Helpful answer:   "
 """
 
-# pinecone setups
-client = openai.OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
-index = pc.Index(host=os.environ["INDEX_HOST"])
+# shared by every session in this process, persisted under .cache/
+embedding_cache = EmbeddingCache()
+answer_cache = SemanticAnswerCache(threshold=ANSWER_CACHE_THRESHOLD)
+# over-fetched matches -> MMR-deduplicated, token-budgeted prompt context
+context_builder = ContextBuilder()
+# identical in-flight OpenAI calls are shared, and upstream concurrency is
+# capped with a bounded queue that is fair across sessions
+flights = SingleFlight()
+chat_scheduler = AdmissionScheduler(CHAT_MAX_CONCURRENCY, name="chat")
+embed_scheduler = AdmissionScheduler(EMBED_MAX_CONCURRENCY, name="embed")
+
+# process-wide clients, created on first use
+_lock = threading.Lock()
+_pipeline_lock = threading.Lock()
+_http_client = None
+_pinecone = None
+_pipeline = None
+
+def get_http_client():
+  # shared keep-alive HTTP transport for OpenAI (embeddings + chat), reused by every session
+  global _http_client
+  with _lock:
+    if _http_client is None:
+      _http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=16, keepalive_expiry=120),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+      )
+    return _http_client
+
+def get_pinecone():
+  global _pinecone
+  with _lock:
+    if _pinecone is None:
+      from pinecone import Pinecone
+      _pinecone = Pinecone(api_key=get_secret("PINECONE_API_KEY"))
+    return _pinecone
+
+# Pipeline
+
+class RagPipeline:
+  """Embed -> retrieve -> answer, with every client and the LangChain chain
+  built once in the constructor.
+
+  Nothing is mutated after construction (the caches carry their own locks),
+  so one instance can be shared by concurrent Streamlit sessions. Any of
+  `client`, `index`/`backend`, `lexical` and `llm` can be injected, e.g.
+  fakes for local runs.
+  """
+
+  def __init__(self, model = CHAT_MODEL, top_k = None, namespace = namespace, template = COMMON_TEMPLATE,
+               embed_model = TEXT_MODEL, client = None, index = None, llm = None, async_client = None,
+               backend = None, embedding_cache = embedding_cache, answer_cache = answer_cache,
+               context_builder = context_builder, lexical = None, flights = flights,
+               chat_scheduler = chat_scheduler, embed_scheduler = embed_scheduler):
+    self.model = model
+    # the context builder decides how many candidates it packs from; without
+    # one, the top 2 matches go into the prompt as they are
+    if top_k is None:
+      top_k = context_builder.fetch_k if context_builder is not None else 2
+    self.top_k = top_k
+    self.namespace = namespace
+    self.template = template
+    self.embed_model = embed_model
+    if client is None:
+      import openai
+      client = openai.OpenAI(api_key=get_secret("OPENAI_API_KEY"), http_client=get_http_client())
+    self.client = client
+    if backend is None and index is None and LOCAL_INDEX_PATH:
+      backend = LocalVectorIndex(LOCAL_INDEX_PATH)
+    if backend is None:
+      backend = PineconeBackend(index or get_pinecone().Index(host=get_secret("INDEX_HOST"), pool_threads=8))
+    self.backend = backend
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+    self.prompt = ChatPromptTemplate.from_template(template)
+    # decided before the default model is filled in: only an injected model
+    # is reused by answer_many, the default one is rebuilt per event loop
+    self._llm_injected = llm is not None
+    if llm is None:
+      from langchain_openai import ChatOpenAI
+      llm = ChatOpenAI(model=model, api_key=get_secret("OPENAI_API_KEY"), http_client=get_http_client())
+    self.llm = llm
+    self.output_parser = StrOutputParser()
+    self.chain = self.prompt | self.llm | self.output_parser
+    self.async_client = async_client
+    self.embedding_cache = embedding_cache
+    self.answer_cache = answer_cache
+    self.context_builder = context_builder
+    if lexical is None and HYBRID_SEARCH and os.path.isdir(BM25_INDEX_PATH):
+      lexical = LexicalIndex(BM25_INDEX_PATH)
+    self.lexical = lexical
+    self.flights = flights
+    self.chat_scheduler = chat_scheduler
+    self.embed_scheduler = embed_scheduler
+
+  def coalesce(self, key, fn):
+    # concurrent callers with the same key share one call of fn
+    return fn() if self.flights is None else self.flights.do(key, fn)
+
+  async def acoalesce(self, key, make_coro):
+    return await (make_coro() if self.flights is None else self.flights.ado(key, make_coro))
+
+  @staticmethod
+  async def _admitted(scheduler, make_coro):
+    # async upstream calls take the same slots, queue and 429 pauses as sync ones
+    return await (make_coro() if scheduler is None else scheduler.acall(make_coro))
+
+  def embed(self, txt, trace = None):
+    with metrics.span("embed", trace):
+      if self.embedding_cache is not None:
+        cached = self.embedding_cache.get(txt, self.embed_model)
+        metrics.inc("cache_lookups_total", cache="embedding", result="miss" if cached is None else "hit")
+        if cached is not None:
+          return cached
+      embedding = self.coalesce(("embed", self.embed_model, normalize_query(txt)), lambda: self._embed_upstream(txt))
+      if self.embedding_cache is not None:
+        self.embedding_cache.put(txt, self.embed_model, embedding)
+      return embedding
+
+  def _embed_upstream(self, txt):
+    create = lambda: self.client.embeddings.create(input=f"{txt}", model=self.embed_model)
+    response = create() if self.embed_scheduler is None else self.embed_scheduler.call(create)
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+      metrics.inc("tokens_total", usage.total_tokens, kind="embedding")
+    return response.data[0].embedding
+
+  def retrieve(self, query_embed, k = None, trace = None, namespace = None):
+    # candidate vectors come back too, so the context builder can run MMR on them
+    with metrics.span("retrieve", trace):
+      response = self.backend.query(
+          namespace = namespace or self.namespace,
+          vector = query_embed,
+          top_k = k or self.top_k,
+          include_values=self.context_builder is not None,
+          include_metadata=True,
+      )
+    if metrics.ENABLED:
+      scores = [match["score"] for match in response["matches"]]
+      metrics.observe("retrieval_chunks", len(scores), trace)
+      if scores:
+        metrics.observe("retrieval_top_score", scores[0], trace)
+      if trace is not None:
+        trace["retrieval_scores"] = scores
+    return response
+
+  def extract(self, query_response, trace = None, query_embed = None):
+    matches = query_response["matches"]
+    if trace is not None:
+      trace["retrieval_ids"] = [match["id"] for match in matches]
+    if self.context_builder is None:
+      with metrics.span("context", trace):
+        texts = ((match.get("metadata") or {}).get("text") for match in matches)
+        return " ".join(text for text in texts if text)
+    with metrics.span("context", trace):
+      context, chosen, tokens = self.context_builder.build(query_response, query_embed)
+    metrics.observe("context_tokens", tokens, trace)
+    metrics.observe("context_chunks", len(chosen), trace)
+    if trace is not None:
+      trace["context_ids"] = [match["id"] for match in chosen]
+    return context
+
+  def cached_answer(self, query_embed, trace = None, namespace = None):
+    if self.answer_cache is None:
+      return None
+    with metrics.span("answer_cache", trace):
+      cached = self.answer_cache.lookup(query_embed, namespace or self.namespace)
+    metrics.inc("cache_lookups_total", cache="answer", result="miss" if cached is None else "hit")
+    return cached
+
+  def record_tokens(self, question, context, answer, trace = None):
+    # tiktoken counts of what was sent and received; works for streamed and injected models alike
+    if not metrics.ENABLED:
+      return
+    prompt_tokens = metrics.count_tokens(self.prompt.format(context=context, question=question), self.model)
+    completion_tokens = metrics.count_tokens(answer, self.model)
+    if prompt_tokens is None:
+      return
+    metrics.inc("tokens_total", prompt_tokens, kind="prompt")
+    metrics.inc("tokens_total", completion_tokens, kind="completion")
+    if trace is not None:
+      trace["tokens"] = {"prompt": prompt_tokens, "completion": completion_tokens}
+
+  def lexical_search(self, query, trace = None, namespace = None):
+    if self.lexical is None:
+      return None
+    with metrics.span("lexical", trace):
+      return self.lexical.search(query, self.top_k, namespace or self.namespace)
+
+  def fuse(self, dense, lexical, trace = None):
+    # reciprocal rank fusion of vector and BM25 matches
+    path = "hybrid" if lexical is not None and lexical["matches"] else "vector"
+    metrics.inc("retrieval_path_total", path=path)
+    if trace is not None:
+      trace["retrieval_path"] = path
+    return rrf_fuse([dense, lexical], self.top_k) if path == "hybrid" else dense
+
+  def lexical_only(self, lexical, trace = None):
+    # BM25 hits that cover the whole question are enough on their own
+    if lexical is None or not is_confident(lexical):
+      return False
+    metrics.inc("retrieval_path_total", path="lexical")
+    if trace is not None:
+      trace["retrieval_path"] = "lexical"
+    return True
+
+  def gather_context(self, query, trace = None, namespace = None):
+    """(query embedding, cached answer or None, context) for one question.
+
+    A confident lexical match skips the embedding call, the answer cache
+    and the vector query, and the embedding comes back as None.
+    """
+    namespace = namespace or self.namespace
+    lexical = self.lexical_search(query, trace, namespace)
+    if self.lexical_only(lexical, trace):
+      return None, None, self.extract(lexical, trace)
+    # reuse the query embedding to skip the LLM for questions we already answered
+    query_embed = self.embed(query, trace)
+    cached = self.cached_answer(query_embed, trace, namespace)
+    if cached is not None:
+      return query_embed, cached, cached["context"]
+    response = self.fuse(self.retrieve(query_embed, trace=trace, namespace=namespace), lexical, trace)
+    return query_embed, None, self.extract(response, trace, query_embed)
+
+  def _answer_key(self, question, context):
+    return ("answer", self.model, normalize_query(question), hashlib.sha256(context.encode()).hexdigest())
+
+  def answer(self, question, context):
+    invoke = lambda: self.chain.invoke({"context": context, "question": question})
+    call = invoke if self.chat_scheduler is None else (lambda: self.chat_scheduler.call(invoke))
+    return self.coalesce(self._answer_key(question, context), call)
+
+  def respond(self, query, trace = None, namespace = None, retrieval_query = None):
+    # `retrieval_query` (e.g. a rewritten follow-up) is searched for instead of `query`
+    namespace = namespace or self.namespace
+    query_embed, cached, query_extract = self.gather_context(retrieval_query or query, trace, namespace)
+    if trace is not None:
+      trace["cached"] = cached is not None
+    if cached is not None:
+      return cached["answer"], cached["context"]
+    with metrics.span("llm", trace):
+      query_ans = self.answer(query, query_extract)
+    self.record_tokens(query, query_extract, query_ans, trace)
+    if self.answer_cache is not None and query_embed is not None:
+      self.answer_cache.store(query, query_embed, query_ans, query_extract, namespace)
+    return query_ans, query_extract
+
+  def stream_answer(self, question, context):
+    upstream = lambda: self.chain.stream({"context": context, "question": question})
+    if self.chat_scheduler is None:
+      scheduled = upstream
+    else:
+      session = current_session()
+      scheduled = lambda: self.chat_scheduler.stream(upstream, session)
+    if self.flights is None:
+      yield from scheduled()
+    else:
+      yield from self.flights.stream(self._answer_key(question, context), scheduled)
+
+  def stream_respond(self, query, timings = None, namespace = None, retrieval_query = None):
+    """Like respond(), but yields the answer as it is generated.
+
+    If a `timings` dict is passed it is filled with seconds since the turn
+    started: "retrieval" (embed + lookup), "ttft" (first token) and "total",
+    plus the metrics breakdown: per-stage seconds under "stages", "tokens",
+    "retrieval_scores", "retrieval_chunks" and "retrieval_path".
+    """
+    start = time.perf_counter()
+    timings = {} if timings is None else timings
+    namespace = namespace or self.namespace
+    query_embed, cached, query_extract = self.gather_context(retrieval_query or query, timings, namespace)
+    if cached is not None:
+      timings["retrieval"] = timings["ttft"] = time.perf_counter() - start
+      timings["cached"] = True
+      yield cached["answer"]
+      timings["total"] = time.perf_counter() - start
+      metrics.observe("turn_seconds", timings["total"], cached="true")
+      return
+    timings["retrieval"] = time.perf_counter() - start
+    timings["cached"] = False
+    tokens = []
+    with metrics.span("llm", timings):
+      for token in self.stream_answer(query, query_extract):
+        if not tokens:
+          timings["ttft"] = time.perf_counter() - start
+          metrics.observe("ttft_seconds", timings["ttft"])
+        tokens.append(token)
+        yield token
+    timings["total"] = time.perf_counter() - start
+    metrics.observe("turn_seconds", timings["total"], cached="false")
+    answer = "".join(tokens)
+    self.record_tokens(query, query_extract, answer, timings)
+    if self.answer_cache is not None and query_embed is not None:
+      self.answer_cache.store(query, query_embed, answer, query_extract, namespace)
+
+  # Async variant. httpx async pools are bound to the event loop that created
+  # them, so the async OpenAI transport is opened per run rather than shared.
+
+  @asynccontextmanager
+  async def _async_resources(self):
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=64, max_keepalive_connections=16),
+                                 timeout=httpx.Timeout(60.0, connect=5.0)) as http:
+      aclient = self.async_client
+      if aclient is None:
+        import openai
+        aclient = openai.AsyncOpenAI(api_key=get_secret("OPENAI_API_KEY"), http_client=http)
+      if self._llm_injected:
+        chain = self.chain
+      else:
+        from langchain_openai import ChatOpenAI
+        llm = ChatOpenAI(model=self.model, api_key=get_secret("OPENAI_API_KEY"), http_async_client=http)
+        chain = self.prompt | llm | self.output_parser
+      yield aclient, chain
+
+  async def aembed_many(self, texts, aclient, batch_size = 256):
+    """Embed `texts`, sending every cache miss in batched requests."""
+    embeds = [self.embedding_cache.get(t, self.embed_model) if self.embedding_cache is not None else None for t in texts]
+    missing = list(dict.fromkeys(t for t, e in zip(texts, embeds) if e is None))
+    fresh = {}
+    for i in range(0, len(missing), batch_size):
+      batch = missing[i:i + batch_size]
+      with metrics.span("embed_batch"):
+        response = await self._admitted(
+            self.embed_scheduler, lambda: aclient.embeddings.create(input=batch, model=self.embed_model))
+      for item in response.data:
+        fresh[batch[item.index]] = item.embedding
+    for txt, embedding in fresh.items():
+      if self.embedding_cache is not None:
+        self.embedding_cache.put(txt, self.embed_model, embedding)
+    return [e if e is not None else fresh[t] for t, e in zip(texts, embeds)]
+
+  async def aretrieve(self, query_embed, k = None, namespace = None):
+    # the Pinecone REST client is synchronous; keep it off the event loop
+    return await asyncio.to_thread(self.retrieve, query_embed, k, None, namespace)
+
+  async def _arespond(self, query, query_embed, lexical, chain):
+    if query_embed is None:
+      query_extract = self.extract(lexical)
+    else:
+      cached = self.cached_answer(query_embed)
+      if cached is not None:
+        return cached["answer"], cached["context"]
+      query_extract = self.extract(self.fuse(await self.aretrieve(query_embed), lexical), query_embed=query_embed)
+    invoke = lambda: chain.ainvoke({"context": query_extract, "question": query})
+    with metrics.span("llm"):
+      query_ans = await self.acoalesce(self._answer_key(query, query_extract),
+                                       lambda: self._admitted(self.chat_scheduler, invoke))
+    self.record_tokens(query, query_extract, query_ans)
+    if self.answer_cache is not None and query_embed is not None:
+      self.answer_cache.store(query, query_embed, query_ans, query_extract, self.namespace)
+    return query_ans, query_extract
+
+  async def arespond(self, query):
+    return (await self.aanswer_many([query]))[0]
+
+  async def aanswer_many(self, questions, concurrency = 8):
+    questions = list(questions)
+    lexical = [self.lexical_search(q) for q in questions]
+    # only questions without a confident lexical match need an embedding
+    need = [q for q, lx in zip(questions, lexical) if not self.lexical_only(lx)]
+    async with self._async_resources() as (aclient, chain):
+      embeds = dict(zip(need, await self.aembed_many(need, aclient))) if need else {}
+      semaphore = asyncio.Semaphore(concurrency)
+
+      async def bounded(query, lx):
+        async with semaphore:
+          return await self._arespond(query, embeds.get(query), lx, chain)
+
+      return await asyncio.gather(*(bounded(q, lx) for q, lx in zip(questions, lexical)))
+
+  def answer_many(self, questions, concurrency = 8):
+    """Answer a list of questions; returns (answer, context) pairs in order."""
+    return asyncio.run(self.aanswer_many(questions, concurrency))
+
+def get_pipeline():
+  global _pipeline
+  if _pipeline is None:
+    with _pipeline_lock:
+      if _pipeline is None:
+        _pipeline = RagPipeline()
+  return _pipeline
+
+def warm_up():
+  # build the shared pipeline off the script thread so the page renders immediately
+  if _pipeline is None:
+    threading.Thread(target=get_pipeline, name="rag-warm-up", daemon=True).start()
 
 # Functions
 
 def retrive_embed_openai(txt):
-  response = client.embeddings.create(input=f"{txt}", model=TEXT_MODEL)
-
-  return response.data[0].embedding
+  return get_pipeline().embed(txt)
 
-def retrivesimilair(query_embed, k=2 , namspace = "oceansafe" ):
-  query_response = index.query(
-        namespace = namespace,
-        vector = query_embed,
-        top_k = k,
-        include_values=False,
-        include_metadata=True,
-    )
-  return query_response
+def retrivesimilair(query_embed, k=None , namspace = namespace ):
+  # k defaults to the context builder's over-fetch size
+  return get_pipeline().retrieve(query_embed, k, namespace=namspace)
 
-def content_extraction(query_response):
-  top_chunks = query_response["matches"]
-  text_content = [sub_content["metadata"]["text"] for sub_content in top_chunks]
-  return " ".join(text_content)
+def content_extraction(query_response, query_embed = None):
+  # the shared pipeline's builder, so an injected one applies here too
+  return get_pipeline().extract(query_response, query_embed = query_embed)
 
 def query_answering(query_embed, context, template = COMMON_TEMPLATE):
-  prompt = ChatPromptTemplate.from_template(template)
-  model = ChatOpenAI(model="gpt-4o-mini", api_key=os.environ["OPENAI_API_KEY"])
-  output_parser = StrOutputParser()
-  chain = prompt| model| output_parser
-  answer = chain.invoke({"context": context, "question": query_embed})
-  return answer
-
-def response_generator(query):
+  pipeline = get_pipeline()
+  if template == pipeline.template:
+    return pipeline.answer(query_embed, context)
+  from langchain_core.prompts import ChatPromptTemplate
+  chain = ChatPromptTemplate.from_template(template) | pipeline.llm | pipeline.output_parser
+  return chain.invoke({"context": context, "question": query_embed})
+
+def response_generator(query, namspace = namespace):
+  pipeline = get_pipeline()
+  lexical = pipeline.lexical_search(query, namespace=namspace)
+  if pipeline.lexical_only(lexical):
+    return pipeline.extract(lexical)
   query_embed = retrive_embed_openai(query)
-  query_similair = retrivesimilair(query_embed)
-  query_extract = content_extraction(query_similair)
+  query_similair = pipeline.fuse(retrivesimilair(query_embed, namspace=namspace), lexical)
+  query_extract = content_extraction(query_similair, query_embed)
   #query_ans = query_answering(query, query_extract)
   return query_extract
 
+def answer_question(query, namspace = namespace):
+  return get_pipeline().respond(query, namespace=namspace)
+
+def stream_answer_question(query, timings = None, retrieval_query = None):
+  return get_pipeline().stream_respond(query, timings, retrieval_query=retrieval_query)
+
+def answer_many(questions, concurrency = 8):
+  return get_pipeline().answer_many(questions, concurrency)
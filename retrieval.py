@@ -0,0 +1,200 @@
+"""Retrieval backends for the RAG pipeline.
+
+Both backends answer ``query(vector, top_k, namespace, ...)`` with the same
+shape as a Pinecone query response (``{"matches": [{"id", "score",
+"metadata"}]}``) so ``rag.content_extraction`` works on either.
+
+Snapshot a Pinecone namespace into the local format with:
+
+    python retrieval.py export --namespace oceansafe --out local_index --dtype float16
+
+and point the app at it with ``LOCAL_INDEX_PATH=local_index``.
+"""
+
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+from config import get_secret
+
+DTYPES = ("float32", "float16", "int8")
+BLOCK_ROWS = 65536
+
+
+# ---------------------------
+# Pinecone
+# ---------------------------
+class PineconeBackend:
+    def __init__(self, index):
+        self.index = index
+
+    def query(self, vector, top_k, namespace, include_values=False, include_metadata=True):
+        return self.index.query(
+            namespace=namespace,
+            vector=vector,
+            top_k=top_k,
+            include_values=include_values,
+            include_metadata=include_metadata,
+        )
+
+
+# ---------------------------
+# Local memory-mapped index
+# ---------------------------
+def _unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def write_namespace(root, namespace, ids, vectors, metadata, dtype="float32", dimension=None):
+    """Write one namespace as <root>/<namespace>/{vectors.npy, scales.npy,
+    metadata.jsonl, index.json}. Vectors are L2-normalized before storage so
+    a dot product is the cosine score. An empty namespace is written as a
+    (0, dimension) matrix, so `dimension` is required for one."""
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype must be one of {DTYPES}, got {dtype!r}")
+    if not len(ids):
+        if dimension is None:
+            raise ValueError(f"namespace {namespace!r} is empty; pass its dimension")
+        vectors = np.empty((0, dimension), dtype=np.float32)
+    path = os.path.join(root, namespace)
+    os.makedirs(path, exist_ok=True)
+    vectors = _unit_rows(vectors)
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1)
+        scales[scales == 0] = 1.0
+        stored = np.round(vectors / scales[:, None] * 127).astype(np.int8)
+        np.save(os.path.join(path, "scales.npy"), (scales / 127).astype(np.float32))
+    else:
+        stored = vectors.astype(dtype)
+    np.save(os.path.join(path, "vectors.npy"), stored)
+    with open(os.path.join(path, "metadata.jsonl"), "w") as f:
+        for vid, meta in zip(ids, metadata):
+            f.write(json.dumps({"id": vid, "metadata": meta}) + "\n")
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump({"namespace": namespace, "dtype": dtype, "count": len(ids), "dimension": int(stored.shape[1])}, f)
+
+
+class _Namespace:
+    def __init__(self, path):
+        with open(os.path.join(path, "index.json")) as f:
+            self.info = json.load(f)
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.scales = None
+        if self.info["dtype"] == "int8":
+            self.scales = np.load(os.path.join(path, "scales.npy"))
+        self.ids = []
+        self.metadata = []
+        with open(os.path.join(path, "metadata.jsonl")) as f:
+            for line in f:
+                row = json.loads(line)
+                self.ids.append(row["id"])
+                self.metadata.append(row["metadata"])
+
+    def scores(self, query):
+        if self.vectors.dtype == np.float32:
+            return self.vectors @ query
+        # upcast block by block so int8/float16 matrices never exist as float32 in full
+        out = np.empty(len(self.vectors), dtype=np.float32)
+        for start in range(0, len(self.vectors), BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+            out[start:start + BLOCK_ROWS] = block @ query
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+
+class LocalVectorIndex:
+    """Exact top-k over memory-mapped, normalized vectors on disk.
+
+    Namespaces are loaded lazily on first query and then shared; the arrays
+    are read-only, so concurrent queries need no locking.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def _namespace(self, namespace):
+        ns = self._namespaces.get(namespace)
+        if ns is None:
+            with self._lock:
+                ns = self._namespaces.get(namespace)
+                if ns is None:
+                    path = os.path.join(self.root, namespace)
+                    ns = _Namespace(path) if os.path.isdir(path) else None
+                    self._namespaces[namespace] = ns
+        return ns
+
+    def query(self, vector, top_k, namespace, include_values=False, include_metadata=True):
+        ns = self._namespace(namespace)
+        if ns is None or not ns.ids:
+            return {"matches": [], "namespace": namespace}
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+        scores = ns.scores(q)
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        matches = []
+        for i in top:
+            match = {"id": ns.ids[i], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = ns.metadata[i]
+            if include_values:
+                match["values"] = self.vector(namespace, i).tolist()
+            matches.append(match)
+        return {"matches": matches, "namespace": namespace}
+
+    def vector(self, namespace, row):
+        ns = self._namespace(namespace)
+        values = np.asarray(ns.vectors[row], dtype=np.float32)
+        if ns.scales is not None:
+            values = values * ns.scales[row]
+        return values
+
+
+# ---------------------------
+# Pinecone -> local snapshot
+# ---------------------------
+def export_namespace(index, namespace, root, dtype="float32", batch_size=100):
+    ids = [vid for page in index.list(namespace=namespace) for vid in page]
+    vectors, metadata = [], []
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        fetched = index.fetch(ids=batch, namespace=namespace).vectors
+        for vid in batch:
+            vectors.append(fetched[vid].values)
+            metadata.append(dict(fetched[vid].metadata or {}))
+    dimension = None if ids else index.describe_index_stats().dimension
+    write_namespace(root, namespace, ids, vectors, metadata, dtype=dtype, dimension=dimension)
+    return len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local vector index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="snapshot a Pinecone namespace to disk")
+    export.add_argument("--namespace", default="oceansafe")
+    export.add_argument("--out", default="local_index")
+    export.add_argument("--dtype", choices=DTYPES, default="float32")
+    args = parser.parse_args()
+
+    from pinecone import Pinecone
+
+    pc = Pinecone(api_key=get_secret("PINECONE_API_KEY"))
+    index = pc.Index(host=get_secret("INDEX_HOST"))
+    count = export_namespace(index, args.namespace, args.out, dtype=args.dtype)
+    print(f"exported {count} vectors from '{args.namespace}' to {args.out} ({args.dtype})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""Request coalescing and admission control for OpenAI calls.
+
+SingleFlight lets concurrent callers asking for the same key share one
+in-flight call: the first caller runs it, the rest wait for its result.
+``stream()`` does the same for token streams. One producer thread drains
+the upstream iterator into a buffer, and every subscriber replays that
+buffer as it fills.
+
+AdmissionScheduler caps concurrent upstream calls for the whole process.
+Callers over the cap wait in a bounded queue (``Overloaded`` is raised when
+it is full or the wait times out). The queue is served round-robin across
+sessions, so one busy session can't starve the rest. A 429 from upstream
+pauses every admission for its Retry-After time, or an exponential
+backoff, before the call is retried.
+
+Both have async variants (``SingleFlight.ado``, ``AdmissionScheduler.acall``)
+that share the same keys, slots and pauses as the sync callers, so batch
+and async callers are coalesced and admitted with everyone else.
+
+Recorded metrics: scheduler_queue_depth, scheduler_wait_seconds,
+scheduler_rejected_total, scheduler_retries_total and
+singleflight_shared_total.
+"""
+
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import metrics
+
+CHAT_MAX_CONCURRENCY = int(os.environ.get("CHAT_MAX_CONCURRENCY", "8"))
+EMBED_MAX_CONCURRENCY = int(os.environ.get("EMBED_MAX_CONCURRENCY", "16"))
+SCHEDULER_MAX_QUEUE = int(os.environ.get("SCHEDULER_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.environ.get("SCHEDULER_QUEUE_TIMEOUT", "60"))
+MAX_RETRIES = 4
+BACKOFF = 0.5
+MAX_BACKOFF = 20.0
+
+
+class Overloaded(RuntimeError):
+    """The admission queue is full, or a caller waited too long in it."""
+
+
+def current_session():
+    """The Streamlit session id of the calling script thread, else the
+    thread name (so batch jobs and benchmarks get one "session" per thread)."""
+    if "streamlit" in sys.modules:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is not None:
+            return ctx.session_id
+    return threading.current_thread().name
+
+
+def is_rate_limited(exc):
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    return status == 429
+
+
+def retry_after(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+# ---------------------------
+# Single-flight
+# ---------------------------
+class _Broadcast:
+    def __init__(self):
+        self._items = []
+        self._done = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    def push(self, item):
+        with self._cond:
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def close(self, error=None):
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._cond.notify_all()
+
+    def subscribe(self):
+        seen = 0
+        while True:
+            with self._cond:
+                while seen >= len(self._items) and not self._done:
+                    self._cond.wait()
+                items = self._items[seen:]
+                done, error = self._done, self._error
+            yield from items
+            seen += len(items)
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    def __init__(self, name="openai"):
+        self.name = name
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            metrics.inc("singleflight_shared_total", flight=self.name, kind="call")
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+        future.set_result(result)
+        return result
+
+    async def ado(self, key, make_coro):
+        """do() for coroutines: await make_coro() once per key, shared with
+        sync and async callers of the same key."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            metrics.inc("singleflight_shared_total", flight=self.name, kind="call")
+            return await asyncio.wrap_future(future)
+        try:
+            result = await make_coro()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+        future.set_result(result)
+        return result
+
+    def stream(self, key, make_iter):
+        """Iterate the items of make_iter(), shared with concurrent callers
+        of the same key. The upstream iterator is drained on its own thread,
+        so an abandoned subscriber never stalls the others."""
+        with self._lock:
+            broadcast = self._streams.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = self._streams[key] = _Broadcast()
+        if leader:
+            threading.Thread(target=self._produce, args=(key, broadcast, make_iter),
+                             name=f"singleflight-{self.name}", daemon=True).start()
+        else:
+            metrics.inc("singleflight_shared_total", flight=self.name, kind="stream")
+        return broadcast.subscribe()
+
+    def _produce(self, key, broadcast, make_iter):
+        try:
+            for item in make_iter():
+                broadcast.push(item)
+        except BaseException as exc:
+            broadcast.close(exc)
+        else:
+            broadcast.close()
+        finally:
+            with self._lock:
+                del self._streams[key]
+
+
+# ---------------------------
+# Admission
+# ---------------------------
+class _Ticket:
+    __slots__ = ("granted", "wake")
+
+    def __init__(self, wake=None):
+        self.granted = False
+        self.wake = wake  # called once granted, for waiters that aren't on the condition
+
+
+class AdmissionScheduler:
+    def __init__(self, max_concurrency=CHAT_MAX_CONCURRENCY, max_queue=SCHEDULER_MAX_QUEUE,
+                 queue_timeout=QUEUE_TIMEOUT, max_retries=MAX_RETRIES, backoff=BACKOFF,
+                 max_backoff=MAX_BACKOFF, name="chat"):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.name = name
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.retries = 0
+        self._queues = OrderedDict()  # session -> waiting tickets, in round-robin order
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _can_admit(self):
+        return self.active < self.max_concurrency and time.monotonic() >= self._paused_until
+
+    def _dispatch(self):
+        # hand free slots to waiting tickets, taking one per session in turn
+        granted = False
+        while self.queued and self._can_admit():
+            session, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            ticket.granted = True
+            if ticket.wake is not None:
+                ticket.wake()
+            if queue:
+                self._queues.move_to_end(session)
+            else:
+                del self._queues[session]
+            self.queued -= 1
+            self.active += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _reject(self, reason):
+        self.rejected += 1
+        metrics.inc("scheduler_rejected_total", scheduler=self.name)
+        raise Overloaded(f"{self.name} scheduler {reason}")
+
+    def _enqueue(self, session, wake=None):
+        if self.queued >= self.max_queue:
+            self._reject(f"queue is full ({self.max_queue} waiting)")
+        ticket = _Ticket(wake)
+        self._queues.setdefault(session, deque()).append(ticket)
+        self.queued += 1
+        metrics.observe("scheduler_queue_depth", self.queued, scheduler=self.name)
+        return ticket
+
+    def _dequeue(self, session, ticket):
+        queue = self._queues[session]
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[session]
+        self.queued -= 1
+
+    def _wake_at(self, deadline, now):
+        # wake up on a release, at the end of a pause, or at the deadline
+        return deadline if now >= self._paused_until else min(deadline, self._paused_until)
+
+    def _admitted(self, start):
+        self.admitted += 1
+        waited = time.monotonic() - start
+        metrics.observe("scheduler_wait_seconds", waited, scheduler=self.name)
+        return waited
+
+    def acquire(self, session=None):
+        """Block until a slot is free; returns the seconds spent waiting."""
+        start = time.monotonic()
+        with self._cond:
+            if not self.queued and self._can_admit():
+                self.active += 1
+                return self._admitted(start)
+            session = session if session is not None else current_session()
+            ticket = self._enqueue(session)
+            deadline = start + self.queue_timeout
+            while not ticket.granted:
+                self._dispatch()
+                if ticket.granted:
+                    break
+                now = time.monotonic()
+                if now >= deadline:
+                    self._dequeue(session, ticket)
+                    self._reject(f"queue wait exceeded {self.queue_timeout:g}s")
+                self._cond.wait(self._wake_at(deadline, now) - now)
+            return self._admitted(start)
+
+    async def aacquire(self, session=None):
+        """acquire() for coroutines: waits on the event loop rather than
+        blocking a thread, so admitted calls that need the loop's executor
+        can still finish and free their slots."""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        start = time.monotonic()
+        with self._cond:
+            if not self.queued and self._can_admit():
+                self.active += 1
+                return self._admitted(start)
+            session = session if session is not None else current_session()
+            ticket = self._enqueue(session, wake)
+        deadline = start + self.queue_timeout
+        try:
+            while True:
+                with self._cond:
+                    self._dispatch()
+                    if ticket.granted:
+                        return self._admitted(start)
+                    now = time.monotonic()
+                    if now >= deadline:
+                        self._dequeue(session, ticket)
+                        self._reject(f"queue wait exceeded {self.queue_timeout:g}s")
+                    wake_at = self._wake_at(deadline, now)
+                try:
+                    await asyncio.wait_for(asyncio.shield(granted), wake_at - now)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            # hand back the slot or the place in the queue, whichever the ticket holds
+            with self._cond:
+                if ticket.granted:
+                    self.active -= 1
+                    self._dispatch()
+                else:
+                    self._dequeue(session, ticket)
+            raise
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, session=None):
+        self.acquire(session)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def pause(self, seconds):
+        """Hold every admission for `seconds`, e.g. after a 429."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _backoff(self, exc, attempt):
+        delay = retry_after(exc)
+        if delay is None:
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt) * (0.5 + random.random() / 2)
+        self.retries += 1
+        metrics.inc("scheduler_retries_total", scheduler=self.name)
+        self.pause(delay)
+
+    def call(self, fn, session=None):
+        """fn() inside a slot, retried with backoff while it is rate limited."""
+        session = session if session is not None else current_session()
+        for attempt in range(self.max_retries + 1):
+            with self.slot(session):
+                try:
+                    return fn()
+                except Exception as exc:
+                    if not is_rate_limited(exc) or attempt == self.max_retries:
+                        raise
+                    error = exc
+            self._backoff(error, attempt)
+
+    async def acall(self, make_coro, session=None):
+        """call() for coroutines, admitted with aacquire()."""
+        session = session if session is not None else current_session()
+        for attempt in range(self.max_retries + 1):
+            await self.aacquire(session)
+            try:
+                return await make_coro()
+            except Exception as exc:
+                if not is_rate_limited(exc) or attempt == self.max_retries:
+                    raise
+                error = exc
+            finally:
+                self.release()
+            self._backoff(error, attempt)
+
+    def stream(self, make_iter, session=None):
+        """Items of make_iter(), holding one slot until it is exhausted. A
+        429 before the first item is retried like call(); after it, not."""
+        session = session if session is not None else current_session()
+        for attempt in range(self.max_retries + 1):
+            with self.slot(session):
+                iterator = iter(make_iter())
+                try:
+                    first = next(iterator)
+                except StopIteration:
+                    return
+                except Exception as exc:
+                    if not is_rate_limited(exc) or attempt == self.max_retries:
+                        raise
+                    error = exc
+                else:
+                    yield first
+                    yield from iterator
+                    return
+            self._backoff(error, attempt)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active": self.active,
+                "queued": self.queued,
+                "sessions_waiting": len(self._queues),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "retries": self.retries,
+                "paused_for": max(0.0, self._paused_until - time.monotonic()),
+            }
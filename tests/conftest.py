@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# modules read these at import time; keep caches and databases out of the checkout
+_workdir = tempfile.mkdtemp(prefix="oceansafe-tests-")
+os.environ.setdefault("OCEANSAFE_CACHE_DIR", os.path.join(_workdir, "cache"))
+os.environ.setdefault("HAZARD_DB", os.path.join(_workdir, "hazards.sqlite3"))
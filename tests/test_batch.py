@@ -0,0 +1,23 @@
+import json
+
+import pytest
+
+import batch
+
+
+def test_resume_skips_answered_ids(tmp_path):
+    out = tmp_path / "answers.jsonl"
+    out.write_text(json.dumps({"id": "1", "answer": "Swim near a lifeguard."}) + "\n"
+                   + json.dumps({"id": "2", "error": "RateLimitError: slow down"}) + "\n"
+                   + '{"id": "3", "ans')
+    assert batch.answered_ids(str(out)) == {"1"}
+
+
+def test_a_worker_that_cannot_start_exits_with_the_cause(tmp_path):
+    missing = str(tmp_path / "missing.toml")
+    with pytest.raises(SystemExit) as exc:
+        batch.run([("1", "Is it safe to swim?", None)], str(tmp_path / "answers.jsonl"), workers=1,
+                  config_path=missing)
+    message = str(exc.value)
+    assert "FileNotFoundError" in message
+    assert missing in message
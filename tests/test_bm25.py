@@ -0,0 +1,61 @@
+import math
+
+from bm25 import BM25Index, is_confident, rrf_fuse
+
+
+def _index(texts):
+    index = BM25Index()
+    index.add([f"c{i}" for i in range(len(texts))], texts)
+    return index
+
+
+def test_search_on_an_emptied_index_returns_nothing():
+    index = _index(["rip current flags", "stingray shuffle"])
+    index.remove(["c0", "c1"])
+    assert index.search("rip current", top_k=5) == ([], 0.0)
+    assert len(index) == 0
+
+
+def test_chunks_without_terms_do_not_divide_by_zero(recwarn):
+    index = _index(["the and of", "a to is"])
+    assert index.total_len == 0
+    assert index.search("jellyfish", top_k=5)[0] == []
+    assert not [w for w in recwarn if issubclass(w.category, RuntimeWarning)]
+
+
+def test_removed_chunks_do_not_count_towards_document_frequency():
+    texts = ["jellyfish sting vinegar"] + ["jellyfish warning flags"] * 9 + ["stingray shuffle"]
+    index = _index(texts)
+    index.remove([f"c{i}" for i in range(1, 10)])
+    fresh = _index([texts[0], texts[10]])
+
+    hits, query_idf = index.search("jellyfish", top_k=5)
+    fresh_hits, fresh_idf = fresh.search("jellyfish", top_k=5)
+    assert [index.ids[row] for row, _, _ in hits] == ["c0"]
+    assert math.isclose(query_idf, fresh_idf, rel_tol=1e-6)
+    assert math.isclose(hits[0][1], fresh_hits[0][1], rel_tol=1e-5)
+
+
+def test_confidence_matches_a_compacted_index():
+    texts = ["box jellyfish sting vinegar"] + ["box jellyfish"] * 20 + ["stingray shuffle", "rip current"]
+    index = _index(texts)
+    index.remove([f"c{i}" for i in range(1, 21)])
+    compacted = _index(texts)
+    compacted.remove([f"c{i}" for i in range(1, 21)])
+    compacted.compact()
+
+    def response(ix):
+        hits, query_idf = ix.search("box jellyfish", top_k=5)
+        return {"matches": [{"coverage": c} for _, _, c in hits], "query_idf": query_idf}
+
+    assert math.isclose(response(index)["query_idf"], response(compacted)["query_idf"], rel_tol=1e-6)
+    assert is_confident(response(index), min_idf=1.0) == is_confident(response(compacted), min_idf=1.0)
+
+
+def test_fusion_tolerates_matches_without_metadata():
+    dense = {"matches": [{"id": "a", "score": 0.9, "metadata": None}, {"id": "b", "score": 0.8}], "namespace": "ns"}
+    lexical = {"matches": [{"id": "a", "score": 7.0, "metadata": {"text": "rip currents"}}]}
+    fused = rrf_fuse([dense, lexical], top_k=5)
+    assert [m["id"] for m in fused["matches"]] == ["a", "b"]
+    assert fused["matches"][0]["metadata"] == {"text": "rip currents"}  # taken from whichever response had it
+    assert fused["matches"][1]["metadata"] == {}
@@ -0,0 +1,208 @@
+import math
+import threading
+import time
+
+import pytest
+
+from cache import EmbeddingCache, LRUCache, SemanticAnswerCache, TTLCache, mark_reindexed
+
+
+# ---------------------------
+# Embedding cache
+# ---------------------------
+def test_lru_evicts_the_least_recently_used_entry():
+    lru = LRUCache(maxsize=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1  # "b" is now the oldest
+    lru.put("c", 3)
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (1, 3)
+    assert lru.stats()["evictions"] == 1
+
+
+def test_lru_entries_expire_after_their_ttl(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("cache.time.time", lambda: clock[0])
+    lru = LRUCache(ttl=60)
+    lru.put("a", 1)
+    clock[0] += 59
+    assert lru.get("a") == 1
+    clock[0] += 2
+    assert lru.get("a") is None
+    assert len(lru) == 0
+
+
+def test_embeddings_survive_a_restart_in_sqlite(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    EmbeddingCache(path=path).put("Is it safe to swim?", "model", [0.25, -0.5, 1.0])
+
+    restarted = EmbeddingCache(path=path)
+    assert restarted.get("is it  safe to swim", "model") == [0.25, -0.5, 1.0]
+    assert restarted.get("Is it safe to swim?", "other-model") is None
+    assert restarted.get("Is it safe to swim?", "model") == [0.25, -0.5, 1.0]
+    stats = restarted.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_expired_embeddings_are_not_read_from_disk(tmp_path, monkeypatch):
+    path = str(tmp_path / "embeddings.sqlite3")
+    clock = [1000.0]
+    monkeypatch.setattr("cache.time.time", lambda: clock[0])
+    EmbeddingCache(path=path, disk_ttl=60).put("rip currents", "model", [1.0])
+    clock[0] += 61
+    assert EmbeddingCache(path=path, disk_ttl=60).get("rip currents", "model") is None
+
+
+def test_compute_runs_only_on_a_miss(tmp_path):
+    cache, calls = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3")), []
+
+    def compute(text):
+        calls.append(text)
+        return [1.0, 2.0]
+
+    assert cache.get_or_compute("jellyfish", "model", compute) == [1.0, 2.0]
+    assert cache.get_or_compute("Jellyfish?", "model", compute) == [1.0, 2.0]
+    assert calls == ["jellyfish"]
+
+
+def test_an_unopenable_database_leaves_a_memory_only_cache(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = EmbeddingCache(path=str(blocker / "embeddings.sqlite3"))
+    cache.put("sharks", "model", [0.5])
+    assert cache.get("sharks", "model") == [0.5]
+    assert cache.stats()["memory_hits"] == 1
+
+
+# ---------------------------
+# Semantic answer cache
+# ---------------------------
+def _at(cosine):
+    """A unit vector whose cosine similarity to [1, 0] is `cosine`."""
+    return [cosine, math.sqrt(1 - cosine ** 2)]
+
+
+def test_semantic_hits_start_at_the_threshold():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store("Is Venice Beach safe?", [1.0, 0.0], "Yes, with lifeguards.", "context", "ns")
+    assert cache.lookup(_at(0.99), "ns")["answer"] == "Yes, with lifeguards."
+    assert cache.lookup(_at(0.951), "ns") is not None
+    assert cache.lookup(_at(0.949), "ns") is None
+    assert cache.lookup([1.0, 0.0], "other") is None
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (2, 2)
+
+
+def test_the_most_similar_question_answers():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store("rip currents", [1.0, 0.0], "swim parallel", "", "ns")
+    cache.store("jellyfish", _at(0.8), "use vinegar", "", "ns")
+    hit = cache.lookup(_at(0.85), "ns")
+    assert hit["question"] == "jellyfish" and hit["similarity"] > 0.99
+
+
+def test_answers_stored_before_a_reindex_are_ignored(monkeypatch):
+    cache = SemanticAnswerCache()
+    stored = time.time() - 10
+    monkeypatch.setattr("cache.time.time", lambda: stored)
+    cache.store("Is Venice Beach safe?", [1.0, 0.0], "old answer", "", "reindex-test")
+    cache.store("Is Venice Beach safe?", [1.0, 0.0], "other answer", "", "reindex-other")
+    monkeypatch.undo()
+
+    mark_reindexed("reindex-test")
+    assert cache.lookup([1.0, 0.0], "reindex-test") is None
+    assert cache.lookup([1.0, 0.0], "reindex-other")["answer"] == "other answer"
+    cache.store("Is Venice Beach safe?", [1.0, 0.0], "new answer", "", "reindex-test")
+    assert cache.lookup([1.0, 0.0], "reindex-test")["answer"] == "new answer"
+
+
+def test_semantic_entries_expire_and_are_evicted_lru_first(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("cache.time.time", lambda: clock[0])
+    cache = SemanticAnswerCache(maxsize=2, ttl=60)
+    cache.store("a", [1.0, 0.0], "A", "", "ns")
+    cache.store("b", [0.0, 1.0], "B", "", "ns")
+    assert cache.lookup([1.0, 0.0], "ns")["answer"] == "A"  # "b" is now the oldest
+    cache.store("c", [-1.0, 0.0], "C", "", "ns")
+    assert cache.lookup([0.0, 1.0], "ns") is None
+    clock[0] += 61
+    assert cache.lookup([1.0, 0.0], "ns") is None
+    assert cache.stats()["size"] == 0
+
+
+# ---------------------------
+# Stale-while-revalidate TTL cache
+# ---------------------------
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def _down():
+    raise ConnectionError("down")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("cache.time.time", lambda: now[0])
+    return now
+
+
+def test_ttl_entries_are_refetched_once_expired(clock):
+    cache, fetched = TTLCache(ttl=60), []
+
+    def fetch():
+        fetched.append(clock[0])
+        return len(fetched)
+
+    assert cache.get_or_fetch("tides", fetch) == 1
+    clock[0] += 59
+    assert cache.get_or_fetch("tides", fetch) == 1
+    clock[0] += 2
+    assert cache.get_or_fetch("tides", fetch) == 2
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 2)
+
+
+def test_stale_reads_return_at_once_while_one_refresh_runs(clock):
+    cache = TTLCache(ttl=60, stale_ttl=600)
+    cache.get_or_fetch("weather", lambda: "old")
+    clock[0] += 120
+    started, release, refreshes = threading.Event(), threading.Event(), []
+
+    def refresh():
+        refreshes.append(1)
+        started.set()
+        release.wait(5)
+        return "new"
+
+    assert [cache.get_or_fetch("weather", refresh) for _ in range(5)] == ["old"] * 5
+    assert started.wait(5)
+    release.set()
+    _wait_for(lambda: cache.stats()["refreshes"])
+    assert cache.get_or_fetch("weather", refresh) == "new"
+    assert len(refreshes) == 1
+    assert (cache.stats()["stale_hits"], cache.stats()["refreshes"]) == (5, 1)
+
+
+def test_a_failed_refresh_keeps_the_stale_value(clock):
+    cache = TTLCache(ttl=60, stale_ttl=600)
+    cache.get_or_fetch("weather", lambda: "old")
+    clock[0] += 120
+    assert cache.get_or_fetch("weather", _down) == "old"
+    _wait_for(lambda: cache.stats()["errors"])
+    assert cache.get_or_fetch("weather", lambda: "new") == "old"  # still stale; a new refresh starts
+
+
+def test_past_the_stale_window_the_caller_fetches(clock):
+    cache = TTLCache(ttl=60, stale_ttl=600)
+    cache.get_or_fetch("weather", lambda: "old")
+    clock[0] += 661
+    assert cache.get_or_fetch("weather", lambda: "new") == "new"
+    clock[0] += 661
+    with pytest.raises(ConnectionError):
+        cache.get_or_fetch("weather", _down)
+    assert cache.stats()["errors"] == 1  # errors are not cached
+    assert cache.get_or_fetch("weather", lambda: "newer") == "newer"
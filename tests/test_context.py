@@ -0,0 +1,76 @@
+import numpy as np
+
+from context import ContextBuilder, count_tokens, mmr_order
+
+RIP = "Rip currents are narrow channels of water flowing away from shore; swim parallel to the beach to escape one."
+JELLY = "Rinse a jellyfish sting with vinegar or sea water, never fresh water, and remove tentacles with tweezers."
+SHARK = "Shark sightings close the water for an hour; lifeguards fly a purple flag while the beach is closed."
+
+
+def _match(id, text, score, values=None):
+    match = {"id": id, "score": score, "metadata": {"text": text}}
+    if values is not None:
+        match["values"] = values
+    return match
+
+
+def test_near_duplicate_chunks_are_dropped():
+    matches = [_match("a", RIP, 0.9), _match("b", RIP + " ", 0.89), _match("c", JELLY, 0.5)]
+    assert [m["id"] for m in ContextBuilder().select(matches)] == ["a", "c"]
+
+
+def test_near_duplicate_vectors_are_dropped():
+    matches = [
+        _match("a", RIP, 0.9, [1.0, 0.0, 0.0]),
+        _match("b", JELLY, 0.9, [0.99, 0.05, 0.0]),
+        _match("c", SHARK, 0.5, [0.0, 1.0, 0.0]),
+    ]
+    chosen = ContextBuilder().select(matches, query_vector=[1.0, 0.0, 0.0])
+    assert [m["id"] for m in chosen] == ["a", "c"]
+
+
+def test_mmr_prefers_a_new_chunk_over_a_redundant_one():
+    relevance = np.array([1.0, 0.95, 0.6])
+    similarity = np.array([[1.0, 0.8, 0.0], [0.8, 1.0, 0.0], [0.0, 0.0, 1.0]])
+    assert mmr_order(relevance, similarity, lam=0.5) == [0, 2, 1]
+
+
+def test_token_budget_is_never_exceeded():
+    texts = [f"{text} Chunk {n}." for n in range(6) for text in (RIP, JELLY, SHARK)]
+    matches = [_match(f"c{n}", text, 1.0 - n / 100) for n, text in enumerate(texts)]
+    for budget in (30, 60, 100, 250):
+        builder = ContextBuilder(budget_tokens=budget, duplicate_threshold=1.1)
+        context, chosen, tokens = builder.build({"matches": matches})
+        assert chosen
+        assert tokens <= budget
+        assert count_tokens(context) <= budget
+
+
+def test_a_chunk_longer_than_the_budget_is_truncated_to_fit():
+    context, chosen, tokens = ContextBuilder(budget_tokens=30).build({"matches": [_match("a", RIP * 5, 0.9)]})
+    assert [m["id"] for m in chosen] == ["a"]
+    assert tokens == 30 and count_tokens(context) <= 30
+
+
+def test_an_empty_response_gives_an_empty_context():
+    assert ContextBuilder().build({"matches": []}) == ("", [], 0)
+    assert ContextBuilder().build({"matches": [_match("a", "", 0.9)]}) == ("", [], 0)
+
+
+def test_content_extraction_uses_the_shared_pipelines_builder(monkeypatch):
+    import rag
+    from fakes import FakeOpenAIClient, FakeStreamingChatModel
+
+    pipeline = rag.RagPipeline(client=FakeOpenAIClient(), backend=object(), lexical=None,
+                               llm=FakeStreamingChatModel(ttft=0, token_latency=0),
+                               context_builder=ContextBuilder(budget_tokens=30))
+    monkeypatch.setattr(rag, "_pipeline", pipeline)
+    context = rag.content_extraction({"matches": [_match("a", RIP, 0.9), _match("b", JELLY, 0.8)]})
+    assert context and count_tokens(context) <= 30
+    assert rag.content_extraction({"matches": []}) == ""
+
+
+def test_matches_without_metadata_are_skipped():
+    matches = [{"id": "a", "score": 0.9}, {"id": "b", "score": 0.8, "metadata": None}, _match("c", JELLY, 0.5)]
+    context, chosen, _ = ContextBuilder().build({"matches": matches})
+    assert [m["id"] for m in chosen] == ["c"] and context == JELLY
@@ -0,0 +1,47 @@
+import threading
+
+from hazards import PURGE_INTERVAL, HazardStore
+
+LAT, LON = 34.0100, -118.4960
+
+
+def test_repeat_report_nearby_is_merged(tmp_path):
+    store = HazardStore(str(tmp_path / "hazards.sqlite3"))
+    first = store.add(LAT, LON, "Jellyfish", now=1000)
+    assert store.add(LAT + 0.0001, LON, " jellyfish ", now=1001) == first
+    assert store.get(first)["reports"] == 2
+    assert store.add(LAT, LON, "Broken glass", now=1002) != first
+
+
+def test_concurrent_identical_reports_insert_once(tmp_path):
+    # separate connections behave like separate processes sharing the file
+    path = str(tmp_path / "hazards.sqlite3")
+    stores = [HazardStore(path) for _ in range(8)]
+    barrier = threading.Barrier(len(stores))
+    ids = []
+
+    def report(store):
+        barrier.wait()
+        ids.append(store.add(LAT, LON, "Rip current"))
+
+    threads = [threading.Thread(target=report, args=(store,)) for store in stores]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(ids)) == 1
+    assert stores[0].count() == 1
+    assert stores[0].get(ids[0])["reports"] == len(stores)
+
+
+def test_add_purges_expired_rows(tmp_path):
+    store = HazardStore(str(tmp_path / "hazards.sqlite3"))
+    store.add(LAT, LON, "Trash", ttl=60, now=1000)
+    store.add(LAT + 1, LON, "Trash", ttl=60, now=1010)
+    assert store.count() == 2
+    # within the purge interval expired rows are only hidden, then deleted
+    store.add(LAT + 2, LON, "High surf", now=1100)
+    assert store.count() == 3
+    assert len(store.query(now=1100)) == 1
+    store.add(LAT + 3, LON, "High surf", now=1000 + PURGE_INTERVAL)
+    assert store.count() == 2
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from bm25 import BM25Index
+from fakes import FakeOpenAIClient
+from ingest import Manifest, ingest
+
+
+class RecordingIndex:
+    def __init__(self):
+        self.vectors = {}
+
+    def upsert(self, vectors, namespace):
+        self.vectors.update((v["id"], v) for v in vectors)
+
+    def delete(self, ids, namespace):
+        for vid in ids:
+            self.vectors.pop(vid)
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def sources(index):
+    return {v["metadata"]["source"] for v in index.vectors.values()}
+
+
+def run(paths, index, manifest, lexical):
+    return ingest(paths, FakeOpenAIClient(), index, manifest, workers=1, lexical=lexical)
+
+
+def test_deleted_documents_are_pruned(tmp_path):
+    docs = tmp_path / "docs"
+    keep, drop = str(docs / "keep.md"), str(docs / "sub" / "drop.md")
+    write(keep, "Rip currents pull swimmers away from shore.")
+    write(drop, "Stingrays shuffle in the shallows at Seal Beach.")
+    index, manifest, lexical = RecordingIndex(), Manifest(str(tmp_path / "manifest.sqlite3")), BM25Index()
+    run([str(docs)], index, manifest, lexical)
+    assert sources(index) == {keep, drop}
+
+    os.remove(drop)
+    stats = run([str(docs)], index, manifest, lexical)
+    assert stats["deleted"] == 1
+    assert sources(index) == {keep}
+    assert manifest.sources("oceansafe") == {keep}
+    assert lexical.live_count == 1
+
+
+def test_documents_outside_the_paths_are_kept(tmp_path):
+    a, b = str(tmp_path / "a" / "one.md"), str(tmp_path / "b" / "two.md")
+    write(a, "Lifeguard towers open at nine.")
+    write(b, "Red flags mean no swimming.")
+    index, manifest = RecordingIndex(), Manifest(str(tmp_path / "manifest.sqlite3"))
+    run([str(tmp_path / "a")], index, manifest, None)
+    run([str(tmp_path / "b")], index, manifest, None)
+    assert sources(index) == {a, b}
+
+
+def test_a_failed_index_delete_keeps_the_manifest_rows(tmp_path, monkeypatch):
+    docs = tmp_path / "docs"
+    keep, drop = str(docs / "keep.md"), str(docs / "drop.md")
+    write(keep, "Rip currents pull swimmers away from shore.")
+    write(drop, "Stingrays shuffle in the shallows at Seal Beach.")
+    index, manifest = RecordingIndex(), Manifest(str(tmp_path / "manifest.sqlite3"))
+    run([str(docs)], index, manifest, None)
+    os.remove(drop)
+
+    def unavailable(ids, namespace):
+        raise ConnectionError("index unavailable")
+
+    monkeypatch.setattr("ingest.time.sleep", lambda seconds: None)
+    monkeypatch.setattr(index, "delete", unavailable)
+    with pytest.raises(ConnectionError):
+        run([str(docs)], index, manifest, None)
+    assert manifest.sources("oceansafe") == {keep, drop}  # the next run still knows to delete it
+
+    monkeypatch.undo()
+    assert run([str(docs)], index, manifest, None)["deleted"] == 1
+    assert sources(index) == {keep}
+    assert manifest.sources("oceansafe") == {keep}
+
+
+def test_chunks_shared_with_another_document_stay_in_the_index(tmp_path):
+    docs = tmp_path / "docs"
+    one, two = str(docs / "one.md"), str(docs / "two.md")
+    write(one, "Red flags mean no swimming.")
+    write(two, "Red flags mean no swimming.")
+    index, manifest = RecordingIndex(), Manifest(str(tmp_path / "manifest.sqlite3"))
+    run([str(docs)], index, manifest, None)
+    os.remove(one)
+    assert run([str(docs)], index, manifest, None)["deleted"] == 0
+    assert len(index.vectors) == 1
+    assert manifest.sources("oceansafe") == {two}
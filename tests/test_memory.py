@@ -0,0 +1,69 @@
+import pytest
+
+from memory import ConversationMemory, Rewrite
+
+BEACHES = ["Laguna Beach", "Huntington Beach", "Venice Beach", "Santa Monica Pier"]
+
+
+def memory_after(question):
+    memory = ConversationMemory(BEACHES)
+    memory.record(question, memory.rewrite(question), "answer")
+    return memory
+
+
+def test_first_question_is_standalone():
+    memory = ConversationMemory(BEACHES)
+    assert memory.rewrite("Is Laguna Beach safe?") == Rewrite("Is Laguna Beach safe?", False, "Is Laguna Beach safe?")
+
+
+@pytest.mark.parametrize("question", [
+    "Does Huntington have lifeguards?",
+    "and at Venice?",
+    "Is it safe in Hawaii?",
+    "Are there sharks at Malibu today?",
+    "How cold is the water in winter?",
+])
+def test_new_beach_or_place_is_kept_as_typed(question):
+    memory = memory_after("Where is the best parking in Laguna Beach?")
+    assert memory.rewrite(question) == Rewrite(question, False, question)
+
+
+@pytest.mark.parametrize("question", ["thanks", "ok great, thank you!", "cool"])
+def test_small_talk_is_kept_as_typed_but_keeps_the_topic(question):
+    memory = memory_after("Where is the best parking in Laguna Beach?")
+    assert memory.rewrite(question) == Rewrite(question, False, "Where is the best parking in Laguna Beach?")
+
+
+def test_follow_up_after_small_talk_builds_on_the_earlier_topic():
+    memory = memory_after("Is parking at Venice Beach expensive?")
+    memory.record("thanks", memory.rewrite("thanks"), "You're welcome!")
+    rewrite = memory.rewrite("and is it free on weekends?")
+    assert rewrite.follow_up
+    assert rewrite.query == "Is parking at Venice Beach expensive: is it free on weekends?"
+
+
+def test_pronoun_follow_up_keeps_the_topic():
+    memory = memory_after("Where is the best parking in Laguna Beach?")
+    rewrite = memory.rewrite("Is it free?")
+    assert rewrite.follow_up
+    assert rewrite.query == "Where is the best parking in Laguna Beach: Is it free?"
+    assert rewrite.topic == "Where is the best parking in Laguna Beach?"
+
+
+def test_there_points_at_the_topic_beach():
+    memory = memory_after("Are there lifeguards at Venice Beach?")
+    assert memory.rewrite("Are jellyfish common there?").query == "Are jellyfish common at Venice Beach?"
+
+
+def test_elliptical_follow_ups():
+    memory = memory_after("Is Laguna Beach crowded on weekends?")
+    assert memory.rewrite("what about jellyfish?").query == "jellyfish at Laguna Beach?"
+    assert memory.rewrite("and tomorrow?").query == "Is Laguna Beach crowded on weekends: tomorrow?"
+
+
+def test_prompt_question_is_what_the_user_typed():
+    memory = memory_after("Where is the best parking in Laguna Beach?")
+    rewrite = memory.rewrite("Is it free?")
+    prompt = memory.prompt_question("Is it free?", rewrite.follow_up)
+    assert prompt.startswith("Is it free?\n\nEarlier in this conversation:")
+    assert memory.prompt_question("Does Huntington have lifeguards?", False) == "Does Huntington have lifeguards?"
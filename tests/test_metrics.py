@@ -0,0 +1,122 @@
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import conditions
+import metrics
+
+
+# ---------------------------
+# Format
+# ---------------------------
+def test_prometheus_text_format():
+    registry = metrics.Registry()
+    for value in (0.1, 0.2, 0.3, 0.4):
+        registry.observe("stage_seconds", value, (("stage", "embed"),))
+    registry.inc("requests", 3, (("cached", "true"),))
+    text = registry.prometheus_text([("queue_depth", (("scheduler", "chat"),), 2.0)])
+    assert text.splitlines() == [
+        "# TYPE oceansafe_stage_seconds summary",
+        'oceansafe_stage_seconds{stage="embed",quantile="0.5"} 0.3',
+        'oceansafe_stage_seconds{stage="embed",quantile="0.95"} 0.4',
+        'oceansafe_stage_seconds{stage="embed",quantile="0.99"} 0.4',
+        'oceansafe_stage_seconds_sum{stage="embed"} 1',
+        'oceansafe_stage_seconds_count{stage="embed"} 4',
+        "# TYPE oceansafe_requests counter",
+        'oceansafe_requests{cached="true"} 3',
+        "# TYPE oceansafe_queue_depth gauge",
+        'oceansafe_queue_depth{scheduler="chat"} 2',
+    ]
+    assert text.endswith("\n")
+
+
+# ---------------------------
+# Exporter
+# ---------------------------
+@pytest.fixture
+def servers(monkeypatch):
+    """Records the addresses start_exporter binds, and lets it start again."""
+    started = []
+
+    class RecordingServer(metrics.ThreadingHTTPServer):
+        def __init__(self, address, handler):
+            super().__init__(address, handler)
+            started.append(self)
+
+    monkeypatch.setattr(metrics, "ThreadingHTTPServer", RecordingServer)
+    monkeypatch.setattr(metrics, "_exporter_started", False)
+    yield started
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def test_exporter_is_off_without_a_port_or_file(servers):
+    metrics.start_exporter(port=None, path=None)
+    assert servers == [] and not metrics._exporter_started
+    assert not [t for t in threading.enumerate() if t.name.startswith("metrics-")]
+
+
+def test_exporter_listens_on_localhost_by_default(servers):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    metrics.inc("exporter_test")
+    metrics.start_exporter(port=str(port), path=None)
+    metrics.start_exporter(port=str(port), path=None)  # reruns start nothing more
+    assert [server.server_address for server in servers] == [("127.0.0.1", port)]
+
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+        assert response.headers["Content-Type"].startswith("text/plain")
+        assert "oceansafe_exporter_test 1" in response.read().decode()
+    with pytest.raises(urllib.error.HTTPError):
+        urllib.request.urlopen(f"http://127.0.0.1:{port}/other", timeout=5)
+
+
+# ---------------------------
+# Gauges
+# ---------------------------
+
+
+def test_condition_cache_stats_are_exported_as_gauges():
+    conditions.weather_cache.get_or_fetch(("metrics-test",), lambda: {"temperature": 18})
+    conditions.weather_cache.get_or_fetch(("metrics-test",), lambda: {"temperature": 18})
+    text = metrics.prometheus_text()
+    assert "# TYPE oceansafe_cache_hits gauge" in text
+    stats = conditions.cache_stats()["weather"]
+    assert f'oceansafe_cache_hits{{cache="weather"}} {stats["hits"]}' in text
+    assert f'oceansafe_cache_size{{cache="weather"}} {stats["size"]}' in text
+    assert 'oceansafe_cache_misses{cache="tides"}' in text
+
+
+def test_gauge_collectors_skip_missing_values_and_can_be_replaced():
+    metrics.register_gauges("test", lambda: [("test_value", {"kind": "a"}, 1), ("test_value", {"kind": "b"}, None)])
+    metrics.register_gauges("test", lambda: [("test_value", {"kind": "a"}, 2.5)])
+    try:
+        lines = metrics.prometheus_text().splitlines()
+        assert [line for line in lines if "test_value" in line] == [
+            "# TYPE oceansafe_test_value gauge",
+            'oceansafe_test_value{kind="a"} 2.5',
+        ]
+    finally:
+        del metrics._collectors["test"]
+
+
+def test_upstream_stats_are_exported_as_gauges(monkeypatch):
+    import requests
+
+    from test_upstream import URL, ScriptedSession, client
+
+    upstream = client(ScriptedSession([requests.ConnectionError("down")]), failure_threshold=1)
+    monkeypatch.setattr(conditions, "upstream", upstream)
+    try:
+        upstream.get_json(URL)
+    except requests.ConnectionError:
+        pass
+    text = metrics.prometheus_text()
+    assert 'oceansafe_upstream_requests{host="upstream.test"} 1' in text
+    assert 'oceansafe_upstream_errors{host="upstream.test"} 1' in text
+    assert 'oceansafe_upstream_circuit_open{host="upstream.test"} 1' in text
@@ -0,0 +1,162 @@
+import asyncio
+import time
+
+import pytest
+
+from fakes import (
+    FakeAsyncOpenAIClient, FakeOpenAIClient, FakeRateLimitError, FakeStreamingChatModel, Upstream, build_local_index,
+    synthetic_questions,
+)
+
+
+def test_only_an_injected_model_is_reused_across_event_loops(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    import rag
+
+    default = rag.RagPipeline(client=FakeOpenAIClient(), backend=object(), lexical=None)
+    injected = rag.RagPipeline(client=FakeOpenAIClient(), backend=object(), lexical=None,
+                               llm=FakeStreamingChatModel(ttft=0, token_latency=0))
+    assert not default._llm_injected
+    assert injected._llm_injected
+
+
+def test_candidates_fetched_follow_the_context_builder():
+    import rag
+    from context import ContextBuilder
+
+    def pipeline(**kwargs):
+        return rag.RagPipeline(client=FakeOpenAIClient(), backend=object(), lexical=None,
+                               llm=FakeStreamingChatModel(ttft=0, token_latency=0), **kwargs)
+
+    assert pipeline(context_builder=ContextBuilder(fetch_k=20)).top_k == 20
+    assert pipeline(context_builder=None).top_k == 2
+    assert pipeline(context_builder=ContextBuilder(fetch_k=20), top_k=5).top_k == 5
+
+
+# ---------------------------
+# Async batch path
+# ---------------------------
+@pytest.fixture(scope="module")
+def index_root(tmp_path_factory):
+    return build_local_index(str(tmp_path_factory.mktemp("index")), count=200)
+
+
+def async_pipeline(index_root, chat_upstream=None, embed_upstream=None, **kwargs):
+    import rag
+    from retrieval import LocalVectorIndex
+    from scheduler import AdmissionScheduler, SingleFlight
+
+    kwargs.setdefault("chat_scheduler", AdmissionScheduler(4, name="chat-test"))
+    kwargs.setdefault("embed_scheduler", AdmissionScheduler(4, name="embed-test"))
+    return rag.RagPipeline(
+        client=FakeOpenAIClient(), async_client=FakeAsyncOpenAIClient(upstream=embed_upstream),
+        backend=LocalVectorIndex(index_root), lexical=None, embedding_cache=None, answer_cache=None,
+        llm=FakeStreamingChatModel(ttft=0.05, token_latency=0, answer_tokens=5, upstream=chat_upstream),
+        flights=SingleFlight("test"), **kwargs,
+    )
+
+
+def test_identical_async_questions_share_one_chat_call(index_root):
+    chat = Upstream()
+    pipeline = async_pipeline(index_root, chat_upstream=chat)
+    answers = pipeline.answer_many(["Is a rip current dangerous?"] * 4 + ["How do I treat a jellyfish sting?"])
+    assert len({answer for answer, _ in answers[:4]}) == 1
+    assert chat.stats()["calls"] == 2
+
+
+def test_async_calls_are_admitted_by_the_scheduler(index_root):
+    from scheduler import AdmissionScheduler
+
+    chat = Upstream(max_in_flight=2)
+    pipeline = async_pipeline(index_root, chat_upstream=chat, chat_scheduler=AdmissionScheduler(2, name="chat-test"))
+    answers = pipeline.answer_many(synthetic_questions(12), concurrency=8)
+    assert len(answers) == 12
+    assert chat.stats() == {"calls": 12, "rate_limited": 0, "peak_in_flight": 2}
+
+
+def test_async_429s_pause_and_retry(index_root):
+    from scheduler import AdmissionScheduler
+
+    embed, chat = Upstream(rate_limit_every=1, retry_after=0.05), Upstream(rate_limit_every=2, retry_after=0.05)
+    embed_scheduler = AdmissionScheduler(4, max_retries=2, name="embed-test")
+    chat_scheduler = AdmissionScheduler(4, max_retries=2, name="chat-test")
+    pipeline = async_pipeline(index_root, chat_upstream=chat, embed_upstream=embed,
+                              chat_scheduler=chat_scheduler, embed_scheduler=embed_scheduler)
+    with pytest.raises(FakeRateLimitError):
+        pipeline.answer_many(["Is a rip current dangerous?"])
+    assert embed.stats()["calls"] == 3 and embed_scheduler.stats()["retries"] == 2
+
+    embed.rate_limit_every = 0
+    answers = pipeline.answer_many(["Is a rip current dangerous?", "How do I treat a jellyfish sting?"], concurrency=1)
+    assert len(answers) == 2
+    assert chat.stats()["rate_limited"] == 1 and chat_scheduler.stats()["retries"] == 1
+
+
+# ---------------------------
+# Streaming
+# ---------------------------
+def test_answers_stream_token_by_token_with_ttft_before_total(index_root, monkeypatch):
+    import rag
+    from retrieval import LocalVectorIndex
+
+    pipeline = rag.RagPipeline(
+        client=FakeOpenAIClient(), backend=LocalVectorIndex(index_root), lexical=None,
+        embedding_cache=None, answer_cache=None,
+        llm=FakeStreamingChatModel(ttft=0.1, token_latency=0.03, answer_tokens=8),
+    )
+    monkeypatch.setattr(rag, "_pipeline", pipeline)
+    timings, arrivals, tokens = {}, [], []
+    stream = rag.stream_answer_question("Is a rip current dangerous?", timings)
+
+    for token in stream:
+        arrivals.append(time.perf_counter())
+        tokens.append(token)
+        if len(tokens) == 1:
+            assert "ttft" in timings and "total" not in timings
+    assert len(tokens) == 8 and "".join(tokens).split() == [t.strip() for t in tokens]
+    assert arrivals[-1] - arrivals[0] >= 7 * 0.03 * 0.8  # tokens arrived as generated, not all at once
+    assert timings["retrieval"] <= timings["ttft"] < timings["total"]
+    assert timings["total"] - timings["ttft"] >= 7 * 0.03 * 0.8
+
+
+# ---------------------------
+# Batch API
+# ---------------------------
+class SlowFirstChatModel(FakeStreamingChatModel):
+    """Takes longer on questions earlier in `order`, so answers finish in reverse."""
+
+    order: list = []
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = messages[-1].content
+        rank = next(i for i, question in enumerate(self.order) if question in prompt)
+        await asyncio.sleep(0.03 * (len(self.order) - rank))
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+
+def test_answer_many_keeps_input_order_and_embeds_in_one_batch(index_root):
+    import rag
+    from retrieval import LocalVectorIndex
+
+    questions = synthetic_questions(6)
+    embed, batches = Upstream(), []
+    client = FakeAsyncOpenAIClient(upstream=embed)
+    create = client.embeddings.create
+
+    async def recording_create(input, model=None):
+        batches.append(list(input))
+        return await create(input, model)
+
+    client.embeddings.create = recording_create
+    llm = SlowFirstChatModel(ttft=0, token_latency=0, answer_tokens=20, order=questions)
+    pipeline = rag.RagPipeline(
+        client=FakeOpenAIClient(), async_client=client, backend=LocalVectorIndex(index_root), lexical=None,
+        embedding_cache=None, answer_cache=None, llm=llm,
+    )
+    answers = pipeline.answer_many(questions, concurrency=6)
+
+    assert batches == [questions]  # one embeddings request for the whole batch
+    assert embed.stats()["calls"] == 1
+    expected = [pipeline.respond(question) for question in questions]
+    assert [answer for answer, _ in answers] == [answer for answer, _ in expected]
+    assert len({answer for answer, _ in answers}) == len(questions)
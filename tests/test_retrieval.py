@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from retrieval import LocalVectorIndex, write_namespace
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_empty_namespace_round_trips(tmp_path, dtype):
+    write_namespace(str(tmp_path), "empty", [], [], [], dtype=dtype, dimension=8)
+    assert np.load(tmp_path / "empty" / "vectors.npy").shape == (0, 8)
+    index = LocalVectorIndex(str(tmp_path))
+    assert index.query([1.0] * 8, top_k=3, namespace="empty")["matches"] == []
+
+
+def test_empty_namespace_needs_a_dimension(tmp_path):
+    with pytest.raises(ValueError):
+        write_namespace(str(tmp_path), "empty", [], [], [])
+
+
+def test_query_returns_nearest_first(tmp_path):
+    vectors = np.eye(4, dtype=np.float32)
+    write_namespace(str(tmp_path), "ns", ["a", "b", "c", "d"], vectors, [{"i": i} for i in range(4)])
+    matches = LocalVectorIndex(str(tmp_path)).query([0.1, 0.9, 0, 0], top_k=2, namespace="ns")["matches"]
+    assert [m["id"] for m in matches] == ["b", "a"]
@@ -0,0 +1,206 @@
+import threading
+import time
+
+import pytest
+
+from fakes import FakeRateLimitError, Upstream
+from scheduler import AdmissionScheduler, Overloaded, SingleFlight
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def _run(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def _join(threads):
+    for thread in threads:
+        thread.join(5)
+        assert not thread.is_alive()
+
+
+# ---------------------------
+# Single-flight
+# ---------------------------
+def test_concurrent_calls_with_one_key_share_one_upstream_call():
+    flight = SingleFlight("test")
+    upstream = Upstream()
+    entered, release = threading.Event(), threading.Event()
+    results = []
+
+    def fn():
+        with upstream.request():
+            entered.set()
+            release.wait(5)
+            return "answer"
+
+    leader = _run([lambda: results.append(flight.do("key", fn))])
+    entered.wait(5)
+    followers = _run([lambda: results.append(flight.do("key", fn)) for _ in range(7)])
+    time.sleep(0.1)  # let the followers find the in-flight call
+    release.set()
+    _join(leader + followers)
+
+    assert results == ["answer"] * 8
+    assert upstream.stats()["calls"] == 1
+    assert flight.do("key", lambda: "fresh") == "fresh"  # nothing is cached once the call is done
+
+
+def test_followers_get_the_leaders_error():
+    flight = SingleFlight("test")
+    entered, release = threading.Event(), threading.Event()
+    errors = []
+
+    def fn():
+        entered.set()
+        release.wait(5)
+        raise FakeRateLimitError()
+
+    def call():
+        try:
+            flight.do("key", fn)
+        except FakeRateLimitError as exc:
+            errors.append(exc)
+
+    leader = _run([call])
+    entered.wait(5)
+    followers = _run([call, call])
+    time.sleep(0.1)
+    release.set()
+    _join(leader + followers)
+    assert len(errors) == 3
+
+
+def test_streams_with_one_key_share_one_upstream_iterator():
+    flight = SingleFlight("test")
+    upstream = Upstream()
+    release = threading.Event()
+
+    def make_iter():
+        with upstream.request():
+            yield "Swim"
+            release.wait(5)
+            yield " near a lifeguard."
+
+    first = flight.stream("key", make_iter)
+    second = flight.stream("key", make_iter)
+    release.set()
+    assert "".join(first) == "".join(second) == "Swim near a lifeguard."
+    assert upstream.stats()["calls"] == 1
+
+
+# ---------------------------
+# Admission
+# ---------------------------
+def test_waiting_sessions_are_served_round_robin():
+    scheduler = AdmissionScheduler(max_concurrency=1, max_queue=8, queue_timeout=5)
+    scheduler.acquire("holder")
+    order = []
+
+    def waiter(session):
+        def run():
+            scheduler.acquire(session)
+            order.append(session)
+            scheduler.release()
+        return run
+
+    threads = []
+    for n, session in enumerate(["busy", "busy", "busy", "quiet"], 1):
+        threads += _run([waiter(session)])
+        _wait_for(lambda: scheduler.stats()["queued"] == n)
+    assert scheduler.stats()["sessions_waiting"] == 2
+    scheduler.release()
+    _join(threads)
+
+    assert order == ["busy", "quiet", "busy", "busy"]
+    assert scheduler.stats()["active"] == 0
+
+
+def test_full_queue_raises_overloaded():
+    scheduler = AdmissionScheduler(max_concurrency=1, max_queue=1, queue_timeout=5)
+    scheduler.acquire("a")
+    queued = _run([lambda: scheduler.acquire("b")])
+    _wait_for(lambda: scheduler.stats()["queued"] == 1)
+
+    with pytest.raises(Overloaded, match="queue is full"):
+        scheduler.acquire("c")
+    assert scheduler.stats()["rejected"] == 1
+    scheduler.release()
+    _join(queued)
+
+
+def test_queue_wait_times_out_with_overloaded():
+    scheduler = AdmissionScheduler(max_concurrency=1, max_queue=4, queue_timeout=0.05)
+    scheduler.acquire("a")
+    with pytest.raises(Overloaded, match="queue wait exceeded"):
+        scheduler.acquire("b")
+    stats = scheduler.stats()
+    assert (stats["queued"], stats["sessions_waiting"], stats["rejected"]) == (0, 0, 1)
+
+
+def test_a_429_pauses_admission_and_is_retried():
+    scheduler = AdmissionScheduler(max_concurrency=4, max_retries=2)
+    upstream = Upstream(rate_limit_every=2, retry_after=0.2)
+
+    def fn():
+        with upstream.request():
+            return "ok"
+
+    assert scheduler.call(fn, "a") == "ok"
+    start = time.monotonic()
+    assert scheduler.call(fn, "a") == "ok"  # 429, paused for Retry-After, then retried
+    assert time.monotonic() - start >= 0.2
+    assert upstream.stats() == {"calls": 3, "rate_limited": 1, "peak_in_flight": 1}
+    assert scheduler.stats()["retries"] == 1
+
+
+def test_a_pause_holds_other_sessions_too():
+    scheduler = AdmissionScheduler(max_concurrency=4, queue_timeout=5)
+    scheduler.pause(0.2)
+    assert scheduler.stats()["paused_for"] > 0
+    assert scheduler.acquire("other") >= 0.15
+    scheduler.release()
+
+
+def test_rate_limit_error_surfaces_after_max_retries():
+    scheduler = AdmissionScheduler(max_concurrency=1, max_retries=2, backoff=0.01, max_backoff=0.01)
+    upstream = Upstream(rate_limit_every=1)
+
+    def fn():
+        with upstream.request():
+            return "ok"
+
+    with pytest.raises(FakeRateLimitError):
+        scheduler.call(fn, "a")
+    assert upstream.stats()["calls"] == 3
+    assert scheduler.stats()["active"] == 0
+
+
+def test_async_waiters_are_admitted_without_blocking_the_loop():
+    import asyncio
+
+    scheduler = AdmissionScheduler(max_concurrency=1, max_queue=4, queue_timeout=5)
+
+    async def main():
+        await scheduler.aacquire("a")
+        waiter = asyncio.ensure_future(scheduler.aacquire("b"))
+        cancelled = asyncio.ensure_future(scheduler.aacquire("c"))
+        await asyncio.sleep(0.05)
+        assert scheduler.stats()["queued"] == 2
+        cancelled.cancel()  # a cancelled waiter gives up its place in the queue
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert scheduler.stats()["queued"] == 1
+        scheduler.release()
+        await asyncio.wait_for(waiter, 1)
+        scheduler.release()
+
+    asyncio.run(main())
+    assert scheduler.stats()["active"] == 0 and scheduler.stats()["queued"] == 0
@@ -0,0 +1,178 @@
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import conditions
+from tides import (
+    DOODSON, HARCON_DIR, HILO_MAX_HEIGHT_ERROR_FT, HILO_MAX_TIME_ERROR_MIN, HarmonicPredictor, astronomical_arguments,
+    check_against_hilo, find_extrema, summarize_tides, validate_against_fixture,
+)
+
+FIXTURE_9410840 = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               "benchmarks", "fixtures", "noaa_predictions_9410840.json")
+
+
+def grid(n, step_minutes=6):
+    return np.datetime64("2024-01-01T00:00") + np.arange(n) * np.timedelta64(step_minutes, "m")
+
+
+def synthetic(days, step_minutes=6):
+    hours = np.arange(days * 24 * 60 // step_minutes) * step_minutes / 60
+    return 2.5 + 1.8 * np.sin(2 * np.pi * hours / 12.42) + 0.9 * np.sin(2 * np.pi * hours / 23.93 + 1.0)
+
+
+def test_repeated_values_on_a_rise_are_not_turning_points():
+    heights = [5.120, 5.123, 5.124, 5.124, 5.125, 5.126, 5.127]
+    assert find_extrema(heights, grid(len(heights))).empty
+
+
+def test_repeated_values_on_a_fall_are_not_turning_points():
+    heights = [1.0, 0.9, 0.9, 0.8, 0.7, 0.6]
+    assert find_extrema(heights, grid(len(heights))).empty
+
+
+def test_flat_top_is_one_high_in_the_middle_of_the_run():
+    heights = [1.0, 2.0, 3.0, 3.0, 3.0, 2.0, 1.0]
+    times = grid(len(heights))
+    extrema = find_extrema(heights, times)
+    assert extrema["type"].tolist() == ["High Tide"]
+    assert extrema["height"].iloc[0] == 3.0
+    assert extrema["time"].iloc[0] == pd.Timestamp(times[3])
+
+
+def test_flat_bottom_is_one_low():
+    heights = [3.0, 2.0, 1.0, 1.0, 2.0, 3.0]
+    extrema = find_extrema(heights, grid(len(heights)))
+    assert extrema["type"].tolist() == ["Low Tide"]
+
+
+def test_rounding_does_not_add_extrema():
+    exact = synthetic(365)
+    times = grid(len(exact))
+    expected = find_extrema(exact, times)
+    rounded = find_extrema(np.round(exact, 2), times)
+    assert len(rounded) == len(expected)
+    assert (rounded["type"].to_numpy() == expected["type"].to_numpy()).all()
+    drift = np.abs((rounded["time"] - expected["time"]).dt.total_seconds())
+    assert drift.max() < 30 * 60
+
+
+def test_nan_gaps_are_not_turning_points():
+    heights = np.array([1.0, 2.0, np.nan, 2.0, 1.0, 0.5, 1.0])
+    extrema = find_extrema(heights, grid(len(heights)))
+    assert extrema["type"].tolist() == ["Low Tide"]
+
+
+def test_summarize_tides_on_rounded_predictions():
+    heights = np.round(synthetic(1), 2)
+    df = pd.DataFrame({"t": grid(len(heights)), "Tide (ft)": heights})
+    summary = summarize_tides(df)
+    assert len(summary) == len(find_extrema(synthetic(1), grid(len(heights))))
+    assert set(summary["Type"]) <= {"High Tide", "Low Tide"}
+
+
+# ---------------------------
+# Harmonic source gating
+# ---------------------------
+# NOAA's published speeds (degrees per hour) for its 37 constituents
+NOAA_SPEEDS = {
+    "M2": 28.9841042, "S2": 30.0, "N2": 28.4397295, "K1": 15.0410686, "M4": 57.9682084, "O1": 13.9430356,
+    "M6": 86.9523127, "MK3": 44.0251729, "S4": 60.0, "MN4": 57.4238337, "NU2": 28.5125831, "S6": 90.0,
+    "MU2": 27.9682084, "2N2": 27.8953548, "OO1": 16.1391017, "LAM2": 29.4556253, "S1": 15.0, "M1": 14.4966939,
+    "J1": 15.5854433, "MM": 0.5443747, "SSA": 0.0821373, "SA": 0.0410686, "MSF": 1.0158958, "MF": 1.0980331,
+    "RHO": 13.4715145, "Q1": 13.3986609, "T2": 29.9589333, "R2": 30.0410667, "2Q1": 12.8542862,
+    "P1": 14.9589314, "2SM2": 31.0158958, "M3": 43.4761563, "L2": 29.5284789, "2MK3": 42.9271398,
+    "K2": 30.0821373, "M8": 115.9364166, "MS4": 58.9841042,
+}
+
+
+def test_constituent_speeds_match_noaa():
+    hour = np.array(["2024-06-01T10:00", "2024-06-01T11:00"], dtype="datetime64[ns]")
+    astro, _ = astronomical_arguments(hour)
+    rates = astro[:, 1] - astro[:, 0]
+    assert set(DOODSON) == set(NOAA_SPEEDS)
+    for name, speed in NOAA_SPEEDS.items():
+        assert np.dot(DOODSON[name], rates) == pytest.approx(speed, abs=1e-5), name
+
+
+def m2_predictor(validated=None, station="test"):
+    return HarmonicPredictor(station, 2.8, ["M2", "K1"], [1.6, 1.1], [150.0, 220.0], validated)
+
+
+def write_recording(path, predictions, station="test", interval="hilo"):
+    request = {"station": station, "product": "predictions", "interval": interval}
+    path.write_text(json.dumps({"request": request, "predictions": predictions}))
+    return str(path)
+
+
+def write_hilo(path, predictor, height_bias=0.0, time_shift_min=0):
+    """The curve's true turning points, from a 10-second grid rather than
+    find_extrema on the 6-minute frame check_against_hilo looks at."""
+    local = pd.date_range("2024-06-01 03:00", "2024-06-03 21:00", freq="10s", tz="America/Los_Angeles")
+    heights = predictor.predict(local.tz_convert("UTC").tz_localize(None).to_numpy())
+    slope = np.sign(np.diff(heights))
+    turns = np.flatnonzero(slope[1:] != slope[:-1]) + 1
+    shift = pd.Timedelta(minutes=time_shift_min)
+    predictions = [
+        {"t": (local[i].tz_localize(None) + shift).strftime("%Y-%m-%d %H:%M"), "v": f"{heights[i] + height_bias:.3f}",
+         "type": "H" if slope[i - 1] > 0 else "L"}
+        for i in turns
+    ]
+    return write_recording(path, predictions, predictor.station)
+
+
+def test_check_against_hilo_is_within_the_stated_tolerances(tmp_path):
+    predictor = m2_predictor()
+    report = check_against_hilo(predictor, write_hilo(tmp_path / "hilo.json", predictor))
+    assert report["passed"]
+    assert report["matched"] == report["points"] >= 8
+    assert report["max_time_error_min"] <= HILO_MAX_TIME_ERROR_MIN
+    assert report["max_height_error_ft"] <= HILO_MAX_HEIGHT_ERROR_FT
+
+
+@pytest.mark.parametrize("bias", [{"height_bias": 0.5}, {"time_shift_min": 20}])
+def test_check_against_hilo_fails_outside_the_tolerances(tmp_path, bias):
+    predictor = m2_predictor()
+    assert not check_against_hilo(predictor, write_hilo(tmp_path / "hilo.json", predictor, **bias))["passed"]
+
+
+def test_only_noaa_recordings_of_the_station_are_accepted(tmp_path):
+    predictor = m2_predictor()
+    hilo = write_hilo(tmp_path / "hilo.json", predictor)
+    with pytest.raises(ValueError, match="not a NOAA hilo recording for station other"):
+        check_against_hilo(m2_predictor(station="other"), hilo)
+    with pytest.raises(ValueError):
+        # the synthetic benchmark series is not a NOAA recording
+        validate_against_fixture(m2_predictor(station="9410840"), FIXTURE_9410840)
+
+
+def test_unvalidated_constituents_are_not_used(monkeypatch):
+    monkeypatch.setattr(conditions, "load_predictor", lambda station: m2_predictor())
+    monkeypatch.setattr(conditions, "TIDE_SOURCE", "harmonic")
+    with pytest.raises(LookupError):
+        conditions.fetch_tide_data("test")
+    monkeypatch.setattr(conditions, "load_predictor", lambda station: m2_predictor({"passed": True}))
+    assert not conditions.fetch_tide_data("test").empty
+
+
+def test_default_tide_source_is_noaa():
+    assert conditions.TIDE_SOURCE == os.environ.get("TIDE_SOURCE", "noaa")
+
+
+def test_committed_constituents_are_used_only_once_validated_against_noaa(monkeypatch):
+    validated = set()
+    for path in sorted(glob.glob(os.path.join(HARCON_DIR, "*.json"))):
+        predictor = HarmonicPredictor.from_file(path)
+        if predictor.validated:
+            report = check_against_hilo(predictor, predictor.validated["fixture"], tz=conditions.TIDE_TIMEZONE)
+            assert report["passed"], path
+            validated.add(predictor.station)
+    if "9410840" not in validated:
+        # nothing proves the predictor against NOAA for Santa Monica yet
+        monkeypatch.setattr(conditions, "TIDE_SOURCE", "harmonic")
+        with pytest.raises(LookupError):
+            conditions.fetch_tide_data("9410840")
@@ -0,0 +1,123 @@
+import pytest
+import requests
+
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamClient
+
+URL = "http://upstream.test/data"
+
+
+class Response:
+    def __init__(self, status, payload=None):
+        self.status_code = status
+        self.payload = payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}", response=self)
+
+    def json(self):
+        return self.payload
+
+
+class ScriptedSession:
+    """Stands in for requests.Session: answers from `script` in order, or
+    with the request's own params when the script is empty."""
+
+    def __init__(self, script=()):
+        self.script = list(script)
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        outcome = self.script.pop(0) if self.script else Response(200, dict(params or {}))
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def client(session, **kwargs):
+    kwargs.setdefault("retries", 0)
+    upstream = UpstreamClient(backoff=0, **kwargs)
+    upstream.session = session
+    return upstream
+
+
+def test_last_good_responses_are_bounded():
+    upstream = client(ScriptedSession(), last_good_size=3)
+    for day in range(10):
+        upstream.get_json(URL, params={"date": day})
+    assert len(upstream._last_good) == 3
+    assert [dict(key[1])["date"] for key in upstream._last_good] == [7, 8, 9]
+
+
+def test_last_good_fallback_expires(monkeypatch):
+    session = ScriptedSession()
+    upstream = client(session, last_good_ttl=60)
+    clock = [1000.0]
+    monkeypatch.setattr("upstream.time.monotonic", lambda: clock[0])
+    assert upstream.get_json(URL, params={"date": 1}) == {"date": 1}
+    session.script = [requests.ConnectionError("down")]
+    assert upstream.get_json(URL, params={"date": 1}) == {"date": 1}
+    clock[0] += 61
+    session.script = [requests.ConnectionError("down")]
+    with pytest.raises(requests.ConnectionError):
+        upstream.get_json(URL, params={"date": 1})
+    assert not upstream._last_good
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("upstream.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_breaker_opens_after_threshold_and_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock[0] += 30
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial at a time
+    breaker.record_failure()
+    assert breaker.state == "open"  # a failed trial re-opens it for another reset_timeout
+
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_open_circuit_short_circuits_to_the_last_good_response(clock):
+    session = ScriptedSession()
+    upstream = client(session, failure_threshold=2, reset_timeout=30)
+    assert upstream.get_json(URL, params={"date": 1}) == {"date": 1}
+    session.script = [requests.ConnectionError("down")] * 2
+    for _ in range(2):
+        assert upstream.get_json(URL, params={"date": 1}) == {"date": 1}
+    calls = session.calls
+
+    assert upstream.get_json(URL, params={"date": 1}) == {"date": 1}
+    with pytest.raises(CircuitOpenError):
+        upstream.get_json(URL, params={"date": 2})  # nothing to fall back to
+    assert session.calls == calls  # the host wasn't called while the circuit was open
+    stats = upstream.stats()["upstream.test"]
+    assert (stats["circuit"], stats["short_circuits"], stats["fallbacks"]) == ("open", 2, 3)
+
+    clock[0] += 30
+    assert upstream.get_json(URL, params={"date": 2}) == {"date": 2}  # the half-open trial succeeds
+    assert upstream.stats()["upstream.test"]["circuit"] == "closed"
+
+
+def test_client_errors_do_not_trip_the_breaker(clock):
+    session = ScriptedSession([Response(404)] * 3)
+    upstream = client(session, failure_threshold=2)
+    for _ in range(3):
+        with pytest.raises(requests.HTTPError):
+            upstream.get_json(URL)
+    assert upstream.stats()["upstream.test"]["circuit"] == "closed"
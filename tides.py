@@ -0,0 +1,454 @@
+"""Tide high/low detection.
+
+``find_extrema`` works on a whole matrix of predictions at once (one row
+per station, any sample interval, any number of days). It refines each
+turning point with a parabola through the sample and its two neighbours,
+so 6-minute or hourly data both give sub-interval times and heights.
+
+``HarmonicPredictor`` computes predictions locally from a station's
+harmonic constituents, so the dashboard does not need NOAA on the hot path.
+A station's predictor is only used once its highs and lows have been
+checked against a recorded NOAA hilo fixture with ``validate --hilo``.
+That run stores the passing report in the constituents file, and the
+file and the fixture are then committed together. The tests re-run the
+check for every committed station.
+
+    python tides.py import --station 9410840      # one-time constituent import
+    python tides.py record --station 9410840 --days 7 --out data/harcon/fixtures/9410840.json
+    python tides.py record --station 9410840 --days 7 --hilo --out data/harcon/fixtures/9410840_hilo.json
+    python tides.py validate --station 9410840 --hilo data/harcon/fixtures/9410840_hilo.json
+    python tides.py check --station 9410840 --days 3   # extrema vs NOAA hilo
+"""
+
+import argparse
+import datetime
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+HIGH, LOW = "High Tide", "Low Tide"
+HARCON_DIR = os.environ.get("HARCON_DIR", os.path.join("data", "harcon"))
+HARCON_URL = "https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations/{station}/harcon.json"
+DATUMS_URL = "https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations/{station}/datums.json"
+# how close local highs/lows must be to NOAA's before a station is validated
+HILO_MAX_TIME_ERROR_MIN = 15
+HILO_MAX_HEIGHT_ERROR_FT = 0.25
+
+
+# ---------------------------
+# Extrema engine
+# ---------------------------
+def find_extrema(heights, times, stations=None):
+    """Find every high and low tide in `heights`.
+
+    `heights` is (n_samples,) or (n_stations, n_samples). Rows may be
+    NaN-padded to a common length. `times` is the shared (n_samples,) grid
+    of datetime64 sample times. Returns a DataFrame with one row per
+    extremum: station, time, height and type.
+    """
+    h = np.atleast_2d(np.asarray(heights, dtype=np.float64))
+    t = np.asarray(times, dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+    if stations is None:
+        stations = np.arange(h.shape[0])
+    if h.shape[1] < 3:
+        return pd.DataFrame(columns=["station", "time", "height", "type"])
+
+    d = np.diff(h, axis=1)
+    sign = np.sign(d)  # NaN gaps stay NaN and never match a turn
+    moving = d != 0
+    cols = np.broadcast_to(np.arange(d.shape[1]), d.shape)
+    # index of the last non-flat step at or before each step, so a run of
+    # equal samples is looked across instead of counted as a turn
+    last = np.maximum.accumulate(np.where(moving, cols, -1), axis=1)
+    prev = np.concatenate([np.full((d.shape[0], 1), -1), last[:, :-1]], axis=1)
+    prev_sign = np.take_along_axis(sign, np.maximum(prev, 0), axis=1)
+    turn = moving & (prev >= 0) & (prev_sign * sign < 0)
+    row, k = np.nonzero(turn)
+    j = prev[row, k]
+    is_high = prev_sign[row, k] > 0
+
+    # a sharp turn is refined with a parabola through its three samples;
+    # a flat top or bottom is placed at the middle of its run
+    i = k
+    y0, y1, y2 = h[row, i - 1], h[row, i], h[row, i + 1]
+    curvature = y0 - 2 * y1 + y2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = np.where(curvature != 0, 0.5 * (y0 - y2) / curvature, 0.0)
+    offset = np.clip(offset, -0.5, 0.5)
+    flat = k - j > 1
+    peak = np.where(flat, y1, y1 - 0.25 * (y0 - y2) * offset)
+    step = np.where(offset >= 0, t[i + 1] - t[i], t[i] - t[i - 1])
+    peak_time = np.where(flat, (t[j + 1] + t[k]) / 2, t[i] + offset * step)
+
+    return pd.DataFrame({
+        "station": np.asarray(stations)[row],
+        "time": pd.to_datetime(peak_time.astype(np.int64)),
+        "height": peak,
+        "type": np.where(is_high, HIGH, LOW),
+    })
+
+
+def extrema_by_station(frames):
+    """Run find_extrema over {station: DataFrame(t, Tide (ft))} in one pass.
+
+    Frames are aligned on the union of their timestamps; gaps become NaN.
+    """
+    wide = pd.concat({s: f.set_index("t")["Tide (ft)"] for s, f in frames.items()}, axis=1).sort_index()
+    return find_extrema(wide.to_numpy().T, wide.index.to_numpy(), stations=list(wide.columns))
+
+
+# ---------------------------
+# Dashboard summary
+# ---------------------------
+def summarize_tides(tide_df, day=None):
+    """High/low tides formatted for the dashboard table.
+
+    Pass `day` to keep only that date's extrema. The input should then
+    extend a little past midnight on both sides so turning points near
+    the day boundary are still detected.
+    """
+    if tide_df.empty:
+        return pd.DataFrame()
+    extrema = find_extrema(tide_df["Tide (ft)"].to_numpy(), tide_df["t"].to_numpy())
+    if day is not None:
+        extrema = extrema[extrema["time"].dt.date == day]
+    return pd.DataFrame({
+        "Time": extrema["time"].dt.strftime("%I:%M %p"),
+        "Tide (ft)": extrema["height"].round(2),
+        "Type": extrema["type"],
+    }).reset_index(drop=True)
+
+
+def compare_with_hilo(extrema, hilo, tolerance=datetime.timedelta(hours=2)):
+    """Pair each NOAA high/low with the nearest computed extremum of the
+    same type. Returns one row per NOAA point with time (minutes) and
+    height (ft) errors."""
+    rows = []
+    for _, ref in hilo.iterrows():
+        same = extrema[extrema["type"] == ref["type"]]
+        if same.empty:
+            continue
+        gaps = (same["time"] - ref["time"]).abs()
+        best = gaps.idxmin()
+        if gaps[best] <= tolerance:
+            rows.append({
+                "noaa_time": ref["time"],
+                "type": ref["type"],
+                "time_error_min": (same.at[best, "time"] - ref["time"]).total_seconds() / 60,
+                "height_error_ft": same.at[best, "height"] - ref["height"],
+            })
+    return pd.DataFrame(rows)
+
+
+# ---------------------------
+# Harmonic prediction
+# ---------------------------
+# Doodson numbers for the 37 NOAA constituents, applied to
+# [tau, s, h, p, N, p', 90 deg] (the last column is the phase offset).
+DOODSON = {
+    "M2": (2, 0, 0, 0, 0, 0, 0), "S2": (2, 2, -2, 0, 0, 0, 0), "N2": (2, -1, 0, 1, 0, 0, 0),
+    "K1": (1, 1, 0, 0, 0, 0, -1), "M4": (4, 0, 0, 0, 0, 0, 0), "O1": (1, -1, 0, 0, 0, 0, 1),
+    "M6": (6, 0, 0, 0, 0, 0, 0), "MK3": (3, 1, 0, 0, 0, 0, -1), "S4": (4, 4, -4, 0, 0, 0, 0),
+    "MN4": (4, -1, 0, 1, 0, 0, 0), "NU2": (2, -1, 2, -1, 0, 0, 0), "S6": (6, 6, -6, 0, 0, 0, 0),
+    "MU2": (2, -2, 2, 0, 0, 0, 0), "2N2": (2, -2, 0, 2, 0, 0, 0), "OO1": (1, 3, 0, 0, 0, 0, -1),
+    "LAM2": (2, 1, -2, 1, 0, 0, 2), "S1": (1, 1, -1, 0, 0, 0, 0), "M1": (1, 0, 0, 1, 0, 0, 1),
+    "J1": (1, 2, 0, -1, 0, 0, -1), "MM": (0, 1, 0, -1, 0, 0, 0), "SSA": (0, 0, 2, 0, 0, 0, 0),
+    "SA": (0, 0, 1, 0, 0, 0, 0), "MSF": (0, 2, -2, 0, 0, 0, 0), "MF": (0, 2, 0, 0, 0, 0, 0),
+    "RHO": (1, -2, 2, -1, 0, 0, 1), "Q1": (1, -2, 0, 1, 0, 0, 1), "T2": (2, 2, -3, 0, 0, 1, 0),
+    "R2": (2, 2, -1, 0, 0, -1, 2), "2Q1": (1, -3, 0, 2, 0, 0, 1), "P1": (1, 1, -2, 0, 0, 0, 1),
+    "2SM2": (2, 4, -4, 0, 0, 0, 0), "M3": (3, 0, 0, 0, 0, 0, 2), "L2": (2, 1, 0, -1, 0, 0, 2),
+    "2MK3": (3, -1, 0, 0, 0, 0, 1), "K2": (2, 2, 0, 0, 0, 0, 0), "M8": (8, 0, 0, 0, 0, 0, 0),
+    "MS4": (4, 2, -2, 0, 0, 0, 0),
+}
+
+
+def astronomical_arguments(times_utc):
+    """Mean longitudes (degrees) at each UTC time: returns the (7, n) matrix
+    [tau, s, h, p, N, p', 90] and the lunar node N."""
+    ns = np.asarray(times_utc, dtype="datetime64[ns]").astype(np.int64)
+    jd = ns / 86400e9 + 2440587.5
+    T = (jd - 2451545.0) / 36525
+    ut_hours = ((jd - 0.5) % 1.0) * 24
+    s = 218.3164591 + 481267.88134236 * T
+    h = 280.46645 + 36000.76983 * T
+    p = 83.3532430 + 4069.0137111 * T
+    N = 125.0445550 - 1934.1361849 * T
+    pp = 282.93734 + 1.71946 * T
+    tau = 180.0 + 15.0 * ut_hours + h - s
+    return np.stack([tau, s, h, p, N, pp, np.full_like(T, 90.0)]), N
+
+
+def nodal_corrections(N):
+    """Node factor f and angle u (degrees) per constituent, from the
+    simplified Schureman formulas, as functions of the lunar node N."""
+    n = np.radians(N)
+    c1, c2, c3 = np.cos(n), np.cos(2 * n), np.cos(3 * n)
+    s1, s2, s3 = np.sin(n), np.sin(2 * n), np.sin(3 * n)
+    one, zero = np.ones_like(n), np.zeros_like(n)
+    m2 = (1.0004 - 0.0373 * c1 + 0.0002 * c2, -2.14 * s1)
+    k1 = (1.0060 + 0.1150 * c1 - 0.0088 * c2 + 0.0006 * c3, -8.86 * s1 + 0.68 * s2 - 0.07 * s3)
+    o1 = (1.0089 + 0.1871 * c1 - 0.0147 * c2 + 0.0014 * c3, 10.80 * s1 - 1.34 * s2 + 0.19 * s3)
+    k2 = (1.0241 + 0.2863 * c1 + 0.0083 * c2 - 0.0015 * c3, -17.74 * s1 + 0.68 * s2 - 0.04 * s3)
+    j1 = (1.1029 + 0.1676 * c1 - 0.0170 * c2 + 0.0016 * c3, -12.94 * s1 + 1.34 * s2 - 0.19 * s3)
+    oo1 = (1.1027 + 0.6504 * c1 + 0.0317 * c2 - 0.0014 * c3, -36.68 * s1 + 4.02 * s2 - 0.57 * s3)
+    mm = (1.0000 - 0.1300 * c1 + 0.0013 * c2, zero)
+    mf = (1.0429 + 0.4135 * c1 - 0.0040 * c2, -23.74 * s1 + 2.68 * s2 - 0.38 * s3)
+    solar = (one, zero)
+
+    def power(base, k):
+        return base[0] ** k, base[1] * k
+
+    table = {name: solar for name in ("S2", "S4", "S6", "S1", "P1", "T2", "R2", "SA", "SSA")}
+    table.update({name: m2 for name in ("M2", "N2", "2N2", "NU2", "MU2", "LAM2", "L2")})
+    table.update({name: o1 for name in ("O1", "Q1", "2Q1", "RHO", "M1")})
+    table.update({
+        "K1": k1, "K2": k2, "J1": j1, "OO1": oo1, "MM": mm, "MF": mf,
+        "M4": power(m2, 2), "MN4": power(m2, 2), "M6": power(m2, 3), "M8": power(m2, 4),
+        "M3": power(m2, 1.5), "MS4": m2,
+        # S2 - M2 combinations keep M2's factor with the angle reversed
+        "2SM2": (m2[0], -m2[1]), "MSF": (m2[0], -m2[1]),
+        "MK3": (m2[0] * k1[0], m2[1] + k1[1]),
+        "2MK3": (m2[0] ** 2 * k1[0], 2 * m2[1] - k1[1]),
+    })
+    return table
+
+
+class HarmonicPredictor:
+    """Tide heights for one station from its harmonic constituents.
+
+    h(t) = Z0 + sum(f * A * cos(V(t) + u - kappa)), with NOAA's Greenwich
+    phases (phase_GMT) as kappa and Z0 the height of MSL above the datum.
+    """
+
+    def __init__(self, station, z0, names, amplitudes, phases, validated=None):
+        known = [i for i, name in enumerate(names) if name in DOODSON]
+        self.station = station
+        self.z0 = z0
+        self.names = [names[i] for i in known]
+        self.amplitudes = np.asarray(amplitudes, dtype=np.float64)[known]
+        self.phases = np.asarray(phases, dtype=np.float64)[known]
+        self.doodson = np.array([DOODSON[name] for name in self.names], dtype=np.float64)
+        # the passing check_against_hilo report, when there is one
+        self.validated = validated
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        c = data["constituents"]
+        return cls(data["station"], data["z0"], [x["name"] for x in c],
+                   [x["amplitude"] for x in c], [x["phase_GMT"] for x in c], data.get("validated"))
+
+    def predict(self, times_utc):
+        astro, N = astronomical_arguments(times_utc)
+        V = self.doodson @ astro
+        nodal = nodal_corrections(N)
+        f = np.stack([nodal[name][0] for name in self.names])
+        u = np.stack([nodal[name][1] for name in self.names])
+        phase = np.radians(V + u - self.phases[:, None])
+        return self.z0 + np.einsum("c,ct->t", self.amplitudes, f * np.cos(phase))
+
+    def predict_frame(self, begin, end, interval_minutes=6, tz="America/Los_Angeles"):
+        """Same shape as conditions.get_tide_data: naive station-local `t`
+        and `Tide (ft)`, from `begin` to `end` inclusive (local time)."""
+        local = pd.date_range(begin, end, freq=f"{interval_minutes}min", tz=tz)
+        heights = self.predict(local.tz_convert("UTC").tz_localize(None).to_numpy())
+        return pd.DataFrame({"t": local.tz_localize(None), "Tide (ft)": np.round(heights, 3)})
+
+
+_predictors = {}
+_predictors_lock = threading.Lock()
+
+
+def load_predictor(station, directory=None):
+    """The station's predictor, loaded once per process; None when its
+    constituents have not been imported."""
+    directory = directory or HARCON_DIR
+    key = (directory, station)
+    with _predictors_lock:
+        if key not in _predictors:
+            path = os.path.join(directory, f"{station}.json")
+            _predictors[key] = HarmonicPredictor.from_file(path) if os.path.exists(path) else None
+        return _predictors[key]
+
+
+def import_constituents(station, client, directory=None):
+    """Fetch a station's harmonic constituents and datums from NOAA once
+    and store them as <directory>/<station>.json."""
+    directory = directory or HARCON_DIR
+    harcon = client.get_json(HARCON_URL.format(station=station), params={"units": "english"})
+    datums = client.get_json(DATUMS_URL.format(station=station), params={"units": "english"})
+    levels = {d["name"]: d["value"] for d in datums["datums"]}
+    record = {
+        "station": station,
+        "datum": "MLLW",
+        "units": "feet",
+        "z0": levels["MSL"] - levels["MLLW"],
+        "constituents": [
+            {"name": c["name"], "amplitude": c["amplitude"], "phase_GMT": c["phase_GMT"], "speed": c["speed"]}
+            for c in harcon["HarmonicConstituents"]
+        ],
+    }
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{station}.json")
+    with open(path, "w") as f:
+        json.dump(record, f, indent=1)
+    with _predictors_lock:
+        _predictors.pop((directory, station), None)
+    return path
+
+
+def load_recording(path, station, interval):
+    """The predictions in a fixture written by `python tides.py record`.
+    Raises ValueError unless it was recorded from NOAA for `station` at
+    `interval` ("6" or "hilo"), so a predictor can't be checked against
+    heights it generated itself."""
+    with open(path) as f:
+        data = json.load(f)
+    request = data.get("request") or {}
+    if request.get("station") != station or request.get("interval") != interval:
+        flag = " --hilo" if interval == "hilo" else ""
+        raise ValueError(f"{path} is not a NOAA {interval} recording for station {station}; "
+                         f"record one with `python tides.py record --station {station}{flag}`")
+    return pd.DataFrame(data["predictions"])
+
+
+def validate_against_fixture(predictor, fixture_path, tz="America/Los_Angeles"):
+    """Compare predictions with a recorded NOAA datagetter response
+    (MLLW, feet, lst_ldt). Returns RMS and max absolute error in feet."""
+    recorded = load_recording(fixture_path, predictor.station, "6")
+    local = pd.DatetimeIndex(pd.to_datetime(recorded["t"])).tz_localize(tz, ambiguous="NaT", nonexistent="NaT")
+    keep = ~local.isna()
+    predicted = predictor.predict(local[keep].tz_convert("UTC").tz_localize(None).to_numpy())
+    error = predicted - pd.to_numeric(recorded["v"])[keep].to_numpy()
+    return {
+        "samples": int(keep.sum()),
+        "rms_ft": float(np.sqrt(np.mean(error ** 2))),
+        "max_abs_ft": float(np.abs(error).max()),
+    }
+
+
+def check_against_hilo(predictor, hilo_fixture, tz="America/Los_Angeles"):
+    """Compare the predictor's highs and lows with a recorded NOAA hilo
+    response (MLLW, feet, lst_ldt). Passes when every NOAA point is matched
+    within HILO_MAX_TIME_ERROR_MIN minutes and HILO_MAX_HEIGHT_ERROR_FT."""
+    recorded = load_recording(hilo_fixture, predictor.station, "hilo")
+    hilo = pd.DataFrame({
+        "time": pd.to_datetime(recorded["t"]),
+        "height": pd.to_numeric(recorded["v"]),
+        "type": recorded["type"].map({"H": HIGH, "L": LOW}),
+    })
+    padding = datetime.timedelta(hours=3)
+    frame = predictor.predict_frame(hilo["time"].min() - padding, hilo["time"].max() + padding, tz=tz)
+    report = compare_with_hilo(find_extrema(frame["Tide (ft)"].to_numpy(), frame["t"].to_numpy()), hilo)
+    time_error = float(report["time_error_min"].abs().max()) if len(report) else None
+    height_error = float(report["height_error_ft"].abs().max()) if len(report) else None
+    return {
+        "fixture": hilo_fixture,
+        "points": len(hilo),
+        "matched": len(report),
+        "max_time_error_min": time_error,
+        "max_height_error_ft": height_error,
+        "passed": bool(len(hilo)) and len(report) == len(hilo)
+        and time_error <= HILO_MAX_TIME_ERROR_MIN and height_error <= HILO_MAX_HEIGHT_ERROR_FT,
+    }
+
+
+def mark_validated(station, report, directory=None):
+    """Store a passing check_against_hilo report in the station's constituents file."""
+    directory = directory or HARCON_DIR
+    path = os.path.join(directory, f"{station}.json")
+    with open(path) as f:
+        record = json.load(f)
+    record["validated"] = report
+    with open(path, "w") as f:
+        json.dump(record, f, indent=1)
+    with _predictors_lock:
+        _predictors.pop((directory, station), None)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tide extrema and harmonic prediction tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser("check", help="cross-check computed extrema against NOAA's hilo product")
+    check.add_argument("--station", default="9410840")
+    check.add_argument("--days", type=int, default=3)
+    check.add_argument("--interval", default="6", help="NOAA interval for the predictions: 6, h, ...")
+    imp = sub.add_parser("import", help="fetch a station's harmonic constituents into HARCON_DIR")
+    imp.add_argument("--station", action="append", required=True)
+    record = sub.add_parser("record", help="record NOAA 6-minute predictions as a validation fixture")
+    record.add_argument("--station", default="9410840")
+    record.add_argument("--days", type=int, default=7)
+    record.add_argument("--hilo", action="store_true", help="record NOAA's high/low product instead")
+    record.add_argument("--out", required=True)
+    validate = sub.add_parser("validate", help="compare local predictions with recorded NOAA fixtures")
+    validate.add_argument("--station", default="9410840")
+    validate.add_argument("--fixture", help="recorded 6-minute predictions: report RMS and max error")
+    validate.add_argument("--hilo", help="recorded hilo: check highs/lows and mark the station validated if they pass")
+    args = parser.parse_args()
+
+    from conditions import NOAA_URL, TIDE_TIMEZONE, fetch_tide_hilo, fetch_tide_series, upstream
+
+    if args.command == "import":
+        for station in args.station:
+            print(f"{station}: {import_constituents(station, upstream)}")
+        return
+
+    if args.command == "record":
+        begin = datetime.date.today()
+        params = {
+            "station": args.station, "product": "predictions", "datum": "MLLW", "time_zone": "lst_ldt",
+            "units": "english", "interval": "hilo" if args.hilo else "6", "format": "json",
+            "begin_date": begin.strftime("%Y%m%d"),
+            "end_date": (begin + datetime.timedelta(days=args.days)).strftime("%Y%m%d"),
+        }
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        response = upstream.get_json(NOAA_URL, params=params)
+        # the request goes in too: load_recording only accepts NOAA recordings of the station
+        recording = {"request": {"url": NOAA_URL, **params},
+                     "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                     **response}
+        with open(args.out, "w") as f:
+            json.dump(recording, f)
+        print(f"recorded {args.out}")
+        return
+
+    if args.command == "validate":
+        predictor = load_predictor(args.station)
+        if predictor is None:
+            raise SystemExit(f"no constituents for {args.station}; run `python tides.py import --station {args.station}`")
+        if not (args.fixture or args.hilo):
+            raise SystemExit("pass --fixture and/or --hilo")
+        if args.fixture:
+            report = validate_against_fixture(predictor, args.fixture, tz=TIDE_TIMEZONE)
+            print(f"{report['samples']} samples: rms {report['rms_ft']:.3f} ft, max |error| {report['max_abs_ft']:.3f} ft")
+        if args.hilo:
+            report = check_against_hilo(predictor, args.hilo, tz=TIDE_TIMEZONE)
+            print(f"{report['matched']}/{report['points']} NOAA extrema matched; "
+                  f"max |time error| {report['max_time_error_min']} min, "
+                  f"max |height error| {report['max_height_error_ft']} ft")
+            if not report["passed"]:
+                raise SystemExit(f"{args.station} not validated: highs/lows are outside "
+                                 f"{HILO_MAX_TIME_ERROR_MIN} min / {HILO_MAX_HEIGHT_ERROR_FT} ft of NOAA's")
+            print(f"validated; commit {mark_validated(args.station, report)} together with {args.hilo}")
+        return
+
+    begin = datetime.date.today()
+    end = begin + datetime.timedelta(days=args.days)
+    series = fetch_tide_series(args.station, begin, end, interval=args.interval)
+    hilo = fetch_tide_hilo(args.station, begin, end)
+    report = compare_with_hilo(find_extrema(series["Tide (ft)"].to_numpy(), series["t"].to_numpy()), hilo)
+    print(report.to_string(index=False))
+    print(
+        f"\n{len(report)}/{len(hilo)} NOAA extrema matched; "
+        f"max |time error| {report['time_error_min'].abs().max():.1f} min, "
+        f"max |height error| {report['height_error_ft'].abs().max():.3f} ft"
+    )
+
+
+if __name__ == "__main__":
+    main()
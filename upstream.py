@@ -0,0 +1,211 @@
+"""Shared HTTP client for the dashboard's upstream data APIs.
+
+One pooled keep-alive ``requests.Session`` is used for every call, with
+connect/read timeouts and exponential-backoff retries. Each host has its own
+circuit breaker. While a host's breaker is open, calls fail fast and get
+the last good response for the same request when there is one. Those
+responses are kept for the LAST_GOOD_SIZE most recent requests, for up to
+LAST_GOOD_TTL seconds.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+LAST_GOOD_SIZE = 512
+LAST_GOOD_TTL = 6 * 60 * 60
+
+
+class CircuitOpenError(requests.RequestException):
+    pass
+
+
+class RetryableStatus(requests.HTTPError):
+    pass
+
+
+# ---------------------------
+# Circuit breaker
+# ---------------------------
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures. After
+    `reset_timeout` seconds one trial call is let through (half-open); its
+    outcome closes or re-opens the breaker."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+# ---------------------------
+# Per-host counters
+# ---------------------------
+class HostStats:
+    def __init__(self, window=512):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.short_circuits = 0
+        self.fallbacks = 0
+        self.latencies = deque(maxlen=window)
+
+    def snapshot(self, breaker):
+        latencies = sorted(self.latencies)
+
+        def pct(q):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 1) if latencies else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "short_circuits": self.short_circuits,
+            "fallbacks": self.fallbacks,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "circuit": breaker.state,
+        }
+
+
+# ---------------------------
+# Client
+# ---------------------------
+class UpstreamClient:
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, retries=2, backoff=0.5,
+                 failure_threshold=5, reset_timeout=30.0, pool_maxsize=20,
+                 last_good_size=LAST_GOOD_SIZE, last_good_ttl=LAST_GOOD_TTL):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._breakers = {}
+        self._stats = {}
+        self.last_good_size = last_good_size
+        self.last_good_ttl = last_good_ttl
+        self._last_good = OrderedDict()  # key -> (stored at, payload), least recently used first
+        self._lock = threading.Lock()
+
+    def _host(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._stats[host] = HostStats()
+            return self._breakers[host], self._stats[host]
+
+    def get_json(self, url, params=None):
+        """GET `url` and decode JSON.
+
+        Timeouts, connection errors and 429/5xx responses are retried; they
+        count against the host's breaker once retries are exhausted. Other
+        4xx responses raise immediately and do not trip the breaker. When a
+        call fails, the last good payload for the same url/params is
+        returned if one exists.
+        """
+        host = urlsplit(url).netloc
+        breaker, stats = self._host(host)
+        key = (url, tuple(sorted((params or {}).items())))
+
+        if not breaker.allow():
+            stats.short_circuits += 1
+            return self._fallback(key, stats, CircuitOpenError(f"circuit open for {host}"))
+
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                stats.retries += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random() / 2))
+            stats.requests += 1
+            start = time.perf_counter()
+            try:
+                res = self.session.get(url, params=params, timeout=self.timeout)
+                if res.status_code in RETRY_STATUSES:
+                    raise RetryableStatus(f"{res.status_code} from {host}", response=res)
+                res.raise_for_status()
+                data = res.json()
+            except (requests.ConnectionError, requests.Timeout, RetryableStatus) as e:
+                error = e
+                continue
+            except requests.RequestException:
+                stats.errors += 1
+                breaker.record_success()  # the host answered; the request was bad
+                raise
+            finally:
+                stats.latencies.append(time.perf_counter() - start)
+            breaker.record_success()
+            self._remember(key, data)
+            return data
+
+        stats.errors += 1
+        breaker.record_failure()
+        return self._fallback(key, stats, error)
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._last_good[key] = (time.monotonic(), data)
+            self._last_good.move_to_end(key)
+            while len(self._last_good) > self.last_good_size:
+                self._last_good.popitem(last=False)
+
+    def _fallback(self, key, stats, error):
+        with self._lock:
+            entry = self._last_good.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.last_good_ttl:
+                del self._last_good[key]
+                entry = None
+            if entry is not None:
+                self._last_good.move_to_end(key)
+        if entry is None:
+            raise error
+        stats.fallbacks += 1
+        return entry[1]
+
+    def stats(self):
+        with self._lock:
+            hosts = list(self._stats)
+        return {host: self._stats[host].snapshot(self._breakers[host]) for host in hosts}